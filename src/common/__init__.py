@@ -0,0 +1 @@
+"""Código compartilhado entre os projetos de transferência via UDP."""
@@ -0,0 +1,22 @@
+"""Buffers de tamanho fixo reaproveitados entre pacotes, para não alocar a cada envio."""
+
+class BufferPool:
+    """Conjunto de bytearrays reutilizáveis; cresce sob demanda"""
+
+    def __init__(self, size, count=0):
+        self.size = size
+        self._free = [bytearray(size) for _ in range(count)]
+
+    def acquire(self):
+        """Retorna um buffer livre (novo, se não houver nenhum)"""
+        return self._free.pop() if self._free else bytearray(self.size)
+
+    def release(self, buffer):
+        """Devolve o buffer (ou uma memoryview dele) ao conjunto
+
+        Objetos que não vieram do conjunto, como bytes, são ignorados.
+        """
+        if isinstance(buffer, memoryview):
+            buffer = buffer.obj
+        if isinstance(buffer, bytearray) and len(buffer) == self.size:
+            self._free.append(buffer)
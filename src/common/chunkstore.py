@@ -0,0 +1,120 @@
+"""Armazenamento de fragmentos endereçado pelo conteúdo, para deduplicar envios.
+
+Cada fragmento é gravado uma única vez, num arquivo cujo nome é o hash do conteúdo
+(digest), não importa quantas transferências o contenham. As transferências em
+andamento seguram referências aos seus fragmentos (retain/release); os demais ficam
+guardados enquanto couberem no orçamento e, acima dele, saem os usados há mais tempo.
+Só os fragmentos sem referência ficam na fila LRU, então cada descarte sai da ponta
+dela, sem percorrer os demais. Ao reiniciar, a ordem de uso é reconstruída pela data
+de modificação dos arquivos.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+DIGEST_SIZE = 16  # Bytes do hash de cada fragmento
+BUDGET = 256 * 1024 * 1024  # Bytes de fragmentos guardados antes de descartar os mais antigos
+
+def digest(data):
+    """Hash que identifica o conteúdo de um fragmento"""
+    return hashlib.blake2b(data, digest_size=DIGEST_SIZE).digest()
+
+class ChunkStore:
+    """Fragmentos indexados pelo hash (em hexadecimal), com referências e descarte LRU"""
+
+    def __init__(self, path, budget=BUDGET):
+        self.path = path
+        self.budget = budget
+        self.size = 0
+        self._chunks = OrderedDict()  # hash -> tamanho dos sem referência, do uso mais antigo ao mais recente
+        self._pinned = {}  # hash -> tamanho dos fragmentos com referência, fora da fila LRU
+        self._refs = {}  # hash -> quantas vezes aparece em transferências em andamento
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        found = []
+        for directory in os.listdir(path):
+            for name in os.listdir(os.path.join(path, directory)):
+                file_path = os.path.join(path, directory, name)
+                if name.endswith('.tmp'):
+                    os.remove(file_path)  # Gravação interrompida
+                    continue
+                info = os.stat(file_path)
+                found.append((info.st_mtime, name, info.st_size))
+        for _, key, size in sorted(found):
+            self._chunks[key] = size
+            self.size += size
+
+    def _file(self, key):
+        return os.path.join(self.path, key[:2], key)
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._chunks or key in self._pinned
+
+    def __len__(self):
+        return len(self._chunks) + len(self._pinned)
+
+    def _touch(self, key):
+        """Marca o fragmento como o usado mais recentemente; False se ele não está guardado"""
+        if key in self._chunks:
+            self._chunks.move_to_end(key)
+            return True
+        return key in self._pinned
+
+    def put(self, key, data):
+        """Guarda o fragmento; False se o conteúdo não corresponder ao hash"""
+        if digest(data).hex() != key:
+            return False
+        with self._lock:
+            if self._touch(key):
+                return True
+        file_path = self._file(key)
+        os.makedirs(os.path.dirname(file_path), exist_ok=True)
+        partial = f"{file_path}.{threading.get_ident()}.tmp"
+        with open(partial, 'wb') as f:
+            f.write(data)
+        os.replace(partial, file_path)  # Quem lê nunca vê o fragmento pela metade
+        with self._lock:
+            if not self._touch(key):
+                (self._pinned if key in self._refs else self._chunks)[key] = len(data)
+                self.size += len(data)
+            self._evict()
+        return True
+
+    def read_into(self, key, buffer):
+        """Copia o fragmento para buffer e retorna quantos bytes foram lidos"""
+        with self._lock:
+            self._touch(key)
+        with open(self._file(key), 'rb', buffering=0) as f:
+            return f.readinto(buffer)
+
+    def retain(self, keys):
+        """Impede o descarte dos fragmentos enquanto uma transferência os usa"""
+        with self._lock:
+            for key in keys:
+                self._refs[key] = self._refs.get(key, 0) + 1
+                if key in self._chunks:
+                    self._pinned[key] = self._chunks.pop(key)
+
+    def release(self, keys):
+        with self._lock:
+            for key in keys:
+                count = self._refs.get(key, 0) - 1
+                if count > 0:
+                    self._refs[key] = count
+                    continue
+                self._refs.pop(key, None)
+                if key in self._pinned:
+                    self._chunks[key] = self._pinned.pop(key)  # Volta à fila como o mais recente
+            self._evict()
+
+    def _evict(self):
+        """Descarta os fragmentos sem referência usados há mais tempo até caber no orçamento"""
+        while self.size > self.budget and self._chunks:
+            key, size = self._chunks.popitem(last=False)
+            try:
+                os.remove(self._file(key))
+            except FileNotFoundError:
+                pass
+            self.size -= size
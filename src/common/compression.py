@@ -0,0 +1,154 @@
+"""Compressão negociada por transferência, em fluxo e numa thread separada.
+
+O remetente mede a entropia de alguns blocos espalhados pelo arquivo e só comprime se
+ela indicar que vale a pena (texto sim; mp3, mp4 e png já vêm comprimidos). Só o início
+não basta: o cabeçalho de um mp4, por exemplo, é bem repetitivo. O codec escolhido segue junto
+do nome do arquivo: nome, NUL e um JSON com as opções (with_options/split_options),
+incluindo os codecs que quem envia sabe descomprimir, para que a resposta use um deles.
+
+A compressão roda numa thread que lê os fragmentos e entrega mensagens de até `size`
+bytes por uma fila limitada, de modo que comprimir e enviar acontecem ao mesmo tempo
+(zlib e lzma liberam o GIL enquanto trabalham).
+"""
+import json
+import math
+import queue
+import threading
+import zlib
+from collections import Counter
+
+try:
+    import lzma
+except ImportError:  # Nem toda instalação do Python traz o lzma
+    lzma = None
+
+NONE = 'none'
+PREFERENCE = ('zlib', 'lzma')  # Ordem de escolha entre os codecs comuns aos dois lados
+SAMPLE_BLOCKS = 4  # Blocos lidos, em posições espalhadas, para medir a entropia
+SAMPLE_SIZE = 4096  # Bytes por bloco da amostra
+MAX_ENTROPY = 7.5  # Bits por byte; acima disso os dados quase não comprimem
+QUEUE_DEPTH = 64  # Mensagens comprimidas prontas à espera do envio
+BLOCK_SIZE = 64 * 1024  # Bytes lidos do arquivo por vez para comprimir
+ZLIB_LEVEL = 1  # Rápido: comprimir não pode ficar mais lento que enviar
+# Exceções de decompress()/flush() com dados corrompidos ou que não são do codec
+DECOMPRESS_ERRORS = (zlib.error,) + ((lzma.LZMAError,) if lzma is not None else ())
+
+def available():
+    """Codecs que esta instalação sabe comprimir e descomprimir"""
+    return [codec for codec in PREFERENCE if codec != 'lzma' or lzma is not None]
+
+def entropy(data):
+    """Entropia de Shannon dos bytes de data, em bits por byte"""
+    if not data:
+        return 0.0
+    total = len(data)
+    return -sum(count / total * math.log2(count / total) for count in Counter(bytes(data)).values())
+
+def sample(f, size):
+    """Blocos de SAMPLE_SIZE bytes em posições espalhadas pelo arquivo aberto f"""
+    blocks = []
+    for i in range(SAMPLE_BLOCKS):
+        f.seek(i * size // SAMPLE_BLOCKS)
+        blocks.append(f.read(SAMPLE_SIZE))
+    f.seek(0)
+    return [block for block in blocks if block]
+
+def choose(blocks, accepted=None):
+    """Codec para dados amostrados em blocks, entre os aceitos pelo outro lado
+
+    Comprime se a entropia mediana dos blocos ficar abaixo de MAX_ENTROPY.
+    """
+    entropies = sorted(entropy(block) for block in blocks)
+    if not entropies or entropies[len(entropies) // 2] > MAX_ENTROPY:
+        return NONE
+    accepted = available() if accepted is None else accepted
+    return next((codec for codec in available() if codec in accepted), NONE)
+
+def with_options(name, **options):
+    return name.encode('utf-8') + b'\x00' + json.dumps(options).encode('utf-8')
+
+def split_options(message):
+    """Separa nome e opções; mensagens sem opções (clientes antigos) dão {}"""
+    message = bytes(message)
+    name, _, options = message.partition(b'\x00')
+    return name.decode('utf-8'), json.loads(options) if options else {}
+
+def _compressor(codec):
+    if codec == 'zlib':
+        return zlib.compressobj(ZLIB_LEVEL)
+    return lzma.LZMACompressor()
+
+def decompressor(codec):
+    """Objeto com decompress(dados) e flush(), para o codec negociado"""
+    if codec == NONE:
+        return _Identity()
+    if codec == 'zlib':
+        return zlib.decompressobj()
+    return _LzmaDecompressor()
+
+class _Identity:
+    def decompress(self, data):
+        return data
+
+    def flush(self):
+        return b''
+
+class _LzmaDecompressor:
+    """LZMADecompressor com a mesma interface do zlib (flush no fim)"""
+
+    def __init__(self):
+        self._decompressor = lzma.LZMADecompressor()
+
+    def decompress(self, data):
+        return self._decompressor.decompress(data)
+
+    def flush(self):
+        return b''
+
+def compress_chunks(chunks, codec, size):
+    """Gera os fragmentos comprimidos com codec, em mensagens de até size bytes
+
+    Os fragmentos de entrada são lidos e comprimidos por uma thread à frente de quem
+    consome; com NONE eles passam direto.
+    """
+    if codec == NONE:
+        yield from chunks
+        return
+    ready = queue.Queue(QUEUE_DEPTH)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                ready.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                continue
+
+    def work():
+        try:
+            compressor = _compressor(codec)
+            pending = bytearray()
+            for chunk in chunks:
+                pending += compressor.compress(chunk)
+                while len(pending) >= size:
+                    put(bytes(pending[:size]))
+                    del pending[:size]
+            pending += compressor.flush()
+            for start in range(0, len(pending), size):
+                put(bytes(pending[start:start + size]))
+            put(None)
+        except Exception as e:
+            put(e)
+
+    threading.Thread(target=work, name='compressor', daemon=True).start()
+    try:
+        while True:
+            item = ready.get()
+            if item is None:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+    finally:
+        stop.set()  # Libera a thread se o envio for interrompido
@@ -0,0 +1,48 @@
+"""Controle de congestionamento AIMD para o envio com janela de common.rdt.
+
+Como no TCP Reno (RFC 5681): a janela de congestionamento (cwnd, em pacotes) começa
+em INITIAL_WINDOW e cresce um pacote por ACK em slow start, até ssthresh; depois, um
+pacote por janela confirmada (congestion avoidance). Três ACKs duplicados indicam uma
+perda isolada: retransmissão rápida e janela pela metade. Um timeout indica que o
+caminho esvaziou: ssthresh vai para a metade do que estava em trânsito e cwnd volta a 1.
+
+O remetente nunca passa de min(cwnd, janela anunciada pelo receptor, janela configurada).
+"""
+
+INITIAL_WINDOW = 4  # Pacotes em trânsito no início de cada transferência
+MIN_SSTHRESH = 2
+DUP_ACKS = 3  # ACKs duplicados que disparam a retransmissão rápida
+
+class CongestionWindow:
+    """cwnd e ssthresh de uma transferência, limitados à janela configurada"""
+
+    def __init__(self, limit, initial=INITIAL_WINDOW):
+        self.limit = limit
+        self.cwnd = float(min(limit, initial))
+        self.ssthresh = float(limit)
+
+    @property
+    def window(self):
+        """Pacotes que podem estar em trânsito (pelo menos 1)"""
+        return max(1, int(self.cwnd))
+
+    def acked(self, count=1):
+        """count pacotes novos confirmados: slow start ou congestion avoidance"""
+        for _ in range(count):
+            if self.cwnd < self.ssthresh:
+                self.cwnd += 1
+            else:
+                self.cwnd += 1 / self.cwnd
+        self.cwnd = min(self.cwnd, self.limit)
+
+    def lost(self, in_flight):
+        """Perda detectada por ACKs duplicados: reduz à metade"""
+        self.ssthresh = max(in_flight / 2, MIN_SSTHRESH)
+        self.cwnd = self.ssthresh
+
+    def timeout(self, in_flight):
+        self.ssthresh = max(in_flight / 2, MIN_SSTHRESH)
+        self.cwnd = 1.0
+
+    def __repr__(self):
+        return f"CongestionWindow(cwnd={self.cwnd:.1f}, ssthresh={self.ssthresh:.1f})"
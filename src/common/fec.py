@@ -0,0 +1,118 @@
+"""Correção de perdas sem retransmissão (FEC) por paridade XOR.
+
+O remetente agrupa os pacotes de dados em blocos de `block` números de sequência
+consecutivos (a partir de 0) e, ao completar cada bloco, envia `groups` pacotes de
+paridade (FLAG_PARITY, com o número de sequência do início do bloco): o i-ésimo pacote
+do bloco entra no grupo i % groups, e a paridade do grupo é o XOR dos dados dos seus
+pacotes. Perdido um único pacote de um grupo, o receptor o reconstrói com a paridade e
+os demais, sem esperar o timeout; com mais perdas no grupo, ou sem a paridade, o ARQ de
+common.rdt retransmite como sempre. Com mais grupos, rajadas de até `groups` perdas
+seguidas são recuperáveis, ao custo de groups/block pacotes a mais.
+
+Cada paridade começa com PARITY (tamanho do bloco, pacotes no bloco, grupos, grupo e XOR
+dos tamanhos dos dados), então quem usa FEC envia mensagens com até OVERHEAD bytes a
+menos que o maior pacote aceito pelo outro lado. Os dados viram inteiros (little-endian)
+para o XOR: dados mais curtos equivalem a dados completados com zeros.
+"""
+import struct
+
+PARITY = struct.Struct('!BBBBH')  # Tamanho do bloco, pacotes no bloco, grupos, grupo, XOR dos tamanhos
+OVERHEAD = PARITY.size
+MAX_BLOCK = 64  # Maior bloco aceito; limita o que o receptor guarda para reconstruir
+
+def validate(block, groups):
+    """Confere os parâmetros de FEC vindos de configuração ou do outro lado"""
+    if not (isinstance(block, int) and isinstance(groups, int) and 1 <= groups <= block <= MAX_BLOCK):
+        raise ValueError(f"FEC inválido: bloco {block}, {groups} grupos (até {MAX_BLOCK} pacotes por bloco)")
+    return block, groups
+
+class Encoder:
+    """Lado do remetente: acumula os pacotes do bloco atual e gera as paridades"""
+
+    def __init__(self, block, groups=1):
+        self.block, self.groups = validate(block, groups)
+        self._start = 0
+        self._reset()
+
+    def _reset(self):
+        self._count = 0
+        self._values = [0] * self.groups
+        self._lengths = [0] * self.groups
+        self._sizes = [0] * self.groups  # Maior pacote de cada grupo
+
+    def add(self, data):
+        """Inclui o próximo pacote; retorna as paridades se ele completou o bloco"""
+        group = self._count % self.groups
+        self._values[group] ^= int.from_bytes(data, 'little')
+        self._lengths[group] ^= len(data)
+        self._sizes[group] = max(self._sizes[group], len(data))
+        self._count += 1
+        return self.flush() if self._count == self.block else None
+
+    def flush(self):
+        """(seq do início do bloco, [paridade de cada grupo]) do bloco atual, mesmo incompleto"""
+        if not self._count:
+            return None
+        parities = [PARITY.pack(self.block, self._count, self.groups, group, self._lengths[group])
+                    + self._values[group].to_bytes(self._sizes[group], 'little')
+                    for group in range(min(self.groups, self._count))]
+        start = self._start
+        self._start += self._count
+        self._reset()
+        return start, parities
+
+class Decoder:
+    """Lado do receptor: guarda os pacotes recentes e as paridades ainda úteis"""
+
+    def __init__(self):
+        self.block = self.groups = None  # Conhecidos na primeira paridade
+        self._values = {}  # seq -> (dados como inteiro, tamanho)
+        self._parities = {}  # (início, grupo) -> (pacotes no bloco, grupos, XOR, XOR dos tamanhos)
+
+    def add(self, seq_num, data):
+        self._values[seq_num] = (int.from_bytes(data, 'little'), len(data))
+
+    def add_parity(self, start, payload):
+        """Guarda a paridade e retorna a sua chave (início, grupo)"""
+        block, count, groups, group, lengths = PARITY.unpack_from(payload)
+        self.block, self.groups = block, groups
+        key = (start, group)
+        self._parities[key] = (count, groups, int.from_bytes(payload[OVERHEAD:], 'little'), lengths)
+        return key
+
+    def key_of(self, seq_num):
+        """Chave da paridade que cobre seq_num, ou None antes de conhecer os blocos"""
+        if self.block is None:
+            return None
+        start = seq_num - seq_num % self.block
+        return start, (seq_num - start) % self.groups
+
+    def recover(self, key, limit):
+        """(seq, dados) do único pacote que falta no grupo, se ele estiver antes de limit"""
+        entry = self._parities.get(key)
+        if entry is None:
+            return None
+        start, group = key
+        count, groups, value, length = entry
+        missing = None
+        for seq_num in range(start + group, start + count, groups):
+            item = self._values.get(seq_num)
+            if item is None:
+                if missing is not None:
+                    return None  # Duas perdas no grupo: fica para o ARQ, ou para uma retransmissão
+                missing = seq_num
+            else:
+                value ^= item[0]
+                length ^= item[1]
+        if missing is not None and missing >= limit:
+            return None
+        del self._parities[key]
+        if missing is None:
+            return None  # Nada perdido
+        self._values[missing] = (value, length)
+        return missing, value.to_bytes(length, 'little')
+
+    def prune(self, expected):
+        """Esquece o que não pode mais ajudar depois que tudo antes de expected foi entregue"""
+        self._values = {seq: item for seq, item in self._values.items() if seq >= expected - MAX_BLOCK}
+        self._parities = {key: entry for key, entry in self._parities.items() if key[0] + entry[0] > expected}
@@ -0,0 +1,153 @@
+"""Log com níveis por componente e escrita em segundo plano.
+
+Cada módulo pega o seu logger com get_logger('rdt'), e cada componente tem o seu nível
+(por padrão INFO, então os eventos de pacote, em DEBUG, ficam desligados). Um registro
+abaixo do nível custa só uma comparação: a mensagem é formatada com % pela thread de
+escrita, não por quem chama. Os registros vão para um buffer circular limitado; se ele
+encher, os mais antigos são descartados e a perda é informada na saída. Cada linha
+sai com o nível e o componente, por exemplo "INFO server: ...".
+
+O nível pode ser configurado pela variável de ambiente LOG_LEVEL, por exemplo
+LOG_LEVEL=info,rdt=debug, ou por set_level().
+"""
+import atexit
+import os
+import sys
+import threading
+import time
+from collections import deque
+
+DEBUG = 10
+INFO = 20
+WARNING = 30
+ERROR = 40
+LEVELS = {'debug': DEBUG, 'info': INFO, 'warning': WARNING, 'error': ERROR}
+LEVEL_NAMES = {level: name.upper() for name, level in LEVELS.items()}
+
+RING_SIZE = 8192  # Registros pendentes antes de descartar
+FLUSH_INTERVAL = 0.05  # Segundos entre escritas
+
+_default_level = INFO
+_component_levels = {}  # componente -> nível configurado
+_loggers = {}
+_ring = deque(maxlen=RING_SIZE)
+_dropped = 0
+_lock = threading.Lock()
+_flush_lock = threading.Lock()  # Uma escrita por vez: a thread, flush() ou o atexit
+_writer = None
+
+class Logger:
+    """Logger de um componente; o nível efetivo fica em self.level"""
+
+    def __init__(self, component):
+        self.component = component
+        self.level = _component_levels.get(component, _default_level)
+
+    def debug(self, message, *args):
+        if self.level <= DEBUG:
+            _emit(DEBUG, self.component, message, args)
+
+    def info(self, message, *args):
+        if self.level <= INFO:
+            _emit(INFO, self.component, message, args)
+
+    def warning(self, message, *args):
+        if self.level <= WARNING:
+            _emit(WARNING, self.component, message, args)
+
+    def error(self, message, *args):
+        if self.level <= ERROR:
+            _emit(ERROR, self.component, message, args)
+
+def get_logger(component):
+    """Retorna o logger do componente, criando-o na primeira vez"""
+    with _lock:
+        logger = _loggers.get(component)
+        if logger is None:
+            logger = _loggers[component] = Logger(component)
+        return logger
+
+def set_level(level, component=None):
+    """Muda o nível de um componente, ou o padrão de todos se component for None"""
+    global _default_level
+    if isinstance(level, str):
+        level = LEVELS[level.lower()]
+    with _lock:
+        if component is None:
+            _default_level = level
+            _component_levels.clear()
+        else:
+            _component_levels[component] = level
+        for name, logger in _loggers.items():
+            logger.level = _component_levels.get(name, _default_level)
+
+def configure(spec):
+    """Aplica uma configuração no formato 'info,rdt=debug,dispatcher=warning'"""
+    for item in filter(None, (part.strip() for part in spec.split(','))):
+        if '=' in item:
+            component, level = item.split('=', 1)
+            set_level(level, component.strip())
+        else:
+            set_level(item)
+
+def flush():
+    """Escreve agora tudo o que está pendente"""
+    global _dropped
+    with _flush_lock:
+        lines = []
+        while _ring:
+            level, component, message, args = _ring.popleft()
+            try:
+                text = message % args if args else message
+            except (TypeError, ValueError) as e:
+                text = f"Mensagem mal formatada {message!r}: {e}"
+            lines.append(f"{LEVEL_NAMES[level]} {component}: {text}")
+        if _dropped:
+            lines.append(f"WARNING log: {_dropped} mensagens descartadas (buffer cheio).")
+            _dropped = 0
+        if lines:
+            out = sys.stdout
+            out.write('\n'.join(lines) + '\n')
+            out.flush()
+
+def _emit(level, component, message, args):
+    global _dropped
+    if len(_ring) == RING_SIZE:
+        _dropped += 1  # O append abaixo descarta o registro mais antigo
+    _ring.append((level, component, message, args))
+    if _writer is None:
+        _start_writer()
+
+def _start_writer():
+    global _writer
+    with _lock:
+        if _writer is None:
+            _writer = threading.Thread(target=_write_forever, name='log-writer', daemon=True)
+            _writer.start()
+
+def _write_forever():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except Exception as e:
+            # Uma escrita que falhou (saída fechada, por exemplo) não pode parar a thread
+            try:
+                sys.stderr.write(f"ERROR log: falha escrevendo o log: {e}\n")
+            except Exception:
+                pass
+
+def _after_fork():
+    """No processo filho a thread de escrita não existe: ela é recriada no próximo registro
+
+    Os registros herdados ainda pendentes são do processo pai, que os escreve.
+    """
+    global _writer, _lock, _flush_lock
+    _lock = threading.Lock()
+    _flush_lock = threading.Lock()
+    _writer = None
+    _ring.clear()
+
+atexit.register(flush)
+os.register_at_fork(after_in_child=_after_fork)
+configure(os.environ.get('LOG_LEVEL', ''))
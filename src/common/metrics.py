@@ -0,0 +1,169 @@
+"""Métricas do protocolo por par: contadores, histograma de RTT e tamanho das filas.
+
+Cada par (endereço) tem um PeerMetrics, obtido com for_peer(addr) como os estimadores
+de common.rtt. As atualizações são somas em atributos, feitas pela thread que atende
+o par, sem trava; só a criação de pares e as leituras usam a trava da tabela. Acima de
+MAX_PEERS, os pares há mais tempo sem uso são esquecidos.
+
+As leituras saem em JSON por snapshot(), por uma porta UDP local (serve(): qualquer
+datagrama recebido é respondido com o snapshot) ou num arquivo reescrito
+periodicamente (dump_every()).
+"""
+import bisect
+import json
+import os
+import socket
+import threading
+import time
+from collections import OrderedDict
+
+MAX_PEERS = 4096  # Pares guardados antes de esquecer os mais antigos
+MAX_DATAGRAM = 65000  # Tamanho máximo da resposta da porta de estatísticas
+RTT_BUCKETS = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1.0, 2.0)  # Segundos
+DUMP_INTERVAL = 10.0
+
+COUNTERS = ('packets_out', 'bytes_out', 'retransmissions', 'timeouts', 'acks_in',
+            'packets_in', 'bytes_in', 'duplicates', 'out_of_order', 'corrupted', 'acks_out',
+            'queue_drops', 'coalesced', 'parity_out', 'parity_in', 'recovered', 'fast_retransmits')
+
+class Histogram:
+    """Contagens por faixa (limites superiores em bounds) com soma e total"""
+
+    def __init__(self, bounds=RTT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # A última faixa é acima do maior limite
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, fraction):
+        """Limite superior da faixa que contém o percentil (None se vazio ou acima do último)"""
+        if not self.count:
+            return None
+        target = fraction * self.count
+        seen = 0
+        for bound, count in zip(self.bounds, self.counts):
+            seen += count
+            if seen >= target:
+                return bound
+        return None
+
+    def snapshot(self):
+        labels = [f"{bound:g}" for bound in self.bounds] + ['+inf']
+        return {
+            'count': self.count,
+            'mean': self.sum / self.count if self.count else None,
+            'p50': self.percentile(0.50),
+            'p99': self.percentile(0.99),
+            'buckets': dict(zip(labels, self.counts)),
+        }
+
+class PeerMetrics:
+    """Contadores de um par; gauges são funções lidas no momento do snapshot"""
+
+    __slots__ = COUNTERS + ('rtt', 'gauges', 'last_used')
+
+    def __init__(self):
+        for name in COUNTERS:
+            setattr(self, name, 0)
+        self.rtt = Histogram()
+        self.gauges = {}  # nome -> função sem argumentos, por exemplo o tamanho de uma fila
+        self.last_used = time.time()
+
+    def snapshot(self):
+        result = {name: getattr(self, name) for name in COUNTERS}
+        result['rtt'] = self.rtt.snapshot()
+        for name, gauge in list(self.gauges.items()):
+            result[name] = gauge()
+        result['last_used'] = round(self.last_used, 3)
+        return result
+
+_peers = OrderedDict()  # "host:porta" -> PeerMetrics, do uso mais antigo ao mais recente
+_peers_lock = threading.Lock()
+_started = time.time()
+
+def label(addr):
+    return f"{addr[0]}:{addr[1]}"
+
+def for_peer(addr):
+    """Retorna as métricas do par, criando-as na primeira vez"""
+    key = label(addr)
+    with _peers_lock:
+        metrics = _peers.get(key)
+        if metrics is None:
+            metrics = _peers[key] = PeerMetrics()
+            while len(_peers) > MAX_PEERS:
+                _peers.popitem(last=False)
+        else:
+            _peers.move_to_end(key)
+        metrics.last_used = time.time()
+        return metrics
+
+def reset():
+    with _peers_lock:
+        _peers.clear()
+
+def snapshot(limit=None):
+    """Estado atual em estruturas JSON; com limit, só os pares com mais retransmissões"""
+    with _peers_lock:
+        peers = list(_peers.items())
+    peers = [(key, metrics.snapshot()) for key, metrics in peers]
+    totals = {name: sum(peer[name] for _, peer in peers) for name in COUNTERS}
+    peer_count = len(peers)
+    if limit is not None and len(peers) > limit:
+        peers.sort(key=lambda item: (item[1]['retransmissions'] + item[1]['timeouts']), reverse=True)
+        peers = peers[:limit]
+    return {
+        'timestamp': round(time.time(), 3),
+        'uptime': round(time.time() - _started, 3),
+        'peer_count': peer_count,
+        'totals': totals,
+        'peers': dict(peers),
+    }
+
+def encode_snapshot(max_size=MAX_DATAGRAM):
+    """Snapshot em JSON que cabe em max_size bytes, cortando os pares menos problemáticos"""
+    limit = None
+    while True:
+        data = json.dumps(snapshot(limit)).encode('utf-8')
+        if len(data) <= max_size or limit == 0:
+            return data
+        limit = (len(_peers) if limit is None else limit) // 2
+
+def serve(addr):
+    """Responde com o snapshot a cada datagrama recebido em addr (numa thread)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind(addr)
+
+    def answer():
+        while True:
+            _, client = sock.recvfrom(64)
+            sock.sendto(encode_snapshot(), client)
+
+    threading.Thread(target=answer, name='metrics-server', daemon=True).start()
+    return sock
+
+def dump_every(path, interval=DUMP_INTERVAL):
+    """Reescreve path com o snapshot a cada interval segundos (numa thread)"""
+
+    def dump():
+        while True:
+            time.sleep(interval)
+            partial = f"{path}.tmp"
+            with open(partial, 'w') as f:
+                json.dump(snapshot(), f, indent=2)
+            os.replace(partial, path)  # Quem lê nunca vê o arquivo pela metade
+
+    threading.Thread(target=dump, name='metrics-dump', daemon=True).start()
+
+def query(addr, timeout=1.0):
+    """Pede o snapshot a uma porta de estatísticas e o retorna decodificado"""
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sock.sendto(b'stats', addr)
+        data, _ = sock.recvfrom(MAX_DATAGRAM + 1024)
+    return json.loads(data)
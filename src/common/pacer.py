@@ -0,0 +1,24 @@
+"""Controle de taxa de envio por balde de fichas (token bucket)."""
+import time
+
+BURST = 64 * 1024  # Bytes que podem sair de uma vez após um período ocioso
+
+class TokenBucket:
+    """Limita o envio a `rate` bytes por segundo, com rajadas de até `burst` bytes"""
+
+    def __init__(self, rate, burst=BURST):
+        self.rate = rate  # None ou 0: sem limite
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def consume(self, nbytes):
+        """Retira nbytes fichas, dormindo o necessário se o balde ficar devendo"""
+        if not self.rate:
+            return
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        self.tokens -= nbytes
+        if self.tokens < 0:
+            time.sleep(-self.tokens / self.rate)
@@ -0,0 +1,88 @@
+"""Formato binário dos pacotes usado pelos três projetos.
+
+Cabeçalho fixo de 16 bytes, em ordem de rede:
+
+    versão (1) | flags (1) | tamanho dos dados (2) | fluxo (4) | seq/ack (4) | CRC32 (4)
+
+O fluxo identifica a transferência, para que um servidor atenda vários clientes (e
+várias transferências do mesmo endereço) ao mesmo tempo; quem não precisa usa 0. O
+CRC32 cobre o cabeçalho (com o campo do CRC zerado) e os dados. ACKs levam no máximo
+a janela anunciada pelo receptor (WINDOW), e sondas (FLAG_PROBE) servem só para medir
+o maior pacote que passa. Pacotes de outra versão, truncados ou corrompidos são
+descartados por decode(), antes de chegarem à lógica do protocolo.
+
+No caminho rápido, send() monta o cabeçalho num buffer reaproveitado e envia cabeçalho
+e dados com sendmsg (scatter-gather), e recv_into() recebe num buffer já alocado e
+devolve os dados como memoryview, sem cópias.
+"""
+import socket
+import struct
+import zlib
+
+VERSION = 2
+HEADER = struct.Struct('!BBHIII')
+_PREFIX = struct.Struct('!BBHII')  # Cabeçalho sem o CRC
+_STREAM = struct.Struct('!I')
+_STREAM_OFFSET = 4
+_CRC = struct.Struct('!I')
+MAX_PAYLOAD = 0xFFFF
+WINDOW = struct.Struct('!H')  # Dados dos ACKs de common.rdt: pacotes que o receptor ainda aceita
+SEQ_SPACE = 2 ** 32
+_HAS_SENDMSG = hasattr(socket.socket, 'sendmsg')  # Indisponível no Windows
+
+FLAG_ACK = 0x01  # Pacote é um ACK
+FLAG_SR = 0x02   # Remetente usa Selective Repeat (ACKs individuais)
+FLAG_FIN = 0x04  # Último pacote do fluxo
+FLAG_PROBE = 0x08  # Sonda de tamanho de pacote (common.pmtu), fora do fluxo de dados
+FLAG_FEC = 0x10  # Remetente envia paridade (common.fec): o receptor guarda pacotes fora de ordem
+FLAG_PARITY = 0x20  # Paridade de um bloco de pacotes de dados, sem ACK
+FLAG_SACK = 0x40  # Dados: remetente aceita ACKs seletivos; ACK: cumulativo, com mapa de seletivos
+
+def encode(flags, seq_num, payload=b'', stream=0):
+    """Monta um pacote com cabeçalho e CRC"""
+    prefix = _PREFIX.pack(VERSION, flags, len(payload), stream, seq_num % SEQ_SPACE)
+    crc = zlib.crc32(payload, zlib.crc32(prefix))
+    return prefix + _CRC.pack(crc) + payload
+
+def pack_header_into(header, flags, seq_num, payload=b'', stream=0):
+    """Escreve em header (bytearray de HEADER.size bytes) o cabeçalho de payload"""
+    _PREFIX.pack_into(header, 0, VERSION, flags, len(payload), stream, seq_num % SEQ_SPACE)
+    with memoryview(header) as view:
+        crc = zlib.crc32(payload, zlib.crc32(view[:_PREFIX.size]))
+    _CRC.pack_into(header, _PREFIX.size, crc)
+
+def send(sock, header, flags, seq_num, payload, addr, stream=0):
+    """Envia cabeçalho e dados sem concatená-los, reaproveitando o buffer header"""
+    pack_header_into(header, flags, seq_num, payload, stream)
+    if _HAS_SENDMSG:
+        sock.sendmsg([header, payload], [], 0, addr)
+    else:
+        sock.sendto(bytes(header) + payload, addr)
+
+def recv_into(sock, buffer):
+    """Recebe em buffer; retorna ((flags, seq, dados) ou None, endereço)
+
+    Os dados são uma memoryview de buffer, válida até o próximo uso do buffer.
+    """
+    nbytes, addr = sock.recvfrom_into(buffer)
+    return decode(memoryview(buffer)[:nbytes]), addr
+
+def ack(seq_num, flags=0, stream=0):
+    """Monta um ACK (só cabeçalho)"""
+    return encode(FLAG_ACK | flags, seq_num, stream=stream)
+
+def stream_of(packet):
+    """Fluxo de um pacote já validado por decode()"""
+    return _STREAM.unpack_from(packet, _STREAM_OFFSET)[0]
+
+def decode(packet):
+    """Retorna (flags, seq, dados), ou None se o pacote for inválido ou corrompido"""
+    if len(packet) < HEADER.size:
+        return None
+    version, flags, length, _, seq_num, crc = HEADER.unpack_from(packet)
+    if version != VERSION or len(packet) != HEADER.size + length:
+        return None
+    payload = packet[HEADER.size:]
+    if zlib.crc32(payload, zlib.crc32(packet[:_PREFIX.size])) != crc:
+        return None
+    return flags, seq_num, payload
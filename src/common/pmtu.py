@@ -0,0 +1,106 @@
+"""Negociação do tamanho dos dados por pacote, com sondagem do caminho (PMTU).
+
+Antes de uma transferência, o cliente envia sondas (FLAG_PROBE) de tamanhos
+crescentes, preenchidas com zeros, e o servidor responde cada uma que chega com um ACK
+de sondagem que informa o maior tamanho que ele aceita. O cliente usa o maior tamanho
+confirmado: sondas perdidas, por fragmentação descartada ou MTU pequeno no caminho,
+fazem a busca recuar, como no DPLPMTUD (RFC 8899). Sem nenhuma resposta, fica no
+tamanho padrão, que todo servidor aceita.
+
+O servidor guarda, por endereço, o maior tamanho sondado (Prober.largest), para criar
+as sessões com buffers de recepção desse tamanho, e fit_buffers ajusta os buffers do
+socket no kernel para caber uma janela inteira de pacotes grandes.
+"""
+import socket
+import struct
+import time
+from collections import OrderedDict
+
+from common import packet, rtt
+from common.packet import FLAG_ACK, FLAG_PROBE, HEADER
+
+BASE_PAYLOAD = 1024  # Tamanho que todo servidor aceita, sem sondagem
+MAX_PAYLOAD = 65507 - HEADER.size  # Maior datagrama UDP sobre IPv4, menos o cabeçalho
+PROBE_ATTEMPTS = 2  # Envios de cada tamanho antes de considerá-lo grande demais
+RESOLUTION = 64  # A busca para quando o intervalo fica menor que isto
+MAX_PEERS = 1024  # Endereços lembrados pelo servidor
+REPLY = struct.Struct('!I')  # Maior tamanho de dados aceito pelo servidor
+
+def probe(sock, addr, limit=MAX_PAYLOAD, base=BASE_PAYLOAD):
+    """Maior tamanho de dados, entre base e limit, que chega ao par e que ele aceita"""
+    if limit <= base:
+        return limit
+    estimator = rtt.for_peer(addr)
+    header = bytearray(HEADER.size)
+    buffer = bytearray(HEADER.size + REPLY.size)
+    seq_num = 0
+
+    def attempt(size):
+        """Limite do servidor se uma sonda de size bytes for confirmada; None se não"""
+        nonlocal seq_num
+        padding = bytes(size)
+        for _ in range(PROBE_ATTEMPTS):
+            seq_num += 1
+            sent_at = time.monotonic()
+            packet.send(sock, header, FLAG_PROBE, seq_num, padding, addr)
+            deadline = sent_at + estimator.rto
+            while (remaining := deadline - time.monotonic()) > 0:
+                sock.settimeout(remaining)
+                try:
+                    decoded, src = packet.recv_into(sock, buffer)
+                except socket.timeout:
+                    break
+                if decoded is None or src != addr:
+                    continue
+                flags, ack_num, payload = decoded
+                if flags & FLAG_PROBE and flags & FLAG_ACK and ack_num == seq_num:
+                    # Cada envio tem o seu número, então a amostra de RTT não é ambígua
+                    estimator.sample(time.monotonic() - sent_at)
+                    return REPLY.unpack_from(payload)[0]
+        return None
+
+    accepted = attempt(base)
+    if accepted is None:
+        return base  # Servidor sem sondagem, ou caminho ruim: fica no padrão
+    low, high = base, min(limit, accepted)
+    if high > low and attempt(high) is not None:
+        return high
+    high -= 1
+    while high - low >= RESOLUTION:
+        middle = (low + high) // 2
+        if attempt(middle) is not None:
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+def fit_buffers(sock, payload, window):
+    """Aumenta os buffers do socket no kernel para caber uma janela de pacotes de payload bytes
+
+    Com pacotes grandes o buffer padrão (cerca de 200 KB no Linux) enche antes da janela
+    e o kernel descarta o resto, o que o remetente veria como perda. O sistema pode
+    limitar o valor pedido (net.core.rmem_max), e os buffers nunca diminuem.
+    """
+    wanted = window * (payload + HEADER.size + 64)  # Mais uma folga por datagrama
+    for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        if sock.getsockopt(socket.SOL_SOCKET, option) < wanted:
+            sock.setsockopt(socket.SOL_SOCKET, option, wanted)
+
+class Prober:
+    """Lado do servidor: responde às sondas e lembra o maior tamanho de cada endereço"""
+
+    def __init__(self, sock, max_payload=MAX_PAYLOAD):
+        self.sock = sock
+        self.max_payload = max_payload
+        self._largest = OrderedDict()  # endereço -> maior sonda recebida
+        self._reply = REPLY.pack(max_payload)
+
+    def answer(self, payload, seq_num, addr):
+        self._largest[addr] = max(len(payload), self._largest.pop(addr, 0))
+        while len(self._largest) > MAX_PEERS:
+            self._largest.popitem(last=False)
+        self.sock.sendto(packet.encode(FLAG_ACK | FLAG_PROBE, seq_num, self._reply), addr)
+
+    def largest(self, addr, default=BASE_PAYLOAD):
+        """Maior tamanho sondado pelo endereço, e não menos que default"""
+        return max(default, self._largest.get(addr, 0))
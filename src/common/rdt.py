@@ -0,0 +1,494 @@
+"""Transferência confiável (RDT) com janela deslizante: Go-Back-N e Selective Repeat.
+
+Os pacotes usam o formato de common.packet (números de sequência de 32 bits e CRC32),
+e o fim de cada fluxo é um pacote vazio com a flag FIN. Com janela 1 os dois modos se
+reduzem ao stop-and-wait (bit alternante) do RDT 3.0.
+
+O caminho de envio e recepção não aloca por pacote: cabeçalho e dados seguem por
+sendmsg sem serem concatenados, e a recepção usa recvfrom_into em buffers de um
+BufferPool, entregando os dados como memoryview.
+
+Todos os pacotes, inclusive os ACKs, levam o identificador de fluxo `stream`, que o
+servidor usa para separar transferências simultâneas (common.sessions).
+
+O envio respeita também o controle de congestionamento AIMD de common.congestion e a
+janela anunciada pelo receptor em cada ACK (packet.WINDOW), limitada pelo espaço que
+a aplicação ainda aceita (capacity de rdt_recv).
+
+Com fec=(bloco, grupos), rdt_send também envia paridades XOR (common.fec), e rdt_recv
+reconstrói um pacote perdido por grupo sem esperar a retransmissão.
+
+Perdas, atrasos e corrupção não são simulados aqui: para testar o protocolo num canal
+ruim, use o proxy tools/netem_proxy.py entre cliente e servidor. Os eventos por pacote
+vão para o log em nível DEBUG (LOG_LEVEL=rdt=debug para vê-los), e os contadores de
+cada par para common.metrics.
+"""
+import socket
+import threading
+import time
+
+from common import congestion, fec as fec_codec, log, metrics, packet, rtt
+from common.bufpool import BufferPool
+from common.packet import (FLAG_ACK, FLAG_FEC, FLAG_FIN, FLAG_PARITY, FLAG_PROBE, FLAG_SACK, FLAG_SR, HEADER,
+                           SEQ_SPACE, WINDOW)
+
+BUFFER_SIZE = 1024
+
+GBN = 'gbn'
+SR = 'sr'
+SACK = True  # SR com ACKs cumulativos e mapa de seletivos, em vez de um ACK por pacote
+ACK_DELAY = 0.005  # Segundos que um ACK em ordem pode esperar para ser combinado com o próximo
+ACK_EVERY = 2  # Pacotes em ordem por ACK, no máximo, com ACKs atrasados
+
+logger = log.get_logger('rdt')  # Eventos por pacote, em DEBUG
+
+
+class SendStats:
+    """Contadores agregados de rdt_send, para benchmarks (ative com rdt.stats = SendStats())"""
+
+    def __init__(self):
+        self.packets = 0
+        self.retransmissions = 0
+        self.latencies = []  # Segundos entre o primeiro envio de cada pacote e o seu ACK
+        self.lock = threading.Lock()
+
+    def record(self, packets, retransmissions, latencies):
+        with self.lock:
+            self.packets += packets
+            self.retransmissions += retransmissions
+            self.latencies.extend(latencies)
+
+
+stats = None  # SendStats compartilhado por todos os envios, ou None para não coletar
+
+
+def _send_ack(sock, header, seq_num, addr, who, stream=0, peer_metrics=None, rwnd=None, sack=None):
+    """ACK de seq_num; com sack (mapa em bytes), cumulativo até seq_num e seletivo a partir de seq_num + 2"""
+    if sack is None:
+        packet.send(sock, header, FLAG_ACK, seq_num, b'' if rwnd is None else WINDOW.pack(rwnd), addr, stream)
+    else:
+        packet.send(sock, header, FLAG_ACK | FLAG_SACK, seq_num, WINDOW.pack(rwnd) + sack, addr, stream)
+    if peer_metrics is not None:
+        peer_metrics.acks_out += 1
+    logger.debug("[%s] [RDT] ACK%d enviado.", who, seq_num % SEQ_SPACE)
+
+
+def rdt_send(sock, chunks, addr, window=1, mode=GBN, estimator=None,
+             who='RDT', bufsize=BUFFER_SIZE, release=None, stream=0, ack_stray=False, fec=None,
+             sack=SACK):
+    """Envia uma sequência de mensagens com janela deslizante e espera todos os ACKs
+
+    Depois da última mensagem envia um FIN, que também precisa ser confirmado. O timer
+    de retransmissão usa o RTO do estimador do par (rtt.for_peer por padrão). Ficam em
+    trânsito no máximo min(window, cwnd, janela anunciada) pacotes. As
+    mensagens não são copiadas: release(mensagem), se dado, é chamado quando cada uma
+    é confirmada, para que o buffer dela possa ser reaproveitado.
+
+    Com ack_stray, pacotes de dados do par são confirmados de novo: use quando o envio
+    vem logo após receber um fluxo dele, cujos ACKs finais podem ter se perdido. Sem
+    ele esses pacotes são ignorados, pois podem ser o início do próximo fluxo do par.
+
+    Com fec=(bloco, grupos), cada bloco de mensagens é seguido das suas paridades; as
+    mensagens devem ter até fec.OVERHEAD bytes a menos que o maior pacote do par.
+
+    No SR com sack, o receptor confirma de forma cumulativa, com um mapa dos pacotes
+    recebidos fora de ordem (FLAG_SACK), e pode atrasar ACKs para combiná-los.
+    """
+    chunks = iter(chunks)
+    flags = FLAG_SR if mode == SR else 0
+    if mode == SR and sack:
+        flags |= FLAG_SACK
+    encoder = None if fec is None else fec_codec.Encoder(*fec)
+    if encoder is not None:
+        flags |= FLAG_FEC
+    estimator = estimator or rtt.for_peer(addr)
+    header = bytearray(HEADER.size)
+    ack_buffer = bytearray(bufsize + HEADER.size)
+    unacked = {}  # seq -> (flags, dados) ainda não confirmados
+    sent_at = {}  # seq -> instante do último envio (timer por pacote no SR)
+    retransmitted = set()  # Karn: sem amostra de RTT para pacotes retransmitidos
+    base = next_seq = 0
+    exhausted = False
+    collector = stats
+    first_sent = {}  # seq -> instante do primeiro envio, só quando há coleta
+    latencies = []
+    retransmissions = 0
+    peer_metrics = metrics.for_peer(addr)
+    cc = congestion.CongestionWindow(window)
+    gauge = peer_metrics.gauges['cwnd'] = lambda: round(cc.cwnd, 1)
+    rwnd = window  # Janela anunciada pelo receptor no último ACK
+    pending = set()  # Perdidos à espera de retransmissão, conforme a janela permitir
+    dupacks = 0  # GBN: ACKs seguidos que não avançaram a base
+    later = {}  # SR: seq -> pacotes enviados depois dele e já confirmados
+    sent_order = {}  # SR: seq -> ordem do último envio
+    transmissions = 0
+    recover = 0  # Perdas de pacotes anteriores a este não reduzem a janela de novo
+
+    def transmit(seq_num):
+        nonlocal retransmissions, transmissions
+        if seq_num in sent_at:
+            retransmitted.add(seq_num)
+            retransmissions += 1
+            peer_metrics.retransmissions += 1
+        elif collector is not None:
+            first_sent[seq_num] = time.monotonic()
+        later.pop(seq_num, None)
+        sent_order[seq_num] = transmissions
+        transmissions += 1
+        packet_flags, data = unacked[seq_num]
+        packet.send(sock, header, packet_flags, seq_num, data, addr, stream)
+        peer_metrics.packets_out += 1
+        peer_metrics.bytes_out += len(data)
+        logger.debug("[%s] [RDT] Enviado pacote seq=%d, %d bytes.", who, seq_num % SEQ_SPACE, len(data))
+        sent_at[seq_num] = time.monotonic()
+
+    def send_parity(block):
+        """Envia as paridades de um bloco completo (ou do último, incompleto); sem ACK"""
+        if block is None:
+            return
+        start, parities = block
+        for parity in parities:
+            packet.send(sock, header, flags | FLAG_PARITY, start, parity, addr, stream)
+            peer_metrics.parity_out += 1
+        logger.debug("[%s] [RDT] Enviadas %d paridades do bloco seq=%d.", who, len(parities), start % SEQ_SPACE)
+
+    def acknowledge(seq_num):
+        data = unacked.pop(seq_num, (0, None))[1]
+        sent_at.pop(seq_num, None)
+        pending.discard(seq_num)
+        later.pop(seq_num, None)
+        sent_order.pop(seq_num, None)
+        retransmitted.discard(seq_num)
+        if release is not None and data is not None:
+            release(data)
+        if seq_num in first_sent:
+            latencies.append(time.monotonic() - first_sent.pop(seq_num))
+
+    def fast_retransmit(lost):
+        """Marca lost para retransmissão já, reduzindo a janela uma vez por episódio de perda"""
+        nonlocal recover
+        logger.debug("[%s] [RDT] Retransmissão rápida de %d pacotes a partir de seq=%d.",
+                     who, len(lost), min(lost) % SEQ_SPACE)
+        if max(lost) >= recover:
+            cc.lost(len(unacked) - len(pending))
+            recover = next_seq
+        pending.update(lost)
+        peer_metrics.fast_retransmits += len(lost)
+        # O primeiro sai já, mesmo sem espaço na janela: os ACKs só voltam depois dele
+        first = min(lost)
+        pending.discard(first)
+        transmit(first)
+
+    try:
+        while True:
+            limit = max(1, min(cc.window, rwnd))
+            # Retransmissões pendentes primeiro, depois pacotes novos, sem passar do limite
+            while pending and len(unacked) - len(pending) < limit:
+                seq_num = min(pending)
+                pending.discard(seq_num)
+                transmit(seq_num)
+            while not exhausted and len(unacked) < limit and next_seq - base < window:
+                data = next(chunks, None)
+                if data is None:
+                    exhausted = True
+                    if encoder is not None:
+                        send_parity(encoder.flush())
+                    unacked[next_seq] = (flags | FLAG_FIN, b'')
+                    transmit(next_seq)
+                else:
+                    unacked[next_seq] = (flags, data)
+                    transmit(next_seq)
+                    if encoder is not None:
+                        send_parity(encoder.add(data))
+                next_seq += 1
+
+            if exhausted and base == next_seq:
+                if collector is not None:
+                    collector.record(next_seq, retransmissions, latencies)
+                return
+
+            # No GBN existe um único timer, associado ao pacote mais antigo da janela
+            if mode == SR:
+                oldest = min(sent_at[s] for s in unacked if s not in pending)
+            else:
+                oldest = sent_at[base]
+            sock.settimeout(max(0.0, oldest + estimator.rto - time.monotonic()))
+            try:
+                decoded, src = packet.recv_into(sock, ack_buffer)
+            except (socket.timeout, BlockingIOError):  # Timeout zero deixa o socket não bloqueante
+                now = time.monotonic()
+                expired = [s for s in sorted(unacked)
+                           if s not in pending and (mode != SR or now - sent_at[s] >= estimator.rto)]
+                for seq_num in expired:
+                    logger.debug("[%s] [RDT] Timeout esperando ACK%d (RTO=%.3fs), retransmitindo...",
+                                 who, seq_num % SEQ_SPACE, estimator.rto)
+                if expired:
+                    cc.timeout(len(unacked) - len(pending))
+                    pending.update(expired)
+                    estimator.backoff()
+                    peer_metrics.timeouts += 1
+                continue
+
+            if decoded is None or src != addr or packet.stream_of(ack_buffer) != stream:
+                continue  # Corrompido, de outro par ou de outro fluxo do mesmo par
+            ack_flags, ack_num, payload = decoded
+            if ack_flags & (FLAG_PROBE | FLAG_PARITY):
+                continue  # Resposta atrasada de uma sondagem de tamanho, ou paridade do par
+            if not ack_flags & FLAG_ACK:
+                if ack_stray:
+                    # Retransmissão do fluxo anterior do par: o ACK final se perdeu
+                    _send_ack(sock, header, ack_num, src, who, stream, peer_metrics)
+                continue
+            if len(payload) >= WINDOW.size:
+                rwnd = WINDOW.unpack_from(payload)[0]
+
+            offset = (ack_num - base) % SEQ_SPACE
+            if mode != SR and offset == SEQ_SPACE - 1 and unacked:
+                # ACK repetido do pacote anterior à base: o receptor GBN descartou tudo depois da
+                # lacuna, a não ser que guarde os pacotes fora de ordem para a paridade
+                dupacks += 1
+                if dupacks == congestion.DUP_ACKS:
+                    fast_retransmit([base] if encoder is not None else [s for s in unacked if s not in pending])
+                continue
+            if ack_flags & FLAG_SACK:
+                # Cumulativo até ack_num (que pode ser o anterior à base) e o mapa a partir de ack_num + 2
+                cumulative = base - 1 if offset == SEQ_SPACE - 1 else base + offset
+                if cumulative >= next_seq:
+                    continue  # ACK fora da janela
+                bitmap = int.from_bytes(payload[WINDOW.size:], 'little')
+                acked_now = [s for s in range(base, cumulative + 1) if s in unacked]
+                while bitmap:
+                    low = bitmap & -bitmap
+                    seq_num = cumulative + 1 + low.bit_length()
+                    if seq_num in unacked:
+                        acked_now.append(seq_num)
+                    bitmap ^= low
+            elif offset >= next_seq - base:
+                continue  # ACK antigo ou fora da janela
+            elif mode == SR:
+                acked_now = [base + offset] if base + offset in unacked else []
+            else:
+                acked_now = list(range(base, base + offset + 1))  # ACK cumulativo
+            logger.debug("[%s] [RDT] ACK%d recebido.", who, ack_num)
+            peer_metrics.acks_in += 1
+            # Karn: a amostra vem do pacote mais recente confirmado que não foi retransmitido
+            fresh = [s for s in acked_now if s in sent_at and s not in retransmitted]
+            if fresh:
+                sample = time.monotonic() - sent_at[max(fresh)]
+                estimator.sample(sample)
+                peer_metrics.rtt.observe(sample)
+            elif acked_now:
+                estimator.acked()
+            newest = max((sent_order.get(s, -1) for s in acked_now), default=-1)
+            counts = [sent_order[s] for s in acked_now if s in sent_order]
+            for seq_num in acked_now:
+                acknowledge(seq_num)
+            previous = base
+            while base < next_seq and base not in unacked:
+                base += 1
+            if base != previous:
+                dupacks = 0
+            if mode == SR and counts:
+                # Como os ACKs duplicados: perdido o pacote com DUP_ACKS enviados depois dele já confirmados
+                lost = []
+                for seq_num in unacked:
+                    if seq_num not in pending and sent_order[seq_num] < newest:
+                        later[seq_num] = later.get(seq_num, 0) + sum(
+                            1 for order in counts if order > sent_order[seq_num])
+                        if later[seq_num] >= congestion.DUP_ACKS:
+                            lost.append(seq_num)
+                if lost:
+                    fast_retransmit(lost)
+            elif encoder is not None and base < recover and base in unacked and base not in pending:
+                # ACK parcial (NewReno): o receptor tem o resto, mas a lacuna seguinte também se perdeu
+                fast_retransmit([base])
+            cc.acked(len(acked_now))
+    finally:
+        # Outra transferência para o mesmo par pode ter registrado a sua janela depois
+        if peer_metrics.gauges.get('cwnd') is gauge:
+            del peer_metrics.gauges['cwnd']
+
+
+def rdt_recv(sock, peer=None, window=1, linger=0.0,
+             who='RDT', bufsize=BUFFER_SIZE, stream=0, capacity=None, ack_delay=ACK_DELAY):
+    """Recebe mensagens em ordem até o FIN, enviando ACKs; gera (dados, endereço)
+
+    O modo (GBN ou SR) segue a flag de cada pacote recebido. Se peer for None, o
+    remetente do primeiro pacote passa a ser o único aceito. Depois do FIN, continua
+    confirmando retransmissões por `linger` segundos, caso o último ACK se perca.
+
+    Os dados gerados são memoryviews de buffers reaproveitados: valem até a próxima
+    iteração, então quem precisar guardá-los deve copiá-los.
+
+    Cada ACK anuncia quantos pacotes o receptor ainda aceita: a janela ou, se for
+    menor, capacity(), o que a aplicação ainda comporta (em pacotes).
+
+    Se o remetente enviar paridades (FLAG_FEC), os pacotes fora de ordem são guardados
+    também no GBN, e um pacote perdido por grupo é reconstruído (common.fec).
+
+    Se o remetente aceitar SACK, cada ACK é cumulativo e leva o mapa dos pacotes fora de
+    ordem; pacotes em ordem são confirmados a cada ACK_EVERY ou após ack_delay segundos,
+    e lacunas, duplicatas e o FIN, na hora.
+    """
+    expected = 0
+    buffered = {}  # seq -> (flags, dados, buffer) recebidos fora de ordem
+    decoder = fec_codec.Decoder()
+    pool = BufferPool(bufsize + HEADER.size)
+    header = bytearray(HEADER.size)
+    buffer = None
+    peer_metrics = None if peer is None else metrics.for_peer(peer)
+    delayed = 0  # SACK: pacotes em ordem ainda não confirmados
+    deadline = None  # SACK: instante em que o ACK atrasado sai
+
+    def advertised():
+        free = window if capacity is None else min(window, capacity())
+        return max(0, min(free, 0xFFFF))
+
+    def send_sack():
+        """ACK cumulativo até o último pacote contíguo, com o mapa dos guardados depois dele"""
+        nonlocal delayed, deadline
+        last = expected - 1
+        while last + 1 in buffered:
+            last += 1
+        bitmap = 0
+        for seq in buffered:
+            if seq > last + 1:
+                bitmap |= 1 << (seq - last - 2)
+        _send_ack(sock, header, last, peer, who, stream, peer_metrics, advertised(),
+                  bitmap.to_bytes((window + 7) // 8, 'little'))
+        delayed, deadline = 0, None
+
+    while True:
+        if buffer is None:
+            buffer = pool.acquire()
+        sock.settimeout(None if deadline is None else max(0.0, deadline - time.monotonic()))
+        try:
+            decoded, addr = packet.recv_into(sock, buffer)
+        except (socket.timeout, BlockingIOError):
+            if deadline is not None:
+                send_sack()  # Nenhum pacote para combinar com o ACK atrasado
+            continue
+        if peer is not None and addr != peer:
+            continue
+        if decoded is not None and packet.stream_of(buffer) != stream:
+            continue
+        if decoded is None:
+            logger.debug("[%s] [RDT] Pacote corrompido descartado.", who)
+            if peer_metrics is not None:
+                peer_metrics.corrupted += 1
+            continue
+        flags, seq_num, data = decoded
+        if flags & (FLAG_ACK | FLAG_PROBE):
+            continue  # ACK atrasado de um fluxo anterior, ou sonda de tamanho
+
+        if peer_metrics is None:
+            peer_metrics = metrics.for_peer(addr)
+        peer = addr
+        recovered = None
+        sack = flags & FLAG_SR and flags & FLAG_SACK
+        ack_now = False  # SACK: a confirmação não pode esperar
+        if flags & FLAG_PARITY:
+            peer_metrics.parity_in += 1
+            # O bloco começa antes dos seus pacotes, que podem já ter sido entregues
+            offset = (seq_num - expected) % SEQ_SPACE
+            start = expected + offset - (SEQ_SPACE if offset >= SEQ_SPACE // 2 else 0)
+            recovered = decoder.recover(decoder.add_parity(start, data), expected + window)
+            if recovered is None:
+                continue
+        else:
+            logger.debug("[%s] [RDT] Pacote recebido seq=%d, %d bytes.", who, seq_num, len(data))
+            peer_metrics.packets_in += 1
+            peer_metrics.bytes_in += len(data)
+
+            offset = (seq_num - expected) % SEQ_SPACE
+            if offset < window and (flags & (FLAG_SR | FLAG_FEC) or offset == 0):
+                # Com FEC o GBN também guarda os pacotes fora de ordem, para combiná-los com a paridade
+                if flags & FLAG_SR and not sack:
+                    _send_ack(sock, header, seq_num, addr, who, stream, peer_metrics, advertised())
+                # Fora de ordem, preenchendo uma lacuna, duplicado ou FIN: o remetente precisa saber já
+                ack_now = bool(offset or buffered or flags & FLAG_FIN)
+                if expected + offset in buffered:
+                    peer_metrics.duplicates += 1
+                else:
+                    buffered[expected + offset] = (flags, data, buffer)
+                    buffer = None  # Fica com o pacote até a entrega
+                    if offset and not flags & FLAG_SR:
+                        peer_metrics.out_of_order += 1
+                    if flags & FLAG_FEC:
+                        decoder.add(expected + offset, data)
+                        recovered = decoder.recover(decoder.key_of(expected + offset), expected + window)
+            elif flags & FLAG_SR:
+                if offset >= SEQ_SPACE - window:
+                    # Pacote já entregue: o ACK se perdeu
+                    peer_metrics.duplicates += 1
+                    if sack:
+                        send_sack()
+                    else:
+                        _send_ack(sock, header, seq_num, addr, who, stream, peer_metrics, advertised())
+                continue
+            else:
+                # Fora de ordem ou duplicado: reenvia o último ACK cumulativo
+                logger.debug("[%s] [RDT] Pacote seq=%d fora de ordem. Reenviando último ACK.", who, seq_num)
+                if offset >= SEQ_SPACE - window:
+                    peer_metrics.duplicates += 1
+                else:
+                    peer_metrics.out_of_order += 1
+                _send_ack(sock, header, expected - 1, addr, who, stream, peer_metrics, advertised())
+                continue
+
+        if recovered is not None:
+            seq_num, data = recovered
+            logger.debug("[%s] [RDT] Pacote seq=%d reconstruído pela paridade.", who, seq_num % SEQ_SPACE)
+            peer_metrics.recovered += 1
+            buffered[seq_num] = (flags & FLAG_SR | FLAG_FEC, data, None)
+            if sack:
+                ack_now = True
+            elif flags & FLAG_SR:
+                _send_ack(sock, header, seq_num, addr, who, stream, peer_metrics, advertised())
+        if sack:
+            if not flags & FLAG_PARITY:
+                delayed += 1
+            if ack_now or delayed >= ACK_EVERY or window == 1 or ack_delay <= 0:
+                send_sack()
+            elif delayed and deadline is None:
+                deadline = time.monotonic() + ack_delay
+        elif not flags & FLAG_SR:
+            if expected in buffered:
+                # ACK cumulativo até o último pacote contíguo
+                last = expected
+                while last + 1 in buffered:
+                    last += 1
+                _send_ack(sock, header, last, addr, who, stream, peer_metrics, advertised())
+            elif not flags & FLAG_PARITY:
+                _send_ack(sock, header, expected - 1, addr, who, stream, peer_metrics, advertised())
+
+        while expected in buffered:
+            flags, data, held = buffered.pop(expected)
+            expected += 1
+            if flags & FLAG_FIN:
+                _linger(sock, peer, linger, who, bufsize, stream, peer_metrics)
+                return
+            yield data, addr
+            pool.release(held)
+            if expected % fec_codec.MAX_BLOCK == 0:
+                decoder.prune(expected)
+
+
+def _linger(sock, peer, linger, who, bufsize, stream, peer_metrics):
+    """Confirma retransmissões do par por alguns instantes após o FIN"""
+    deadline = time.monotonic() + linger
+    buffer = bytearray(bufsize + HEADER.size)
+    header = bytearray(HEADER.size)
+    while True:
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        sock.settimeout(remaining)
+        try:
+            decoded, addr = packet.recv_into(sock, buffer)
+        except socket.timeout:
+            return
+        if (addr == peer and decoded is not None and not decoded[0] & (FLAG_ACK | FLAG_PROBE | FLAG_PARITY)
+                and packet.stream_of(buffer) == stream):
+            peer_metrics.duplicates += 1
+            _send_ack(sock, header, decoded[1], addr, who, stream, peer_metrics)
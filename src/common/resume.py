@@ -0,0 +1,169 @@
+"""Transferências retomáveis: manifesto, fragmentos indexados e checkpoints em disco.
+
+No modo retomável cada transferência tem um identificador derivado do arquivo de
+origem (caminho, tamanho e data de modificação), e os fragmentos seguem com o seu
+índice (INDEX) na frente. O manifesto leva o hash de cada fragmento, e o servidor os
+guarda num common.chunkstore, de onde também sai a devolução; o cliente grava a
+devolução num ChunkFile, que registra as faixas já recebidas num arquivo de estado ao
+lado dos dados. Ao reconectar, cada lado informa o que já tem e o outro envia só o
+que falta.
+
+As mensagens de controle são JSON precedidos de MANIFEST ou DATA; nomes de arquivo
+nunca contêm NUL, então o servidor as distingue do nome enviado no modo simples. Uma
+lista de faixas longa demais para um pacote segue repartida em várias mensagens
+(split_control), com o total delas no campo 'parts' da primeira.
+"""
+import hashlib
+import json
+import os
+import re
+import struct
+
+MANIFEST = b'\x00manifest\x00'  # Pergunta ao servidor quais fragmentos faltam
+DATA = b'\x00data\x00'  # Abre o fluxo com os fragmentos que faltam
+INDEX = struct.Struct('!I')
+CHECKPOINT_EVERY = 256  # Fragmentos gravados entre dois checkpoints
+
+_TRANSFER_ID = re.compile(r'[0-9a-f]{32}')
+
+def transfer_id(filename):
+    """Identificador estável de um arquivo enquanto ele não mudar"""
+    info = os.stat(filename)
+    key = f"{os.path.abspath(filename)}|{info.st_size}|{info.st_mtime_ns}"
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+def valid_id(value):
+    """Evita que um identificador recebido vire um caminho arbitrário"""
+    return isinstance(value, str) and _TRANSFER_ID.fullmatch(value) is not None
+
+def chunk_count(size, chunk):
+    return -(-size // chunk)
+
+def encode_control(kind, fields):
+    return kind + json.dumps(fields).encode('utf-8')
+
+def decode_control(kind, message):
+    """Campos da mensagem de controle, ou None se ela não for do tipo kind"""
+    message = bytes(message)
+    if not message.startswith(kind):
+        return None
+    return json.loads(message[len(kind):])
+
+def split_control(fields, key, limit, kind=b''):
+    """Mensagens de até limit bytes com fields, repartindo a lista fields[key] entre elas
+
+    A primeira leva kind, os outros campos e 'parts' (o total de mensagens); as
+    seguintes, só a continuação da lista, em JSON. join_control() refaz os campos.
+    """
+    parts = [[]]
+    size = len(encode_control(kind, dict(fields, **{key: [], 'parts': 10 ** 9})))
+    for item in fields[key]:
+        cost = len(json.dumps(item)) + 2  # Com o separador ', '
+        if parts[-1] and size + cost > limit:
+            parts.append([])
+            size = len(json.dumps({key: []}))
+        parts[-1].append(item)
+        size += cost
+    first = encode_control(kind, dict(fields, **{key: parts[0], 'parts': len(parts)}))
+    return [first] + [json.dumps({key: part}).encode('utf-8') for part in parts[1:]]
+
+def join_control(fields, key, messages):
+    """Completa fields[key] com as partes seguintes, lidas do iterador messages"""
+    for _ in range(fields.get('parts', 1) - 1):
+        message = next(messages, None)
+        if message is None:
+            raise ValueError(f"mensagem de controle incompleta: faltam partes de '{key}'")
+        fields[key].extend(json.loads(bytes(message))[key])
+    return fields
+
+def to_ranges(indices):
+    """Compacta índices em faixas [início, fim)"""
+    ranges = []
+    for index in sorted(indices):
+        if ranges and ranges[-1][1] == index:
+            ranges[-1][1] = index + 1
+        else:
+            ranges.append([index, index + 1])
+    return ranges
+
+def from_ranges(ranges):
+    return {index for start, end in ranges for index in range(start, end)}
+
+def read_indexed(f, indices, chunk, pool):
+    """Gera INDEX + fragmento para cada índice, lidos de f nos buffers de pool"""
+    for index in indices:
+        buffer = pool.acquire()
+        INDEX.pack_into(buffer, 0, index)
+        view = memoryview(buffer)
+        f.seek(index * chunk)
+        nbytes = f.readinto(view[INDEX.size:INDEX.size + chunk])
+        yield view[:INDEX.size + nbytes]
+
+def read_stored(store, keys, indices, pool):
+    """Como read_indexed, mas lendo cada fragmento do armazenamento pelo seu hash"""
+    for index in indices:
+        buffer = pool.acquire()
+        INDEX.pack_into(buffer, 0, index)
+        view = memoryview(buffer)
+        nbytes = store.read_into(keys[index], view[INDEX.size:])
+        yield view[:INDEX.size + nbytes]
+
+class ChunkFile:
+    """Arquivo montado a partir de fragmentos indexados, com as faixas recebidas em disco"""
+
+    def __init__(self, path, chunk, meta=None):
+        self.path = path
+        self.state_path = f"{path}.state"
+        self.chunk = chunk
+        self.received = set()
+        self.meta = dict(meta or {})  # Informações da transferência guardadas com o estado
+        if os.path.exists(self.state_path) and os.path.exists(path):
+            with open(self.state_path) as f:
+                state = json.load(f)
+            if state['chunk'] == chunk and all(state['meta'].get(k) == v for k, v in self.meta.items()):
+                self.received = from_ranges(state['ranges'])
+                self.meta = state['meta']
+        if not self.received and os.path.exists(path):
+            os.remove(path)  # Dados de outro arquivo ou sem estado: recomeça
+        # Sem O_APPEND, que faria o pwrite ignorar a posição
+        self.file = open(os.open(path, os.O_RDWR | os.O_CREAT, 0o644), 'r+b', buffering=0)
+        self._unsaved = 0
+
+    def write(self, index, data):
+        os.pwrite(self.file.fileno(), data, index * self.chunk)
+        self.received.add(index)
+        self._unsaved += 1
+        if self._unsaved >= CHECKPOINT_EVERY:
+            self.save()
+
+    def missing(self, count):
+        return [index for index in range(count) if index not in self.received]
+
+    def save(self):
+        """Grava o checkpoint; os dados vão para o disco antes das faixas que os citam"""
+        if os.fstat(self.file.fileno()).st_nlink == 0:
+            return  # Outra sessão já concluiu e apagou esta transferência
+        os.fsync(self.file.fileno())
+        partial = f"{self.state_path}.tmp"
+        with open(partial, 'w') as f:
+            json.dump({'chunk': self.chunk, 'ranges': to_ranges(self.received), 'meta': self.meta}, f)
+        os.replace(partial, self.state_path)
+        self._unsaved = 0
+
+    def close(self):
+        if not self.file.closed:
+            self.save()
+            self.file.close()
+
+    def finish(self, destination):
+        """Fecha e move o arquivo completo para destination, apagando o estado"""
+        self.file.close()
+        os.replace(self.path, destination)
+        if os.path.exists(self.state_path):
+            os.remove(self.state_path)
+
+    def discard(self):
+        self.file.close()
+        for path in (self.path, self.state_path):
+            if os.path.exists(path):
+                os.remove(path)
@@ -0,0 +1,83 @@
+"""Estimativa de RTT e cálculo do timeout de retransmissão (RTO), como na RFC 6298.
+
+Cada par (endereço) tem o seu estimador. Amostras só são feitas em pacotes que não
+foram retransmitidos (algoritmo de Karn) e cada timeout dobra o RTO até MAX_RTO. Como
+no PTO do QUIC, o backoff é desfeito quando um ACK confirma dados novos, mesmo sem
+amostra; do contrário, com perdas frequentes o RTO só cresceria.
+"""
+import threading
+from collections import OrderedDict
+
+INITIAL_RTO = 1.0  # RTO antes da primeira amostra
+MIN_RTO = 0.05
+MAX_RTO = 60.0
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+MAX_PEERS = 4096  # Estimadores guardados antes de esquecer os mais antigos, como em metrics
+
+class RttEstimator:
+    """SRTT/RTTVAR de um par e o RTO corrente"""
+
+    def __init__(self, initial_rto=INITIAL_RTO, min_rto=MIN_RTO, max_rto=MAX_RTO):
+        self.srtt = None
+        self.rttvar = None
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.base_rto = initial_rto
+        self.backoffs = 0  # Timeouts consecutivos
+
+    @property
+    def rto(self):
+        """RTO corrente, já considerando o backoff exponencial"""
+        return min(self.max_rto, self.base_rto * (2 ** self.backoffs))
+
+    def sample(self, rtt):
+        """Atualiza a estimativa com um RTT medido (em segundos)"""
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        self.base_rto = min(self.max_rto, max(self.min_rto, self.srtt + K * self.rttvar))
+        self.backoffs = 0
+
+    def backoff(self):
+        """Dobra o RTO após um timeout"""
+        if self.rto < self.max_rto:
+            self.backoffs += 1
+
+    def acked(self):
+        """Um ACK confirmou dados novos: desfaz o backoff"""
+        self.backoffs = 0
+
+    def __repr__(self):
+        srtt = 'n/a' if self.srtt is None else f"{self.srtt * 1000:.1f}ms"
+        return f"RttEstimator(srtt={srtt}, rto={self.rto * 1000:.1f}ms)"
+
+_estimators = OrderedDict()  # endereço -> RttEstimator, do uso mais antigo ao mais recente
+_estimators_lock = threading.Lock()
+
+def for_peer(addr):
+    """Retorna o estimador do par, criando-o na primeira vez"""
+    with _estimators_lock:
+        estimator = _estimators.get(addr)
+        if estimator is None:
+            estimator = _estimators[addr] = RttEstimator()
+            while len(_estimators) > MAX_PEERS:
+                _estimators.popitem(last=False)
+        else:
+            _estimators.move_to_end(addr)
+        return estimator
+
+def current_rto(addr):
+    """RTO corrente para o par, sem criar estimador"""
+    with _estimators_lock:
+        estimator = _estimators.get(addr)
+    return estimator.rto if estimator is not None else INITIAL_RTO
+
+def snapshot():
+    """Copia o estado de todos os estimadores: endereço -> (srtt, rttvar, rto)"""
+    with _estimators_lock:
+        return {addr: (e.srtt, e.rttvar, e.rto) for addr, e in _estimators.items()}
@@ -0,0 +1,134 @@
+"""Tabela de sessões para servidores que atendem várias transferências ao mesmo tempo.
+
+Um único leitor recebe os datagramas do socket do servidor e os distribui pela chave
+(endereço, fluxo) para a sessão correspondente. Cada sessão roda numa thread própria
+com um SessionSocket, que oferece a parte da interface de socket usada por common.rdt
+(recvfrom_into, sendmsg, sendto, settimeout) sobre uma fila; assim rdt_recv e rdt_send
+funcionam sem mudanças, e uma transferência não interfere no estado das outras.
+
+O leitor também responde às sondas de tamanho (common.pmtu) sem abrir sessão, e cada
+sessão nasce com max_payload, o maior tamanho de dados que o seu cliente sondou.
+"""
+import queue
+import socket
+import threading
+import time
+
+from common import log, metrics, packet, pmtu
+from common.packet import FLAG_ACK, FLAG_FIN, FLAG_PARITY, FLAG_PROBE, HEADER
+
+BUFFER_SIZE = 1024
+MAX_SESSIONS = 16  # Transferências simultâneas; as demais esperam o cliente retransmitir
+MAX_QUEUE = 256  # Datagramas pendentes por sessão; acima disso são descartados
+IDLE_TIMEOUT = 30.0  # Segundos sem receber nada antes de abandonar a sessão
+
+logger = log.get_logger('sessions')
+
+class SessionSocket:
+    """Socket de uma sessão: recebe da fila do leitor e envia pelo socket do servidor"""
+
+    def __init__(self, sock, addr, max_queue=MAX_QUEUE, idle_timeout=IDLE_TIMEOUT):
+        self.sock = sock
+        self.addr = addr
+        self.idle_timeout = idle_timeout
+        self.max_payload = BUFFER_SIZE  # Maior tamanho de dados sondado pelo cliente
+        self._queue = queue.Queue(max_queue)
+        self._timeout = None
+        self._last_seen = time.monotonic()
+
+    def push(self, datagram):
+        """Chamado pelo leitor; retorna False se a fila estiver cheia"""
+        try:
+            self._queue.put_nowait(datagram)
+        except queue.Full:
+            return False
+        return True
+
+    def capacity(self):
+        """Datagramas que ainda cabem na fila da sessão"""
+        return self._queue.maxsize - self._queue.qsize()
+
+    def settimeout(self, timeout):
+        self._timeout = timeout
+
+    def recvfrom_into(self, buffer):
+        """Como socket.recvfrom_into; ConnectionAbortedError se o cliente sumir"""
+        idle_left = self._last_seen + self.idle_timeout - time.monotonic()
+        wait = idle_left if self._timeout is None else min(self._timeout, idle_left)
+        try:
+            datagram = self._queue.get(timeout=max(0.0, wait))
+        except queue.Empty:
+            if time.monotonic() - self._last_seen >= self.idle_timeout:
+                raise ConnectionAbortedError(f"sessão {self.addr} inativa") from None
+            raise socket.timeout() from None
+        self._last_seen = time.monotonic()
+        nbytes = min(len(datagram), len(buffer))
+        buffer[:nbytes] = datagram[:nbytes]
+        return nbytes, self.addr
+
+    def sendmsg(self, buffers, ancdata=(), flags=0, address=None):
+        return self.sock.sendmsg(buffers, ancdata, flags, address)
+
+    def sendto(self, data, address):
+        return self.sock.sendto(data, address)
+
+class SessionTable:
+    """Leitor do socket do servidor e sessões ativas, indexadas por (endereço, fluxo)"""
+
+    def __init__(self, sock, handler, max_sessions=MAX_SESSIONS, max_queue=MAX_QUEUE,
+                 idle_timeout=IDLE_TIMEOUT, bufsize=BUFFER_SIZE):
+        self.sock = sock
+        self.handler = handler  # handler(session_socket, endereço, fluxo), numa thread
+        self.max_sessions = max_sessions
+        self.max_queue = max_queue
+        self.idle_timeout = idle_timeout
+        self.bufsize = bufsize
+        self.sessions = {}  # (endereço, fluxo) -> SessionSocket
+        self.lock = threading.Lock()
+        self.prober = pmtu.Prober(sock, bufsize)
+
+    def serve_forever(self):
+        buffer = bytearray(self.bufsize + HEADER.size)
+        view = memoryview(buffer)
+        while True:
+            nbytes, addr = self.sock.recvfrom_into(buffer)
+            self.dispatch(bytes(view[:nbytes]), addr)  # Cópia do tamanho do datagrama, não do buffer
+
+    def dispatch(self, datagram, addr):
+        """Entrega o datagrama à sua sessão, criando-a no primeiro pacote do fluxo"""
+        decoded = packet.decode(datagram)
+        if decoded is None:
+            return  # Corrompido: o remetente retransmite
+        flags, seq_num, payload = decoded
+        if flags & FLAG_PROBE:
+            if not flags & FLAG_ACK:
+                self.prober.answer(payload, seq_num, addr)
+            return
+        key = (addr, packet.stream_of(datagram))
+        with self.lock:
+            session = self.sessions.get(key)
+            if session is None:
+                # Só o primeiro pacote de dados abre uma sessão; o resto é de uma sessão encerrada
+                if flags & (FLAG_ACK | FLAG_FIN | FLAG_PARITY) or seq_num != 0:
+                    return
+                if len(self.sessions) >= self.max_sessions:
+                    logger.warning("[Servidor] Limite de %d sessões atingido, ignorando %s.", self.max_sessions, addr)
+                    return
+                session = self.sessions[key] = SessionSocket(self.sock, addr, self.max_queue, self.idle_timeout)
+                session.max_payload = min(self.bufsize, self.prober.largest(addr))
+                metrics.for_peer(addr).gauges['queue'] = session._queue.qsize
+                threading.Thread(target=self._run, args=(key, session), daemon=True).start()
+        if not session.push(datagram):
+            logger.debug("[Servidor] Fila da sessão %s cheia, datagrama descartado.", key)
+            metrics.for_peer(addr).queue_drops += 1
+
+    def _run(self, key, session):
+        addr, stream = key
+        try:
+            self.handler(session, addr, stream)
+        except OSError as e:
+            logger.warning("[Servidor] Sessão %s encerrada: %s", key, e)
+        finally:
+            with self.lock:
+                del self.sessions[key]
+            metrics.for_peer(addr).gauges.pop('queue', None)
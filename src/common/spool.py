@@ -0,0 +1,105 @@
+"""Armazenamento dos arquivos recebidos pelos servidores, com transbordo para disco.
+
+Os fragmentos ficam em memória até `max_memory` bytes; acima disso tudo passa para um
+arquivo temporário, e a devolução lê esse arquivo por mmap, sem carregá-lo inteiro.
+Fragmentos que chegam fora de ordem podem ser gravados na sua posição com write_at.
+Com `budget`, o spool aceita no máximo esse total de bytes: free() informa quanto
+ainda cabe, sem consultar o disco, e uma escrita além do limite falha com EFBIG.
+"""
+import errno
+import mmap
+import os
+import tempfile
+
+MAX_MEMORY = 1024 * 1024  # Bytes mantidos em memória antes de ir para disco
+
+class Spool:
+    """Fragmentos de um arquivo recebido, em memória ou em disco"""
+
+    def __init__(self, max_memory=MAX_MEMORY, dir=None, budget=None):
+        self.max_memory = max_memory
+        self.dir = dir
+        self.budget = budget  # Total de bytes aceitos (None: sem limite)
+        self.size = 0
+        self._buffer = bytearray()
+        self._file = None  # Arquivo temporário, após transbordar
+        self._mmap = None
+
+    @property
+    def on_disk(self):
+        return self._file is not None
+
+    def free(self):
+        """Bytes que ainda cabem no orçamento (None se não há limite)"""
+        return None if self.budget is None else max(0, self.budget - self.size)
+
+    def _check_budget(self, end):
+        if self.budget is not None and end > self.budget:
+            raise OSError(errno.EFBIG, f"arquivo passa do limite de {self.budget} bytes")
+
+    def write(self, data):
+        """Acrescenta um fragmento ao final"""
+        self._check_budget(self.size + len(data))
+        if self._file is None and self.size + len(data) > self.max_memory:
+            self._spill()
+        if self._file is not None:
+            self._file.write(data)
+        else:
+            self._buffer += data
+        self.size += len(data)
+
+    def write_at(self, offset, data):
+        """Grava um fragmento na posição offset; lacunas ficam zeradas"""
+        end = offset + len(data)
+        self._check_budget(end)
+        if self._file is None and end > self.max_memory:
+            self._spill()
+        if self._file is not None:
+            self._file.flush()
+            os.pwrite(self._file.fileno(), data, offset)
+        else:
+            if end > len(self._buffer):
+                self._buffer.extend(bytes(end - len(self._buffer)))
+            self._buffer[offset:end] = data
+        self.size = max(self.size, end)
+
+    def _spill(self):
+        """Passa o conteúdo em memória para um arquivo temporário"""
+        self._file = tempfile.TemporaryFile(dir=self.dir)
+        self._file.write(self._buffer)
+        self._buffer = bytearray()
+
+    def chunks(self, size):
+        """Gera o conteúdo em fragmentos de até `size` bytes (memoryview)"""
+        if self.size == 0:
+            return
+        if self._file is None:
+            view = memoryview(self._buffer)
+        else:
+            self._file.flush()
+            if self._mmap is None:
+                self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            view = memoryview(self._mmap)
+        with view:
+            for start in range(0, self.size, size):
+                yield view[start:start + size]
+
+    def close(self):
+        """Libera a memória e apaga o arquivo temporário"""
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # Ainda há fragmentos em uso; o coletor de lixo fecha depois
+            self._mmap = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        self._buffer = bytearray()
+        self.size = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,40 +1,80 @@
+import os
+import random
 import socket
+import sys
 
-def main(host='localhost', port=1044):
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import packet
+from common.packet import FLAG_FIN
+from common.pacer import TokenBucket
+import raw
+
+def main(host='localhost', port=1044, rate=raw.RATE, filename=None): # Retorna o nome com que o arquivo foi salvo
     addr = (host, port)
-    buffer_size = 1024
+    buffer_size = raw.BUFFER_SIZE
 
     udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    raw.configure_socket(udp)
+    header = bytearray(packet.HEADER.size) # Buffers reaproveitados em todos os pacotes
+    buffer = bytearray(buffer_size + packet.HEADER.size)
+    view = memoryview(buffer)
+    pacer = TokenBucket(rate) # Limita a taxa para não estourar o buffer do servidor
 
-    filename = input("Nome do arquivo: ")
-    udp.sendto(filename.encode('utf-8'), addr) # Envia o arquivo descrito no input
+    filename = filename or input("Nome do arquivo: ")
+    stream = random.getrandbits(32) # Identifica esta transferência no servidor
+    raw.send_control(udp, header, 0, 0, filename.encode('utf-8'), addr, stream) # Envia o arquivo descrito no input
 
     print(f"Enviando arquivo: {filename}")
 
-    with open(filename, 'rb') as f:
+    with open(filename, 'rb', buffering=0) as f:
+        seq_num = 1
+        size = 0
         while True:
-            data = f.read(buffer_size) # Lê o arquivo em fragmentos de tamanho 1024 bytes
-            if not data: # Encerra o loop caso não tenha mais dados para ler
+            nbytes = f.readinto(view[:buffer_size]) # Lê o arquivo em fragmentos de tamanho 1024 bytes
+            if not nbytes: # Encerra o loop caso não tenha mais dados para ler
                 break
-            udp.sendto(data, addr) # Envia cada fragmento para o servidor
-        udp.sendto(b'EOF', addr)
+            pacer.consume(nbytes + packet.HEADER.size)
+            packet.send(udp, header, 0, seq_num, view[:nbytes], addr, stream) # O seq indica a posição do fragmento
+            seq_num += 1
+            size += nbytes
+        raw.send_fin(udp, header, seq_num, seq_num - 1, size, addr, stream) # Sinaliza o fim do arquivo
 
     print(f"Arquivo {filename} enviado!")
 
-    new_filename_data, server_addr = udp.recvfrom(buffer_size) # Recebe o arquivo com o nome alterado
-    new_filename = new_filename_data.decode('utf-8')  # Decodifica o arquivo
-    print(f"Servidor alterou o nome do arquivo para: {new_filename}")
-
-    with open(new_filename, 'wb') as f:
+    # Os fragmentos de volta podem chegar antes do novo nome: grava num arquivo parcial e renomeia no fim
+    partial_name = f"{filename}.{stream:08x}.part"
+    new_filename = None
+    received = set()
+    summary = None
+    udp.settimeout(raw.IDLE_TIMEOUT)
+    with open(partial_name, 'wb') as f:
         while True:
-            data, server_addr = udp.recvfrom(buffer_size) # Recebe cada fragmento enviado de volta do servidor.
-            if data == b'':
+            try:
+                flags, seq_num, data, server_addr = raw.recv_packet(udp, buffer) # Recebe cada fragmento enviado de volta do servidor.
+            except socket.timeout: # Sem FIN: encerra com o que chegou
+                break
+            if packet.stream_of(buffer) != stream:
+                continue
+            if flags & FLAG_FIN:
+                summary = raw.FIN_SUMMARY.unpack(data)
                 break
-            f.write(data) # Escreve o fragmento no arquivo
+            if seq_num == 0:
+                if new_filename is None:
+                    new_filename = bytes(data).decode('utf-8')  # Decodifica o arquivo
+                    print(f"Servidor alterou o nome do arquivo para: {new_filename}")
+                continue
+            os.pwrite(f.fileno(), data, (seq_num - 1) * buffer_size) # Escreve o fragmento na sua posição
+            received.add(seq_num)
+        if summary is not None:
+            f.truncate(summary[1]) # Mantém o tamanho original mesmo se o último fragmento se perdeu
 
+    raw.loss_report('Cliente', len(received), summary[0] if summary else None)
+    new_filename = new_filename or f"recebido_{filename}"
+    os.replace(partial_name, new_filename)
     print(f"Arquivo recebido e salvo como {new_filename}")
 
     udp.close()
+    return new_filename
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,55 @@
+"""Modo de transferência sem confiabilidade (melhor esforço) compartilhado por cliente e servidor.
+
+Os fragmentos saem num ritmo controlado por um balde de fichas, para não estourar o
+buffer de recepção do outro lado, e levam o número do fragmento no campo seq: o
+receptor grava cada um na sua posição (pwrite), mesmo fora de ordem. O nome do arquivo
+e o FIN, que carrega o total de fragmentos enviados, são repetidos algumas vezes; no
+fim cada lado informa quantos fragmentos se perderam.
+"""
+import os
+import socket
+import struct
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import packet
+from common.packet import FLAG_FIN
+
+BUFFER_SIZE = 1024
+RATE = 64 * 1024 * 1024  # Bytes/s; None para enviar sem limite
+SOCKET_BUFFER = 4 * 1024 * 1024  # SO_RCVBUF/SO_SNDBUF pedidos ao sistema
+CONTROL_COPIES = 3  # Cópias do nome do arquivo e do FIN
+IDLE_TIMEOUT = 2.0  # Segundos sem pacotes antes de dar a transferência por encerrada
+FIN_SUMMARY = struct.Struct('!IQ')  # Dados do FIN: fragmentos enviados, tamanho do arquivo
+
+def recv_packet(udp, buffer): # Recebe o próximo pacote válido em buffer, descartando os corrompidos
+    while True:
+        decoded, addr = packet.recv_into(udp, buffer) # Os dados são uma memoryview de buffer, sem cópia
+        if decoded is not None:
+            return decoded + (addr,)
+
+def configure_socket(udp, size=SOCKET_BUFFER):
+    """Aumenta os buffers do socket; o sistema pode conceder menos que o pedido"""
+    for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+        try:
+            udp.setsockopt(socket.SOL_SOCKET, option, size)
+        except OSError as e:
+            print(f"Não foi possível ajustar o buffer do socket: {e}")
+    return udp.getsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF)
+
+def send_control(udp, header, flags, seq_num, payload, addr, stream):
+    """Envia um pacote de controle (nome ou FIN) em várias cópias"""
+    for _ in range(CONTROL_COPIES):
+        packet.send(udp, header, flags, seq_num, payload, addr, stream)
+
+def send_fin(udp, header, seq_num, sent, size, addr, stream):
+    send_control(udp, header, FLAG_FIN, seq_num, FIN_SUMMARY.pack(sent, size), addr, stream)
+
+def loss_report(who, received, expected):
+    """Mostra quantos fragmentos chegaram; expected None quando o FIN se perdeu"""
+    if expected is None:
+        print(f"[{who}] FIN não recebido: {received} fragmentos recebidos, total desconhecido.")
+        return
+    lost = expected - received
+    percent = 100 * lost / expected if expected else 0.0
+    print(f"[{who}] Recebidos {received} de {expected} fragmentos ({lost} perdidos, {percent:.1f}%).")
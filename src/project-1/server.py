@@ -1,42 +1,130 @@
-import socket
-import random
-
-def generate_random_name(length=5): # Gera uma string aleatória para inserir no nome do arquivo
-    letters = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
-    return ''.join(random.choices(letters, k=length))
-
-def main(host='localhost', port=1044):
-    addr = (host, port)
-    buffer_size = 1024
-
-    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    udp.bind(addr)
-
-    print(f"Servidor UDP escutando em {addr}")
-
-    while True:
-        data, client_addr = udp.recvfrom(buffer_size)
-        filename = data.decode('utf-8') # Recebe o arquivo enviado do client
-        print(f"Recebendo arquivo: {filename}")
-
-        random_name = generate_random_name()
-        new_filename = f"{random_name}_{filename}" # Cria o novo nome do arquivo para ser enviado ao client
-        udp.sendto(new_filename.encode('utf-8'), client_addr)
-
-        file_data = [] # Armazenar os fragmentos recebidos
-        while True:
-            data, client_addr = udp.recvfrom(buffer_size) # Recebe cada fragmento de até 1024 bytes
-            if data == b'EOF':
-                break
-            file_data.append(data) # Adiciona cada fragmento na lista
-
-        print(f"Arquivo {filename} recebido e nome alterado para {new_filename}")
-
-        for chunk in file_data: # Envia cada fragmento de volta ao client
-            udp.sendto(chunk, client_addr)
-        udp.sendto(b'', client_addr)
-
-        print(f"Arquivo {new_filename} enviado de volta ao client")
-
-if __name__ == "__main__":
-    main()
+import errno
+import os
+import socket
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import packet
+from common.packet import FLAG_FIN
+from common.pacer import TokenBucket
+from common.spool import Spool
+import raw
+
+MAX_MEMORY = 1024 * 1024  # Por transferência: acima disso o arquivo recebido vai para um arquivo temporário
+SPOOL_BUDGET = 256 * 1024 * 1024  # Por transferência: maior arquivo recebido (memória e disco)
+MAX_SESSIONS = 16  # Transferências ao mesmo tempo, recebendo ou devolvendo
+
+def generate_random_name(length=5): # Gera uma string aleatória para inserir no nome do arquivo
+    letters = 'abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ'
+    return ''.join(random.choices(letters, k=length))
+
+def echo(udp, session, client_addr, stream, rate):
+    """Devolve ao client os fragmentos recebidos, cada um na sua posição, e o FIN
+
+    Roda numa thread própria, com o seu buffer de cabeçalho, para que o laço de
+    recepção continue atendendo as outras transferências durante a devolução.
+    """
+    header = bytearray(packet.HEADER.size)
+    pacer = TokenBucket(rate)
+    received = session['received']
+    sent = 0
+    with session['data'] as file_data:
+        for seq_num, chunk in enumerate(file_data.chunks(raw.BUFFER_SIZE), 1):
+            if seq_num not in received: # Lacuna: o fragmento se perdeu na ida
+                continue
+            pacer.consume(len(chunk) + packet.HEADER.size)
+            packet.send(udp, header, 0, seq_num, chunk, client_addr, stream)
+            sent += 1
+        raw.send_fin(udp, header, session['chunks'] + 1, sent, file_data.size, client_addr, stream)
+    print(f"Arquivo {session['new_filename']} enviado de volta ao client")
+
+def main(host='localhost', port=1044, max_sessions=MAX_SESSIONS, rate=raw.RATE):
+    addr = (host, port)
+    buffer_size = raw.BUFFER_SIZE
+
+    udp = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    udp.bind(addr)
+    raw.configure_socket(udp)
+    udp.settimeout(raw.IDLE_TIMEOUT)
+    header = bytearray(packet.HEADER.size) # Buffers reaproveitados em todos os pacotes
+    buffer = bytearray(buffer_size + packet.HEADER.size)
+    sessions = {} # Chave: (endereço, fluxo), Valor: estado da transferência
+    echoes = [] # Threads devolvendo arquivos, que também contam no limite de transferências
+    last_purge = time.monotonic()
+
+    print(f"Servidor UDP escutando em {addr}")
+
+    while True:
+        now = time.monotonic()
+        if now - last_purge >= raw.IDLE_TIMEOUT: # Transferências cujo FIN se perdeu
+            last_purge = now
+            for key, session in list(sessions.items()):
+                if now - session['last_seen'] >= raw.IDLE_TIMEOUT:
+                    del sessions[key]
+                    session['data'].close()
+                    raw.loss_report(f"Servidor {key[0]}", len(session['received']), None)
+
+        try:
+            flags, seq_num, data, client_addr = raw.recv_packet(udp, buffer)
+        except socket.timeout:
+            continue
+        stream = packet.stream_of(buffer)
+        key = (client_addr, stream) # Vários clientes (e transferências) são atendidos ao mesmo tempo
+
+        if key not in sessions:
+            if seq_num != 0 or flags & FLAG_FIN: # Resto de uma transferência já encerrada
+                continue
+            echoes[:] = [thread for thread in echoes if thread.is_alive()]
+            if len(sessions) + len(echoes) >= max_sessions:
+                print(f"Limite de {max_sessions} transferências atingido, ignorando {client_addr}")
+                continue
+            filename = bytes(data).decode('utf-8') # Recebe o arquivo enviado do client
+            print(f"Recebendo arquivo de {client_addr}: {filename}")
+
+            random_name = generate_random_name()
+            new_filename = f"{random_name}_{filename}" # Cria o novo nome do arquivo para ser enviado ao client
+            raw.send_control(udp, header, 0, 0, new_filename.encode('utf-8'), client_addr, stream)
+            sessions[key] = {
+                'filename': filename,
+                'new_filename': new_filename,
+                'data': Spool(MAX_MEMORY, budget=SPOOL_BUDGET), # Armazena os fragmentos recebidos (em disco se for grande)
+                'received': set(), # Números dos fragmentos que chegaram
+                'chunks': 0, # Fragmentos enviados pelo client, informado no FIN
+                'last_seen': now
+            }
+            continue
+
+        session = sessions[key]
+        session['last_seen'] = now
+        if seq_num == 0: # Cópia repetida do nome do arquivo
+            continue
+        if not flags & FLAG_FIN:
+            try:
+                session['data'].write_at((seq_num - 1) * buffer_size, data) # Grava o fragmento na sua posição, mesmo fora de ordem
+            except OSError as e:
+                if e.errno != errno.EFBIG:
+                    raise
+                # Fragmento além do limite: a transferência é abandonada e o resto dela, ignorado
+                del sessions[key]
+                session['data'].close()
+                print(f"Arquivo {session['filename']} de {client_addr} recusado: {e.strerror}")
+                continue
+            session['received'].add(seq_num)
+            continue
+
+        # Fim do arquivo
+        del sessions[key]
+        session['chunks'], _ = raw.FIN_SUMMARY.unpack(data)
+        raw.loss_report(f"Servidor {client_addr}", len(session['received']), session['chunks'])
+        print(f"Arquivo {session['filename']} recebido e nome alterado para {session['new_filename']}")
+
+        thread = threading.Thread(target=echo, args=(udp, session, client_addr, stream, rate),
+                                  name=f"echo-{client_addr[0]}:{client_addr[1]}/{stream}", daemon=True)
+        thread.start()
+        echoes.append(thread)
+
+if __name__ == "__main__":
+    main()
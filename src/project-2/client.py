@@ -1,99 +1,163 @@
-import socket
+import functools
+import itertools
+import json
+import os
 import random
-import time
+import socket
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import compression, fec as fec_codec, pmtu, rdt, resume, rtt
+from common.bufpool import BufferPool
+from common.chunkstore import DIGEST_SIZE, digest
 
 # Configurações
 SERVER_HOST = 'localhost'
 SERVER_PORT = 1044
-BUFFER_SIZE = 1024
-TIMEOUT = 1.0  # Tempo limite para receber ACK antes de retransmitir
-TAXA_PERDA = 0.1  # Probabilidade de perda simulada de pacotes (20%)
-
-def rdt_send(sock, data, addr, seq_num):
-    """Envia um pacote e espera pelo ACK correto antes de continuar"""
-    while True:
-        if random.random() < TAXA_PERDA:
-            print(f"[Cliente] [RDT] Simulando perda do pacote seq={seq_num}, não enviado.")
-        else:
-            packet = bytes([seq_num]) + data
-            sock.sendto(packet, addr)
-            print(f"[Cliente] [RDT] Enviado pacote seq={seq_num}, {len(data)} bytes.")
-
-        sock.settimeout(TIMEOUT)
-        try:
-            ack, _ = sock.recvfrom(10)  # Espera um pequeno ACK
-            ack_msg = ack.decode(errors='ignore')
-            if ack_msg.strip() == f"ACK{seq_num}":  # Verifica se é o ACK correto
-                print(f"[Cliente] [RDT] ACK{seq_num} recebido. Enviando próximo pacote.")
-                return  # Sai do loop e segue para o próximo pacote
-        except socket.timeout:
-            print(f"[Cliente] [RDT] Timeout esperando ACK{seq_num}, retransmitindo...")
-
-def rdt_recv(sock, expected_seq):
-    """Recebe pacotes garantindo confiabilidade e envia ACKs corretos"""
+BUFFER_SIZE = 1024  # Tamanho de dados por pacote sem sondagem, aceito por qualquer servidor
+MAX_PAYLOAD = pmtu.MAX_PAYLOAD  # Maior tamanho sondado; com BUFFER_SIZE (ou menos) não há sondagem
+WINDOW_SIZE = 8  # Pacotes em trânsito; com 1 volta ao stop-and-wait (bit alternante)
+ARQ_MODE = rdt.GBN  # rdt.GBN (Go-Back-N) ou rdt.SR (Selective Repeat)
+RESUMABLE = False  # Modo retomável: uma transferência interrompida continua de onde parou
+COMPRESSION = True  # Negocia compressão (zlib/lzma) quando os dados parecem compressíveis
+FEC = None  # (bloco, grupos): paridade XOR a cada bloco de pacotes, também na volta; ex. (8, 1)
+
+def read_chunks(f, pool):
+    """Lê o arquivo em fragmentos do tamanho dos buffers de pool"""
     while True:
-        try:
-            packet, addr = sock.recvfrom(BUFFER_SIZE + 1)  # 1 byte de seq + dados
-            seq_num = packet[0]
-            data = packet[1:]
-
-            if random.random() < TAXA_PERDA:
-                print(f"[Cliente] [RDT] Simulando perda do pacote seq={seq_num}, descartado.")
-                continue  # Ignorar pacote perdido
-
-            print(f"[Cliente] [RDT] Pacote recebido seq={seq_num}, {len(data)} bytes.")
-
-            # Verifica se o pacote é o esperado
-            if seq_num == expected_seq:
-                sock.sendto(f"ACK{seq_num}".encode('utf-8'), addr)
-                print(f"[Cliente] [RDT] ACK{seq_num} enviado.")
-                return data, addr, 1 - expected_seq  # Alterna sequência
-
-            # Se o pacote for duplicado, reenvia o último ACK
-            print(f"[Cliente] [RDT] Pacote seq={seq_num} duplicado. Reenviando último ACK.")
-            sock.sendto(f"ACK{1 - expected_seq}".encode('utf-8'), addr)
-        except socket.timeout:
-            continue  # Aguarda novamente
-
-def main():
+        buffer = pool.acquire()
+        nbytes = f.readinto(buffer)
+        if not nbytes:
+            pool.release(buffer)
+            break
+        yield memoryview(buffer)[:nbytes]
+
+def control_reply(sock, server_addr, window, stream, payload=BUFFER_SIZE):
+    """Recebe o fluxo de resposta do servidor: um JSON, com a lista 'missing' talvez repartida"""
+    linger = 2 * rtt.for_peer(server_addr).rto
+    messages = [bytes(data) for data, _ in rdt.rdt_recv(sock, server_addr, window=window, linger=linger,
+                                                          who='Cliente', bufsize=payload, stream=stream)]
+    reply = json.loads(messages[0])
+    if 'error' in reply:
+        raise RuntimeError(f"Servidor recusou a transferência: {reply['error']}")
+    return resume.join_control(reply, 'missing', iter(messages[1:]))
+
+def resumable_transfer(sock, server_addr, filename, window, mode, payload=BUFFER_SIZE, fec=None):
+    """Envia só os fragmentos que o servidor não tem e recebe só os que faltam do eco"""
+    transfer_id = resume.transfer_id(filename)
+    size = os.path.getsize(filename)
+    room = payload - fec_codec.OVERHEAD if fec else payload  # A paridade leva um cabeçalho a mais
+    chunk = room - resume.INDEX.size
+    count = resume.chunk_count(size, chunk)
+
+    # 1ª etapa: manifesto e hash de cada fragmento; o servidor responde quais ainda não tem
+    with open(filename, 'rb', buffering=0) as f:
+        digests = b''.join(digest(block) for block in iter(functools.partial(f.read, chunk), b''))
+    step = payload // DIGEST_SIZE * DIGEST_SIZE
+    stream = random.getrandbits(32)
+    manifest = resume.encode_control(resume.MANIFEST, {'id': transfer_id, 'name': filename, 'size': size, 'chunk': chunk})
+    messages = [manifest] + [digests[i:i + step] for i in range(0, len(digests), step)]
+    rdt.rdt_send(sock, messages, server_addr, window=window, mode=mode,
+                 who='Cliente', bufsize=payload, stream=stream)
+    missing = sorted(resume.from_ranges(control_reply(sock, server_addr, window, stream, payload)['missing']))
+    print(f"[Cliente] Enviando {len(missing)} de {count} fragmentos de {filename} (retomável)")
+
+    # 2ª etapa, num fluxo novo: os fragmentos que faltam e, de volta, o eco
+    echo = resume.ChunkFile(f"{filename}.{transfer_id}.part", chunk)
+    try:
+        stream = random.getrandbits(32)
+        fields = {'id': transfer_id, 'chunk': chunk, 'have': resume.to_ranges(echo.received)}
+        if fec:
+            fields['fec'] = list(fec)
+        header = resume.split_control(fields, 'have', room, resume.DATA)  # Em várias mensagens, se preciso
+        pool = BufferPool(room, window)
+        with open(filename, 'rb', buffering=0) as f:
+            upload = itertools.chain(header, resume.read_indexed(f, missing, chunk, pool))
+            rdt.rdt_send(sock, upload, server_addr, window=window, mode=mode,
+                         who='Cliente', bufsize=payload, release=pool.release, stream=stream, fec=fec)
+
+        incoming = rdt.rdt_recv(sock, server_addr, window=window, linger=2 * rtt.for_peer(server_addr).rto,
+                                who='Cliente', bufsize=payload, stream=stream)
+        echo_header = json.loads(bytes(next(incoming)[0]))
+        if 'error' in echo_header:
+            raise RuntimeError(f"Servidor recusou a transferência: {echo_header['error']}")
+        new_filename = echo_header['name']
+        print(f"[Cliente] Novo nome recebido: {new_filename} (já havia {len(echo.received)} de {count} fragmentos)")
+        for data, _ in incoming:
+            index, = resume.INDEX.unpack_from(data)
+            echo.write(index, data[resume.INDEX.size:])
+        if echo.missing(count):
+            raise RuntimeError(f"Eco incompleto: faltam {len(echo.missing(count))} fragmentos")
+        echo.finish(new_filename)
+    finally:
+        echo.close()
+    return new_filename
+
+def main(window=WINDOW_SIZE, mode=ARQ_MODE, filename=None, host=SERVER_HOST, port=SERVER_PORT,
+         resumable=RESUMABLE, compress=COMPRESSION, max_payload=MAX_PAYLOAD, fec=FEC):
+    """Envia o arquivo e recebe o eco; retorna o nome com que ele foi salvo"""
     sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    server_addr = (SERVER_HOST, SERVER_PORT)
-
-    filename = input("Nome do arquivo: ")
-
-    # Enviar nome do arquivo de forma confiável
-    print(f"[Cliente] Enviando nome do arquivo: {filename}")
-    rdt_send(sock, filename.encode('utf-8'), server_addr, 0)
-
-    # Enviar arquivo fragmentado
-    seq_num = 1
-    with open(filename, 'rb') as f:
-        while True:
-            data = f.read(BUFFER_SIZE)
-            if not data:
-                break
-            rdt_send(sock, data, server_addr, seq_num)
-            seq_num = 1 - seq_num  # Alterna sequência corretamente
-
-    # Enviar EOF
-    rdt_send(sock, b'EOF', server_addr, seq_num)
-
-    # Receber novo nome do arquivo
-    new_filename_data, _, seq_num = rdt_recv(sock, 0)
-    new_filename = new_filename_data.decode('utf-8')
+    # Resolve o host para comparar com o endereço de origem dos ACKs
+    server_addr = (socket.gethostbyname(host), port)
+
+    filename = filename or input("Nome do arquivo: ")
+    # Maior pacote que chega ao servidor e que ele aceita; sem resposta, fica em BUFFER_SIZE
+    payload = pmtu.probe(sock, server_addr, max_payload, BUFFER_SIZE)
+    if payload != BUFFER_SIZE:
+        print(f"[Cliente] Tamanho de dados por pacote: {payload} bytes")
+    pmtu.fit_buffers(sock, payload, window)
+    if fec:
+        fec = fec_codec.validate(*fec)
+    if resumable:
+        new_filename = resumable_transfer(sock, server_addr, filename, window, mode, payload, fec)
+        print(f"[Cliente] Arquivo recebido e salvo como {new_filename}")
+        sock.close()
+        return new_filename
+
+    stream = random.getrandbits(32)  # Identifica esta transferência no servidor
+
+    # Nome do arquivo e fragmentos seguem no mesmo fluxo com janela deslizante, encerrado por um FIN
+    # Cada buffer volta ao pool quando o fragmento é confirmado (no máximo window em uso)
+    room = payload - fec_codec.OVERHEAD if fec else payload  # A paridade leva um cabeçalho a mais
+    pool = BufferPool(room, window)
+    with open(filename, 'rb', buffering=0) as f:
+        chunks = read_chunks(f, pool)
+        codec = compression.NONE
+        options = {}  # Seguem junto do nome e valem também para o eco
+        if compress:
+            # A entropia de uma amostra decide se vale comprimir; o nome leva o codec e os aceitos
+            codec = compression.choose(compression.sample(f, os.fstat(f.fileno()).st_size))
+            options.update(codec=codec, accept=compression.available())
+            if codec != compression.NONE:
+                blocks = iter(functools.partial(f.read, compression.BLOCK_SIZE), b'')
+                chunks = compression.compress_chunks(blocks, codec, room)
+        if room != BUFFER_SIZE:
+            options['payload'] = room
+        if fec:
+            options['fec'] = list(fec)
+        first = compression.with_options(filename, **options) if options else filename.encode('utf-8')
+        print(f"[Cliente] Enviando arquivo {filename} (janela={window}, modo={mode}, codec={codec}, fec={fec})")
+        rdt.rdt_send(sock, itertools.chain([first], chunks), server_addr, window=window, mode=mode,
+                     who='Cliente', bufsize=payload, release=pool.release, stream=stream, fec=fec)
+
+    # Receber o arquivo de volta: primeiro o novo nome, depois os fragmentos
+    incoming = rdt.rdt_recv(sock, server_addr, window=window, linger=2 * rtt.for_peer(server_addr).rto,
+                            who='Cliente', bufsize=payload, stream=stream)
+    new_filename_data, _ = next(incoming)
+    new_filename, options = compression.split_options(new_filename_data)
+    if 'error' in options:
+        raise RuntimeError(f"Servidor recusou a transferência: {options['error']}")
     print(f"[Cliente] Novo nome recebido: {new_filename}")
 
-    # **Garantir que os pacotes de volta sejam recebidos corretamente**
+    decompressor = compression.decompressor(options.get('codec', compression.NONE))
     with open(new_filename, 'wb') as f:
-        seq_num = 0  # Reiniciar sequência para recepção
-        while True:
-            data, _, seq_num = rdt_recv(sock, seq_num)
-            if data == b'EOF':
-                break
-            f.write(data)
+        for data, _ in incoming:
+            f.write(decompressor.decompress(data))
+        f.write(decompressor.flush())
 
     print(f"[Cliente] Arquivo recebido e salvo como {new_filename}")
     sock.close()
+    return new_filename
 
 if __name__ == "__main__":
     main()
@@ -1,99 +1,281 @@
+import errno
+import functools
+import itertools
+import json
+import os
 import socket
 import random
 import string
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import compression, fec as fec_codec, log, metrics, pmtu, rdt, resume
+from common.bufpool import BufferPool
+from common.chunkstore import DIGEST_SIZE, ChunkStore
+from common.sessions import SessionTable
+from common.spool import Spool
 
 # Configurações
 HOST = 'localhost'
 PORT = 1044
-BUFFER_SIZE = 1024
-TIMEOUT = 1.0
-TAXA_PERDA = 0.1  # Simulação de perda de pacotes
+BUFFER_SIZE = 1024  # Tamanho de dados por pacote de clientes que não sondam
+MAX_PAYLOAD = pmtu.MAX_PAYLOAD  # Maior tamanho de dados por pacote aceito na sondagem
+WINDOW_SIZE = 8  # Pacotes em trânsito; com 1 volta ao stop-and-wait (bit alternante)
+ARQ_MODE = rdt.GBN  # rdt.GBN (Go-Back-N) ou rdt.SR (Selective Repeat)
+MAX_MEMORY = 1024 * 1024  # Por sessão: acima disso o arquivo recebido vai para um arquivo temporário
+SPOOL_BUDGET = 256 * 1024 * 1024  # Por sessão: maior arquivo recebido (memória e disco); limita a janela anunciada
+MAX_SESSIONS = 16  # Transferências atendidas ao mesmo tempo
+STATS_PORT = None  # Porta UDP local que responde com as métricas em JSON (None desativa)
+STATS_FILE = None  # Arquivo reescrito periodicamente com as métricas (None desativa)
+TRANSFER_DIR = 'transfers'  # Manifestos das transferências retomáveis em andamento
+TRANSFER_TTL = 24 * 3600  # Segundos até apagar uma transferência retomável abandonada
+STORE_DIR = 'chunks'  # Fragmentos das transferências retomáveis, endereçados pelo conteúdo
+STORE_BUDGET = 256 * 1024 * 1024  # Bytes de fragmentos guardados para deduplicar envios repetidos
+
+_transfers_lock = threading.Lock()  # Protege os manifestos e as referências que eles seguram
+_store = None  # ChunkStore, aberto na primeira transferência retomável
+_store_lock = threading.Lock()
+
+logger = log.get_logger('server')
 
 def generate_random_name(length=5):
     """Gera um nome aleatório para o arquivo"""
     return ''.join(random.choices(string.ascii_letters, k=length))
 
-def rdt_send(sock, data, addr, seq_num):
-    """Envia um pacote e espera pelo ACK correto"""
-    while True:
-        if random.random() < TAXA_PERDA:
-            print(f"[Servidor] [RDT] Simulando perda do pacote seq={seq_num}, não enviado.")
-        else:
-            packet = bytes([seq_num]) + data
-            sock.sendto(packet, addr)
-            print(f"[Servidor] [RDT] Enviado pacote seq={seq_num}, {len(data)} bytes.")
+def transfer_path(transfer_id):
+    return os.path.join(TRANSFER_DIR, f"{transfer_id}.json")
 
-        sock.settimeout(TIMEOUT)
-        try:
-            ack, _ = sock.recvfrom(10)
-            ack_msg = ack.decode(errors='ignore').strip()
-            if ack_msg == f"ACK{seq_num}":
-                print(f"[Servidor] [RDT] ACK{seq_num} recebido. Prosseguindo...")
-                return
-        except socket.timeout:
-            print(f"[Servidor] [RDT] Timeout esperando ACK{seq_num}, retransmitindo...")
-
-def rdt_recv(sock, expected_seq):
-    """Recebe pacotes garantindo confiabilidade e envia ACKs corretos"""
-    while True:
-        try:
-            packet, addr = sock.recvfrom(BUFFER_SIZE + 1)  # 1 byte de seq + dados
-            seq_num = packet[0]
-            data = packet[1:]
+def load_transfer(transfer_id):
+    """Manifesto salvo de uma transferência retomável, ou None"""
+    if not resume.valid_id(transfer_id) or not os.path.exists(transfer_path(transfer_id)):
+        return None
+    with open(transfer_path(transfer_id)) as f:
+        return json.load(f)
 
-            if random.random() < TAXA_PERDA:
-                print(f"[Servidor] [RDT] Simulando perda do pacote seq={seq_num}, descartado.")
-                continue  # Ignorar pacote perdido
+def save_transfer(transfer_id, transfer):
+    os.makedirs(TRANSFER_DIR, exist_ok=True)
+    partial = f"{transfer_path(transfer_id)}.tmp"
+    with open(partial, 'w') as f:
+        json.dump(transfer, f)
+    os.replace(partial, transfer_path(transfer_id))
 
-            print(f"[Servidor] [RDT] Pacote recebido seq={seq_num}, {len(data)} bytes.")
+def load_transfers(store, ttl=TRANSFER_TTL):
+    """Refaz as referências das transferências em andamento e apaga as paradas há mais de ttl segundos"""
+    if not os.path.isdir(TRANSFER_DIR):
+        return
+    now = time.time()
+    for name in os.listdir(TRANSFER_DIR):
+        path = os.path.join(TRANSFER_DIR, name)
+        if not name.endswith('.json') or now - os.path.getmtime(path) > ttl:
+            os.remove(path)
+            continue
+        with open(path) as f:
+            store.retain(json.load(f)['hashes'])
 
-            # Verifica se o pacote é o esperado
-            if seq_num == expected_seq:
-                sock.sendto(f"ACK{seq_num}".encode('utf-8'), addr)
-                print(f"[Servidor] [RDT] ACK{seq_num} enviado.")
-                return data, addr, 1 - expected_seq  # Alterna sequência
+def open_store():
+    """Abre o armazenamento de fragmentos na primeira vez; até lá, STORE_DIR nem é criado"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = ChunkStore(STORE_DIR, STORE_BUDGET)
+            load_transfers(_store)
+        return _store
 
-            # Se o pacote for duplicado, reenvia o último ACK
-            print(f"[Servidor] [RDT] Pacote seq={seq_num} duplicado. Reenviando último ACK.")
-            sock.sendto(f"ACK{1 - expected_seq}".encode('utf-8'), addr)
-        except socket.timeout:
-            continue  # Aguarda novamente
+def handle_transfer(sock, client_addr, stream, window=WINDOW_SIZE, mode=ARQ_MODE, open_store=None):
+    """Recebe um arquivo de um cliente e o devolve com novo nome (uma sessão)
 
-def main():
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((HOST, PORT))
-    print(f"[Servidor] Escutando em {HOST}:{PORT}")
+    open_store() retorna o armazenamento do modo retomável; sem ela, o modo é recusado.
+    """
+    who = f"Servidor {client_addr[0]}:{client_addr[1]}"
+    limit = sock.max_payload  # Maior pacote sondado pelo cliente
+    file_data = None  # Spool do modo simples, criado depois do nome
+
+    def capacity():
+        """Pacotes que a sessão ainda aceita: lugar na fila e, no modo simples, no orçamento do spool"""
+        free = sock.capacity()
+        if file_data is not None:
+            free = min(free, file_data.free() // limit)
+        return free
 
-    while True:
-        # Receber nome do arquivo
-        filename_data, client_addr, seq_num = rdt_recv(sock, 0)
-        filename = filename_data.decode('utf-8')
-        print(f"[Servidor] Recebendo arquivo: {filename}")
+    incoming = rdt.rdt_recv(sock, client_addr, window=window, who=who, bufsize=limit, stream=stream,
+                            capacity=capacity)
+    first, _ = next(incoming)
+    first = bytes(first)
+    send = functools.partial(rdt.rdt_send, sock, addr=client_addr, window=window, mode=mode, who=who,
+                             bufsize=limit, stream=stream, ack_stray=True)
+    manifest = resume.decode_control(resume.MANIFEST, first)
+    if manifest is not None:
+        store = open_store() if open_store is not None else None
+        return answer_manifest(manifest, incoming, send, who, store, limit)
+    header = resume.decode_control(resume.DATA, first)
+    if header is not None:
+        store = open_store() if open_store is not None else None
+        return receive_missing(header, incoming, send, who, window, store, limit)
 
-        # Receber arquivo na memória
-        file_data = []
-        while True:
-            data, _, seq_num = rdt_recv(sock, seq_num)
-            if data == b'EOF':
-                break
-            file_data.append(data)
+    # Clientes que negociam compressão mandam, junto do nome, o codec usado e os aceitos
+    filename, options = compression.split_options(first)
+    codec = options.get('codec', compression.NONE)
+    error = None
+    if codec != compression.NONE and codec not in compression.available():
+        error = f"codec {codec} não suportado"
+    try:
+        fec = fec_codec.validate(*options['fec']) if 'fec' in options else None
+    except (TypeError, ValueError) as e:
+        error = str(e)
+    payload = options.get('payload', min(BUFFER_SIZE, limit))  # Tamanho dos pacotes do eco
+    if type(payload) is not int or not 1 <= payload <= limit:
+        error = f"tamanho de pacote inválido: {payload!r} (de 1 a {limit})"
+    if error is not None:
+        for _ in incoming:
+            pass
+        send([compression.with_options(filename, error=error)])
+        return
+    logger.info("[%s] Recebendo arquivo: %s (codec=%s, pacotes de %d bytes)", who, filename, codec, payload)
+
+    with Spool(MAX_MEMORY, budget=SPOOL_BUDGET) as file_data:
+        # Receber arquivo, gravando os fragmentos à medida que chegam
+        decompressor = compression.decompressor(codec)
+        received = 0
+        try:
+            for data, _ in incoming:
+                received += len(data)
+                file_data.write(decompressor.decompress(data))
+            file_data.write(decompressor.flush())
+        except OSError as e:
+            if e.errno != errno.EFBIG:
+                raise  # Conexão abortada e afins encerram a sessão (SessionTable registra)
+            error = e.strerror  # Arquivo maior que o spool
+        except compression.DECOMPRESS_ERRORS as e:
+            error = f"dados comprimidos inválidos ({codec}): {e}"
+        if error is not None:
+            # Descarta o resto e recusa, como nas opções inválidas
+            logger.warning("[%s] Arquivo %s recusado: %s", who, filename, error)
+            for _ in incoming:
+                pass
+            send([compression.with_options(filename, error=error)])
+            return
 
-        print(f"[Servidor] Arquivo {filename} recebido e armazenado na memória.")
+        where = "em disco" if file_data.on_disk else "na memória"
+        logger.info("[%s] Arquivo %s recebido e armazenado %s (%d bytes, %d pela rede).",
+                    who, filename, where, file_data.size, received)
 
         # Gerar nome aleatório para o arquivo
         new_filename = generate_random_name() + "_" + filename
-        rdt_send(sock, new_filename.encode('utf-8'), client_addr, 0)
 
         # **Garantir que o arquivo de volta seja enviado corretamente**
-        seq_num = 0  # Reiniciar sequência para o envio
+        chunks = file_data.chunks(payload)
+        if options:
+            # Os dados são os mesmos da ida: vale a mesma decisão, se o cliente aceitar o codec
+            echo_codec = codec if codec in options.get('accept', []) else compression.NONE
+            header = compression.with_options(new_filename, codec=echo_codec)
+            chunks = compression.compress_chunks(chunks, echo_codec, payload)
+        else:
+            header = new_filename.encode('utf-8')
+        rdt.rdt_send(sock, itertools.chain([header], chunks), client_addr, window=window, mode=mode,
+                     who=who, bufsize=limit, stream=stream, ack_stray=True, fec=fec)
+        logger.info("[%s] Arquivo %s enviado de volta ao cliente.", who, new_filename)
+
+def answer_manifest(manifest, incoming, send, who, store, limit=BUFFER_SIZE):
+    """Modo retomável, 1ª etapa: recebe os hashes dos fragmentos e informa quais o servidor não tem"""
+    digests = bytearray()
+    for data, _ in incoming:
+        digests += data  # Os hashes seguem o manifesto, DIGEST_SIZE bytes por fragmento
+    transfer_id = manifest.get('id')
+    count = resume.chunk_count(manifest['size'], manifest['chunk'])
+    if (store is None or not resume.valid_id(transfer_id) or len(digests) != count * DIGEST_SIZE
+            or manifest['chunk'] + resume.INDEX.size > limit):
+        send([json.dumps({'error': "manifesto inválido"}).encode('utf-8')])
+        return
+    hashes = [digests[i:i + DIGEST_SIZE].hex() for i in range(0, len(digests), DIGEST_SIZE)]
+
+    with _transfers_lock:
+        transfer = load_transfer(transfer_id)
+        if transfer is None or transfer['hashes'] != hashes:
+            if transfer is not None:
+                store.release(transfer['hashes'])
+            store.retain(hashes)  # Os fragmentos ficam no armazenamento até o fim da transferência
+            transfer = {'name': manifest['name'], 'size': manifest['size'],
+                        'chunk': manifest['chunk'], 'hashes': hashes}
+        save_transfer(transfer_id, transfer)
+    missing = [index for index, key in enumerate(hashes) if key not in store]
+    if len(missing) < count:
+        logger.info("[%s] %s: %d de %d fragmentos já estão no servidor.",
+                    who, manifest['name'], count - len(missing), count)
+    send(resume.split_control({'missing': resume.to_ranges(missing)}, 'missing', limit))
+
+def receive_missing(header, incoming, send, who, window, store, limit=BUFFER_SIZE):
+    """Modo retomável, 2ª etapa: recebe os fragmentos que faltavam e devolve os que o cliente não tem"""
+    # A lista 'have' pode vir repartida nas mensagens seguintes ao cabeçalho
+    resume.join_control(header, 'have', (data for data, _ in incoming))
+    transfer_id = header.get('id')
+    transfer = load_transfer(transfer_id) if store is not None else None
+    if transfer is None:
+        for _ in incoming:
+            pass
+        send([json.dumps({'error': "transferência desconhecida"}).encode('utf-8')])
+        return
+
+    try:
+        fec = fec_codec.validate(*header['fec']) if 'fec' in header else None
+    except (TypeError, ValueError) as e:
+        for _ in incoming:
+            pass
+        send([json.dumps({'error': str(e)}).encode('utf-8')])
+        return
+    filename, size, hashes = transfer['name'], transfer['size'], transfer['hashes']
+    logger.info("[%s] Recebendo arquivo: %s (retomável)", who, filename)
+    for data, _ in incoming:
+        index, = resume.INDEX.unpack_from(data)
+        # O armazenamento confere o conteúdo com o hash do manifesto
+        if index >= len(hashes) or not store.put(hashes[index], data[resume.INDEX.size:]):
+            logger.warning("[%s] Fragmento %d de %s não confere com o manifesto.", who, index, filename)
 
-        for chunk in file_data:
-            rdt_send(sock, chunk, client_addr, seq_num)
-            seq_num = 1 - seq_num  # Alternar sequência
+    missing = [index for index, key in enumerate(hashes) if key not in store]
+    if missing:
+        logger.warning("[%s] Arquivo %s incompleto: faltam %d fragmentos.", who, filename, len(missing))
+        send(resume.split_control({'error': "fragmentos faltando", 'missing': resume.to_ranges(missing)},
+                                  'missing', limit))
+        return
+    logger.info("[%s] Arquivo %s recebido (%d bytes).", who, filename, size)
+
+    # O novo nome fica no manifesto, para que uma devolução retomada use o mesmo
+    with _transfers_lock:
+        transfer = load_transfer(transfer_id) or transfer
+        new_filename = transfer.setdefault('new_name', generate_random_name() + "_" + filename)
+        save_transfer(transfer_id, transfer)
+
+    # A devolução sai direto do armazenamento, só com os fragmentos que o cliente não tem
+    have = resume.from_ranges(header['have'])
+    pool = BufferPool(resume.INDEX.size + transfer['chunk'], window)
+    echo_header = json.dumps({'name': new_filename, 'size': size}).encode('utf-8')
+    chunks = resume.read_stored(store, hashes, [i for i in range(len(hashes)) if i not in have], pool)
+    send(itertools.chain([echo_header], chunks), release=pool.release, fec=fec)
+    logger.info("[%s] Arquivo %s enviado de volta ao cliente.", who, new_filename)
+
+    with _transfers_lock:
+        if os.path.exists(transfer_path(transfer_id)):
+            os.remove(transfer_path(transfer_id))
+            store.release(hashes)
+
+def main(window=WINDOW_SIZE, mode=ARQ_MODE, max_sessions=MAX_SESSIONS, host=HOST, port=PORT,
+         stats_port=STATS_PORT, stats_file=STATS_FILE):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.bind((host, port))
+    pmtu.fit_buffers(sock, MAX_PAYLOAD, window)
+    if stats_port is not None:
+        metrics.serve((host, stats_port))
+        logger.info("[Servidor] Métricas em udp://%s:%d", host, stats_port)
+    if stats_file is not None:
+        metrics.dump_every(stats_file)
+    logger.info("[Servidor] Escutando em %s:%d (janela=%d, modo=%s, até %d transferências)",
+                host, port, window, mode, max_sessions)
 
-        # Enviar EOF para sinalizar fim da transmissão
-        rdt_send(sock, b'EOF', client_addr, seq_num)
-        print(f"[Servidor] Arquivo {new_filename} enviado de volta ao cliente.")
+    # Cada transferência (endereço, fluxo) roda em paralelo na sua própria sessão
+    handler = functools.partial(handle_transfer, window=window, mode=mode, open_store=open_store)
+    table = SessionTable(sock, handler, max_sessions=max_sessions, bufsize=MAX_PAYLOAD)
+    table.serve_forever()
 
 if __name__ == "__main__":
     main()
@@ -1,40 +1,57 @@
+import os
 import socket
+import sys
 import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import packet, rtt
+from common.packet import FLAG_ACK, HEADER
 
 SERVER_HOST = 'localhost'
 SERVER_PORT = 1044
 BUFFER_SIZE = 1024
-TIMEOUT = 0.2
 
 disconnected = threading.Event()
 
 def rdt_send(sock, data, addr, seq_num):
+    estimator = rtt.for_peer(addr)
+    attempts = 0
     while True:
-        packet = bytes([seq_num]) + data
-        sock.sendto(packet, addr)
-        sock.settimeout(TIMEOUT)
+        sock.sendto(packet.encode(0, seq_num, data), addr)
+        sent_at = time.monotonic()
+        attempts += 1
+        sock.settimeout(estimator.rto)
         try:
-            ack, _ = sock.recvfrom(10)
-            ack_msg = ack.decode(errors='ignore').strip()
-            if ack_msg == f"ACK{seq_num}":
+            ack, _ = sock.recvfrom(BUFFER_SIZE + HEADER.size)
+            decoded = packet.decode(ack)
+            if decoded is not None and decoded[0] & FLAG_ACK and decoded[1] == seq_num:
+                # Karn: só amostra o RTT se o pacote não foi retransmitido
+                if attempts == 1:
+                    estimator.sample(time.monotonic() - sent_at)
+                else:
+                    estimator.acked()
                 return
         except socket.timeout:
+            estimator.backoff()
             continue
 
 def rdt_recv(sock, expected_seq, server_addr):
     """Recebe pacotes APENAS do servidor especificado"""
     while True:
         try:
-            packet, addr = sock.recvfrom(BUFFER_SIZE + 1)
+            datagram, addr = sock.recvfrom(BUFFER_SIZE + HEADER.size)
             if (addr[0] != server_addr[0]) or (addr[1] != server_addr[1]):
                 continue
-            seq_num = packet[0]
-            data = packet[1:]
+            decoded = packet.decode(datagram)
+            if decoded is None or decoded[0] & FLAG_ACK:
+                continue  # Corrompido ou ACK atrasado
+            _, seq_num, data = decoded
             if seq_num == expected_seq:
-                sock.sendto(f"ACK{seq_num}".encode(), addr)
+                sock.sendto(packet.ack(seq_num), addr)
                 return data, addr, 1 - expected_seq
             else:
-                sock.sendto(f"ACK{1 - expected_seq}".encode(), addr)
+                sock.sendto(packet.ack(1 - expected_seq), addr)
         except socket.timeout:
             continue
 
@@ -0,0 +1,263 @@
+"""Despachante de eventos do servidor de chat: um único leitor para o socket UDP.
+
+Os datagramas são separados por endereço em sessões. Cada sessão guarda o estado
+RDT (bit alternante) nos dois sentidos e uma fila de saída: enviar nunca bloqueia
+o laço, a próxima mensagem de um cliente só parte quando a anterior é confirmada,
+e os ACKs chegam sempre à sessão certa.
+
+A fila de saída de cada cliente tem no máximo max_outbox mensagens, para que um
+cliente lento ou sumido não acumule memória sem limite. Com a fila cheia, a política
+overflow decide: DROP descarta a mensagem nova, COALESCE a junta à última da fila
+(separadas por uma quebra de linha) se as duas couberem num pacote, e senão a
+descarta, e DISCONNECT encerra a sessão. As mensagens de uma sessão descartada
+ficam em session.unsent para quem trata on_close.
+"""
+import heapq
+import itertools
+import selectors
+import time
+from collections import deque
+
+from common import log, metrics, packet, rtt
+from common.packet import FLAG_ACK, HEADER
+
+BUFFER_SIZE = 1024
+MAX_RETRIES = 10  # Tentativas antes de considerar o cliente desconectado
+READ_BATCH = 64  # Datagramas lidos por evento antes de voltar aos timers
+MAX_OUTBOX = 256  # Mensagens na fila de saída de cada cliente
+
+# Políticas para a fila de saída cheia
+DROP = 'drop'
+COALESCE = 'coalesce'
+DISCONNECT = 'disconnect'
+
+logger = log.get_logger('dispatcher')  # Eventos por pacote em DEBUG, fora do caminho do laço
+
+class Session:
+    """Estado de um cliente: RDT nos dois sentidos e dados da aplicação"""
+
+    def __init__(self, addr):
+        self.addr = addr
+        self.user = None  # Definido após o login
+        self.expected_seq = 0
+        self.send_seq = 0
+        self.outbox = deque()  # (mensagem, on_done) aguardando a vez de serem enviadas
+        self.inflight = None  # Pacote enviado e ainda não confirmado
+        self.inflight_done = None  # Callback de entrega do pacote em trânsito
+        self.sent_at = 0.0
+        self.attempts = 0
+        self.timer = None  # Identificador do timer de retransmissão ativo
+        self.closing = False  # Encerrar assim que a fila de saída esvaziar
+        self.unsent = []  # Mensagens não entregues, preenchido quando a sessão é descartada
+        self.estimator = rtt.for_peer(addr)
+        self.metrics = metrics.for_peer(addr)
+        self.metrics.gauges['outbox'] = self.outbox.__len__
+
+class Dispatcher:
+    """Laço de eventos: lê o socket, entrega mensagens e dispara retransmissões"""
+
+    def __init__(self, sock, on_message, on_close, max_outbox=MAX_OUTBOX, overflow=COALESCE):
+        self.sock = sock
+        self.sock.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(sock, selectors.EVENT_READ)
+        self.sessions = {}  # endereço -> Session
+        self.timers = []  # heap de (prazo, identificador, sessão)
+        self._timer_ids = itertools.count()
+        self.on_message = on_message  # on_message(session, data)
+        self.on_close = on_close  # on_close(session), quando a sessão é descartada
+        self.max_outbox = max_outbox
+        self.overflow = overflow
+
+    def send(self, addr, data, on_done=None):
+        """Enfileira uma mensagem confiável para addr; retorna False se não há sessão
+        ou se a fila cheia a descartou
+
+        on_done(True) é chamado quando o ACK chega e on_done(False) se a mensagem for
+        descartada ou a sessão encerrada antes disso.
+        """
+        session = self.sessions.get(addr)
+        if session is None:
+            return False
+        if len(session.outbox) >= self.max_outbox:
+            return self._overflow(session, data, on_done)
+        session.outbox.append((data, on_done))
+        if session.inflight is None:
+            self._transmit_next(session)
+        return True
+
+    def watch(self, fileobj, callback, events=selectors.EVENT_READ):
+        """Chama callback() quando fileobj estiver pronto, no mesmo laço do socket UDP"""
+        self.selector.register(fileobj, events, callback)
+
+    def unwatch(self, fileobj):
+        self.selector.unregister(fileobj)
+
+    def close(self, session):
+        """Descarta a sessão depois de entregar o que ainda está na fila"""
+        session.closing = True
+        if session.inflight is None and not session.outbox:
+            self._drop(session)
+
+    def run_forever(self):
+        while True:
+            self.run_once()
+
+    def run_once(self):
+        """Espera por datagramas até o próximo timer e processa o que houver"""
+        timeout = None
+        if self.timers:
+            timeout = max(0.0, self.timers[0][0] - time.monotonic())
+        for key, _ in self.selector.select(timeout):
+            if key.fileobj is self.sock:
+                self._read_datagrams()
+            else:
+                key.data()
+        self._fire_timers()
+
+    def _read_datagrams(self):
+        for _ in range(READ_BATCH):
+            try:
+                datagram, addr = self.sock.recvfrom(BUFFER_SIZE + HEADER.size)
+            except BlockingIOError:
+                return
+            except OSError as e:
+                logger.error("[Servidor] Erro de socket: %s", e)
+                return
+            decoded = packet.decode(datagram)
+            if decoded is not None:
+                self._on_datagram(decoded, addr)
+            elif addr in self.sessions:  # Pacotes corrompidos são descartados aqui
+                self.sessions[addr].metrics.corrupted += 1
+
+    def _on_datagram(self, decoded, addr):
+        flags, seq_num, data = decoded
+        session = self.sessions.get(addr)
+        if flags & FLAG_ACK:
+            if session is not None:
+                self._on_ack(session, seq_num)
+            return
+
+        if session is None:
+            if seq_num != 0:
+                # Retransmissão de uma sessão já encerrada: só confirma
+                self.sock.sendto(packet.ack(seq_num), addr)
+                return
+            session = self.sessions[addr] = Session(addr)
+            logger.info("[Servidor] Novo cliente conectado: %s", addr)
+
+        logger.debug("[Servidor] [RDT] Recebido seq=%d de %s", seq_num, addr)
+        session.metrics.packets_in += 1
+        session.metrics.bytes_in += len(data)
+        session.metrics.acks_out += 1
+        if seq_num == session.expected_seq:
+            self.sock.sendto(packet.ack(seq_num), addr)
+            session.expected_seq = 1 - seq_num
+            if not session.closing:
+                self.on_message(session, data)
+        else:
+            session.metrics.duplicates += 1
+            self.sock.sendto(packet.ack(1 - session.expected_seq), addr)
+
+    def _on_ack(self, session, ack_num):
+        if session.inflight is None or ack_num != session.send_seq:
+            return
+        logger.debug("[Servidor] [RDT] ACK%d recebido de %s", session.send_seq, session.addr)
+        session.metrics.acks_in += 1
+        # Karn: só amostra o RTT se o pacote não foi retransmitido
+        if session.attempts == 1:
+            sample = time.monotonic() - session.sent_at
+            session.estimator.sample(sample)
+            session.metrics.rtt.observe(sample)
+        else:
+            session.estimator.acked()
+        session.send_seq = 1 - session.send_seq
+        on_done = session.inflight_done
+        session.inflight = session.inflight_done = None
+        session.timer = None
+        self._transmit_next(session)
+        if on_done is not None:
+            on_done(True)
+
+    def _transmit_next(self, session):
+        if not session.outbox:
+            if session.closing:
+                self._drop(session)
+            return
+        data, session.inflight_done = session.outbox.popleft()
+        session.inflight = packet.encode(0, session.send_seq, data)
+        session.attempts = 0
+        self._transmit(session)
+
+    def _transmit(self, session):
+        self.sock.sendto(session.inflight, session.addr)
+        logger.debug("[Servidor] [RDT] Enviado seq=%d para %s", session.send_seq, session.addr)
+        session.metrics.packets_out += 1
+        session.metrics.bytes_out += len(session.inflight) - HEADER.size
+        if session.attempts:
+            session.metrics.retransmissions += 1
+        session.sent_at = time.monotonic()
+        session.attempts += 1
+        session.timer = next(self._timer_ids)
+        heapq.heappush(self.timers, (session.sent_at + session.estimator.rto, session.timer, session))
+
+    def _fire_timers(self):
+        now = time.monotonic()
+        while self.timers and self.timers[0][0] <= now:
+            _, timer, session = heapq.heappop(self.timers)
+            if session.timer != timer:
+                continue  # Timer cancelado por um ACK
+            logger.debug("[Servidor] [RDT] Timeout esperando ACK%d de %s (RTO=%.3fs)",
+                         session.send_seq, session.addr, session.estimator.rto)
+            session.estimator.backoff()
+            session.metrics.timeouts += 1
+            if session.attempts >= MAX_RETRIES:
+                logger.warning("[Servidor] Cliente %s não responde, encerrando sessão.", session.addr)
+                self._drop(session)
+                continue
+            self._transmit(session)
+
+    def _overflow(self, session, data, on_done):
+        """Aplica a política de fila cheia; retorna True se a mensagem entrou na fila"""
+        if self.overflow == COALESCE and session.outbox:
+            last, last_done = session.outbox[-1]
+            if len(last) + 1 + len(data) <= BUFFER_SIZE:
+                session.outbox[-1] = (last + b'\n' + data, _chain(last_done, on_done))
+                session.metrics.coalesced += 1
+                return True
+        session.metrics.queue_drops += 1
+        if self.overflow == DISCONNECT:
+            logger.warning("[Servidor] Fila de saída de %s cheia, encerrando sessão.", session.addr)
+            session.outbox.append((data, on_done))  # Vai para session.unsent com as demais
+            self._drop(session)
+        else:
+            logger.debug("[Servidor] Fila de saída de %s cheia, mensagem descartada.", session.addr)
+            if on_done is not None:
+                on_done(False)
+        return False
+
+    def _drop(self, session):
+        if self.sessions.get(session.addr) is not session:
+            return
+        del self.sessions[session.addr]
+        session.metrics.gauges.pop('outbox', None)
+        session.timer = None
+        pending = [session.inflight_done] + [on_done for _, on_done in session.outbox]
+        session.unsent = [data for data, _ in session.outbox]
+        if session.inflight is not None:
+            session.unsent.insert(0, session.inflight[HEADER.size:])
+        session.inflight = session.inflight_done = None
+        session.outbox.clear()
+        self.on_close(session)
+        for on_done in pending:
+            if on_done is not None:
+                on_done(False)
+
+def _chain(first, second):
+    """Um callback de entrega que chama os dois (mensagens coalescidas)"""
+    if first is None or second is None:
+        return first or second
+    def on_done(ok):
+        first(ok)
+        second(ok)
+    return on_done
@@ -0,0 +1,45 @@
+"""Distribuição de uma mensagem para vários destinatários (grupos e notificações).
+
+A mensagem é codificada uma única vez e enfileirada na sessão de cada destinatário;
+as entregas avançam em paralelo, cada uma no ritmo dos ACKs do seu cliente, e um
+membro que não responde só afeta a própria contagem (a sessão dele é descartada após
+dispatcher.MAX_RETRIES tentativas).
+"""
+
+class FanOut:
+    """Acompanha a entrega de uma mensagem a vários destinatários"""
+
+    def __init__(self, total, on_complete=None):
+        self.total = total
+        self.delivered = 0
+        self.failed = 0
+        self.on_complete = on_complete  # on_complete(fanout), quando todas terminarem
+        if total == 0:
+            self._finish()
+
+    def done(self, ok, count=1):
+        """Registra o resultado de uma entrega (ou de count, vindas de outro worker)"""
+        if not count:
+            return
+        if ok:
+            self.delivered += count
+        else:
+            self.failed += count
+        if self.delivered + self.failed == self.total:
+            self._finish()
+
+    def _finish(self):
+        if self.on_complete is not None:
+            self.on_complete(self)
+
+def fan_out(dispatcher, addrs, data, on_complete=None, remote=0):
+    """Enfileira data para cada endereço e retorna o FanOut que acompanha as entregas
+
+    remote conta as entregas feitas por outros workers (shards), informadas depois
+    com fanout.done(ok, count).
+    """
+    addrs = [addr for addr in addrs if addr in dispatcher.sessions]
+    fanout = FanOut(len(addrs) + remote, on_complete)
+    for addr in addrs:
+        dispatcher.send(addr, data, on_done=fanout.done)
+    return fanout
@@ -0,0 +1,169 @@
+"""Persistência do estado social do chat: log de mudanças (WAL) e snapshots.
+
+Cada mudança aplicada ao ChatState (state.CHANGES) vira um registro no final de
+journal-<geração>.log: tamanho e CRC32 (RECORD) seguidos de [mudança, argumentos] em
+JSON. Os registros se acumulam em memória e uma thread os grava com um único fsync a
+cada COMMIT_INTERVAL (group commit): uma queda perde no máximo esse intervalo.
+
+A cada SNAPSHOT_EVERY registros o estado inteiro vai para snapshot.json (arquivo
+temporário, fsync e rename atômico), que passa a apontar para um log novo, vazio; o
+log antigo é apagado. Na partida, load() lê o snapshot e reaplica só o log da geração
+dele, então o tempo de partida depende do tamanho do estado, não da idade do log. Um
+registro incompleto ou corrompido no fim do log (queda durante a escrita) encerra a
+leitura e é cortado do arquivo.
+"""
+import json
+import os
+import struct
+import threading
+import time
+import zlib
+from collections import deque
+
+from common import log
+
+COMMIT_INTERVAL = 0.01  # Segundos entre fsyncs; registros do intervalo saem juntos
+SNAPSHOT_EVERY = 10000  # Registros no log antes de compactá-lo num snapshot
+RECORD = struct.Struct('!II')  # Tamanho e CRC32 do JSON do registro
+
+logger = log.get_logger('journal')
+
+class Journal:
+    """Log de mudanças e snapshots de um ChatState num diretório"""
+
+    def __init__(self, directory, state, commit_interval=COMMIT_INTERVAL, snapshot_every=SNAPSHOT_EVERY):
+        self.directory = directory
+        self.state = state
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        self.generation = 0
+        self.records = 0  # Registros no log da geração atual
+        self._valid = 0  # Bytes válidos do log lido por load()
+        self._pending = deque()  # Registros à espera do próximo commit
+        self._file = None
+        self._thread = None
+        self._lock = threading.Lock()  # Um commit por vez: a thread ou close()
+        os.makedirs(directory, exist_ok=True)
+
+    def _log_path(self, generation):
+        return os.path.join(self.directory, f"journal-{generation}.log")
+
+    @property
+    def _snapshot_path(self):
+        return os.path.join(self.directory, 'snapshot.json')
+
+    def load(self):
+        """Restaura o estado do snapshot e do log da geração dele; retorna os registros reaplicados"""
+        started = time.monotonic()
+        try:
+            with open(self._snapshot_path, 'rb') as f:
+                snapshot = json.load(f)
+        except FileNotFoundError:
+            snapshot = None
+        if snapshot is not None:
+            self.generation = snapshot['generation']
+            self.state.restore(snapshot['state'])
+        self.records = self._valid = 0
+        try:
+            with open(self._log_path(self.generation), 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            data = b''
+        offset = 0
+        while offset + RECORD.size <= len(data):
+            length, crc = RECORD.unpack_from(data, offset)
+            body = data[offset + RECORD.size:offset + RECORD.size + length]
+            if len(body) < length or zlib.crc32(body) != crc:
+                break  # Registro incompleto: a escrita foi interrompida
+            call, args = json.loads(body)
+            self.state.apply(call, args)
+            offset += RECORD.size + length
+            self.records += 1
+        self._valid = offset
+        if offset < len(data):
+            logger.warning("[Servidor] Journal: %d bytes incompletos no fim do log descartados.", len(data) - offset)
+        logger.info("[Servidor] Estado restaurado (geração %d, %d registros) em %.1f ms.",
+                    self.generation, self.records, 1000 * (time.monotonic() - started))
+        return self.records
+
+    def start(self):
+        """Passa a gravar: abre o log (sem a parte incompleta) e inicia a thread de commit"""
+        path = self._log_path(self.generation)
+        if os.path.exists(path) and os.path.getsize(path) > self._valid:
+            os.truncate(path, self._valid)
+        for name in os.listdir(self.directory):
+            # Logs de gerações já compactadas, se a queda veio antes de apagá-los
+            if name.startswith('journal-') and os.path.join(self.directory, name) != path:
+                os.remove(os.path.join(self.directory, name))
+        self._file = open(path, 'ab')
+        self._thread = threading.Thread(target=self._commit_forever, name='journal', daemon=True)
+        self._thread.start()
+
+    def append(self, call, args):
+        """Registra uma mudança já aplicada; vai para o disco no próximo commit
+
+        Quem chama deve segurar state.lock desde a mudança, para que um snapshot nunca
+        inclua a mudança sem o registro ou o contrário.
+        """
+        body = json.dumps([call, args]).encode('utf-8')
+        self._pending.append(RECORD.pack(len(body), zlib.crc32(body)) + body)
+
+    def commit(self):
+        """Grava os registros pendentes com um único fsync; compacta se o log cresceu demais"""
+        with self._lock:
+            batch = self._drain()
+            if batch:
+                self._file.write(b''.join(batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                self.records += len(batch)
+            if self.records >= self.snapshot_every:
+                self._compact()
+
+    def close(self):
+        """Grava o que está pendente e fecha o log"""
+        self.commit()
+        with self._lock:
+            self._file.close()
+
+    def _compact(self):
+        """Grava o estado num snapshot da próxima geração e troca para um log vazio"""
+        with self.state.lock:
+            self._drain()  # Já incluídos no snapshot
+            snapshot = {'generation': self.generation + 1, 'state': self.state.snapshot()}
+        temporary = self._snapshot_path + '.tmp'
+        with open(temporary, 'w') as f:
+            json.dump(snapshot, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self._snapshot_path)
+        self._sync_directory()
+        self._file.close()
+        old = self._log_path(self.generation)
+        self.generation += 1
+        self.records = 0
+        self._file = open(self._log_path(self.generation), 'ab')
+        os.remove(old)
+        logger.info("[Servidor] Journal compactado no snapshot da geração %d.", self.generation)
+
+    def _drain(self):
+        batch = []
+        while self._pending:
+            batch.append(self._pending.popleft())
+        return batch
+
+    def _sync_directory(self):
+        """Garante que o rename do snapshot sobreviva a uma queda"""
+        fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    def _commit_forever(self):
+        while True:
+            time.sleep(self.commit_interval)
+            try:
+                self.commit()
+            except OSError as e:
+                logger.error("[Servidor] Erro gravando o journal: %s", e)
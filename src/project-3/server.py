@@ -1,417 +1,607 @@
+import itertools
 import socket
 import random
 import string
-import threading
 import time
-from collections import defaultdict
+import os
+import sys
+from collections import OrderedDict, defaultdict, deque
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import log, metrics
+from dispatcher import BUFFER_SIZE, COALESCE, Dispatcher
+from fanout import fan_out
+from journal import Journal
+from state import ChatState
+import shards
 
 # Configurações
 HOST = 'localhost'
 PORT = 1044
-BUFFER_SIZE = 1024
-TIMEOUT = 0.4
-
+WORKERS = 1  # Processos atendendo a mesma porta (SO_REUSEPORT); 1 mantém um único processo
+STATS_PORT = None  # Porta UDP local que responde com as métricas em JSON (None desativa); +índice por worker
+STATS_FILE = None  # Arquivo reescrito periodicamente com as métricas (None desativa); .índice por worker
+STATE_DIR = None  # Diretório do journal e dos snapshots do estado social (None: só em memória)
+OUTBOX_SIZE = 256  # Mensagens na fila de saída de cada cliente
+OUTBOX_OVERFLOW = COALESCE  # Com a fila cheia: DROP, COALESCE ou DISCONNECT (ver dispatcher.py)
+MAILBOX_SIZE = 50  # Mensagens guardadas por usuário offline; com a caixa cheia, as mais antigas saem
+MAX_MAILBOXES = 4096  # Caixas guardadas por worker; acima disso a usada há mais tempo é descartada
+
+logger = log.get_logger('server')
+
+# Usuários online em todos os workers: cada worker repassa os seus logins e logouts
 clients = set()  # Armazena endereços dos clientes
 client_names = {}  # Mapeia endereços para nomes
 username_to_addr = {}  # Mapeia nomes para endereços
-client_lock = threading.Lock()
-client_locks = defaultdict(threading.Lock)  # Lock por cliente
-
-friends = defaultdict(set)  # Usuário segue outros
-groups = {}  # Chave: (admin, group_name), Valor: {key, members, created_at}
-client_state = defaultdict(lambda: {
-    "expected_seq": 0,
-    "send_seq": 0
-})
-
-def rdt_send(sock, data, addr):
-    retries = 10
-    seq_num = client_state[addr]['send_seq']
-    while True:
-        packet = bytes([seq_num]) + data
-        sock.sendto(packet, addr)
-        print(f"[Servidor] [RDT] Enviado seq={seq_num} para {addr}")
-
-        sock.settimeout(TIMEOUT)
-        try:
-            ack, _ = sock.recvfrom(10)
-            if ack.decode().strip() == f"ACK{seq_num}":
-                print(f"[Servidor] [RDT] ACK{seq_num} recebido de {addr}")
-                client_state[addr]['send_seq'] = 1 - seq_num
-                return
-        except socket.timeout:
-            print(f"[Servidor] [RDT] Timeout esperando ACK{seq_num} de {addr}")
-
-def rdt_recv(sock, client_addr):
-    while True:
-        try:
-            packet, addr = sock.recvfrom(BUFFER_SIZE + 1)
-            if addr != client_addr:
-                continue
-            seq_num = packet[0]
-            data = packet[1:]
-
-            expected_seq = client_state[client_addr]['expected_seq']
-            print(f"[Servidor] [RDT] Recebido seq={seq_num} de {addr}")
-
-            if seq_num == expected_seq:
-                sock.sendto(f"ACK{seq_num}".encode(), addr)
-                client_state[client_addr]['expected_seq'] = 1 - expected_seq
-                return data, addr
-            else:
-                sock.sendto(f"ACK{1 - expected_seq}".encode(), addr)
-
-        except socket.timeout:
+user_workers = {}  # Mapeia nomes para o worker que tem a sessão
+
+state = ChatState()  # Seguidores e grupos, com índices; cada worker tem uma réplica
+journal = None  # Journal que grava as mudanças do estado (só no worker 0), se STATE_DIR
+
+dispatcher = None  # Leitor único do socket, criado em serve()
+bus = None  # Barramento entre os workers (shards.Bus), ou None com um único processo
+worker = 0  # Índice deste worker
+claims = {}  # Nomes de que este worker é dono (shards.owner_of) -> endereço de quem os usa
+fanouts = {}  # Identificador -> FanOut à espera das entregas feitas por outros workers
+fanout_ids = itertools.count()
+group_changes = {}  # Identificador -> callback à espera de uma mudança feita pelo dono do grupo
+group_change_ids = itertools.count()
+mailboxes = OrderedDict()  # Nomes de que este worker é dono -> deque das mensagens offline, da menos recente à mais
+
+def rdt_send(data, addr):
+    """Enfileira uma mensagem confiável para um cliente deste worker, sem bloquear"""
+    return dispatcher.send(addr, data)
+
+def send_to_users(names, data, on_complete=None):
+    """Envia data a cada usuário, pelo worker que tem a sessão dele, sem esperar ACKs
+
+    Para quem está offline, data fica na caixa de mensagens e é entregue no login.
+    """
+    local = []
+    remote = defaultdict(list)  # worker -> nomes
+    for name in names:
+        addr = username_to_addr.get(name)
+        if addr is None:
+            deposit(name, [data.decode('utf-8')])
             continue
-
-
-def broadcast_notification(sock, message, exclude_addr=None):
+        owner = user_workers.get(name, worker)
+        if owner == worker:
+            local.append(addr)
+        else:
+            remote[owner].append(name)
+    fanout = fan_out(dispatcher, local, data, on_complete, remote=sum(map(len, remote.values())))
+    for owner, targets in remote.items():
+        # Uma mensagem por worker, com todos os destinatários dele
+        message = {'op': 'deliver', 'to': targets, 'text': data.decode('utf-8')}
+        if on_complete is not None:
+            message['id'] = next(fanout_ids)
+            fanouts[message['id']] = fanout
+        bus.send(owner, message)
+    return fanout
+
+def notify_members(members, message, exclude=None, on_complete=None):
+    """Envia a mensagem a todos os membros (exceto exclude), sem esperar ACKs"""
+    return send_to_users([member for member in members if member != exclude], message.encode(), on_complete)
+
+def notify_user(username, message):
+    """Envia a mensagem ao usuário, em qualquer worker, ou a guarda se ele estiver offline"""
+    return send_to_users([username], message.encode())
+
+def deposit(username, texts):
+    """Guarda mensagens para um usuário offline, no worker dono do nome"""
+    texts = texts[-MAILBOX_SIZE:]
+    owner = owner_of(username)
+    if owner != worker:
+        bus.send(owner, {'op': 'mail', 'name': username, 'texts': texts})
+    elif username in username_to_addr:
+        # Entrou enquanto as mensagens vinham de outro worker
+        for text in texts:
+            send_to_users([username], text.encode('utf-8'))
+    else:
+        mailbox = mailboxes.get(username)
+        if mailbox is None:
+            mailbox = mailboxes[username] = deque(maxlen=MAILBOX_SIZE)
+            while len(mailboxes) > MAX_MAILBOXES:
+                name, dropped = mailboxes.popitem(last=False)
+                logger.info("[Servidor] Caixa de mensagens de '%s' descartada (%d mensagens).", name, len(dropped))
+        else:
+            mailboxes.move_to_end(username)
+        mailbox.extend(texts)
+
+def deliver_mail(client_addr, texts):
+    """Entrega no login as mensagens guardadas, juntas em poucos pacotes"""
+    lines = [f"Você tem {len(texts)} mensagens recebidas enquanto estava offline:"] + texts
+    chunk = b''
+    for line in lines:
+        data = line.encode('utf-8')
+        if chunk and len(chunk) + 1 + len(data) > BUFFER_SIZE:
+            rdt_send(chunk, client_addr)
+            chunk = b''
+        chunk = chunk + b'\n' + data if chunk else data
+    rdt_send(chunk, client_addr)
+
+def report_delivery(client_addr, group_name):
+    """Cria o callback que informa ao remetente em quantos membros a mensagem chegou"""
+    def on_complete(fanout):
+        if fanout.total:
+            report = f"Mensagem ao grupo '{group_name}' entregue a {fanout.delivered} de {fanout.total} membros online."
+            rdt_send(report.encode('utf-8'), client_addr)
+    return on_complete
+
+def broadcast_notification(message, exclude_addr=None):
     """Envia notificação para todos os clientes, exceto exclude_addr"""
-    with client_lock:
-        for addr in clients:
-            if addr != exclude_addr:
-                with client_locks[addr]:
-                    rdt_send(sock, message.encode('utf-8'), addr)
-
-def handle_client(sock, client_addr):
-    print(f"[Servidor] Novo cliente conectado: {client_addr}")
-    current_user = None
-
+    send_to_users([name for addr, name in client_names.items() if addr != exclude_addr], message.encode('utf-8'))
+
+def apply(call, args):
+    """Aplica uma mudança ao estado social e a registra no journal, se este worker grava"""
+    with state.lock:
+        result = state.apply(call, args)
+        if journal is not None:
+            journal.append(call, args)
+    return result
+
+def update(call, *args):
+    """Aplica uma mudança ao estado social e a repassa às réplicas dos outros workers"""
+    result = apply(call, args)
+    if bus is not None:
+        bus.broadcast({'op': 'state', 'call': call, 'args': args})
+    return result
+
+def owner_of(username):
+    """Worker que decide se o nome está livre e ordena as mudanças dos grupos que ele administra"""
+    return worker if bus is None else shards.owner_of(username, bus.count)
+
+def change_group(admin, call, args, then):
+    """Aplica uma mudança num grupo de admin pelo worker dono dele
+
+    O dono aplica e repassa às réplicas, então todas veem as mudanças de um grupo na
+    mesma ordem. then(resultado) roda neste worker depois que a réplica local já tem a
+    mudança; o resultado vem em tipos de JSON (group_result).
+    """
+    owner = owner_of(admin)
+    if owner == worker:
+        then(group_result(update(call, *args)))
+        return
+    change_id = next(group_change_ids)
+    group_changes[change_id] = then
+    bus.send(owner, {'op': 'group', 'id': change_id, 'call': call, 'args': args})
+
+def group_result(result):
+    """Resultado de uma mudança de grupo que pode atravessar o barramento"""
+    if isinstance(result, set):
+        return sorted(result)  # Membros do grupo removido
+    return None if result is None else True
+
+def reserve(username, addr):
+    """No worker dono do nome: reserva-o para addr; retorna (aceito, mensagens guardadas)"""
+    if claims.setdefault(username, addr) != addr:
+        return False, []
+    return True, list(mailboxes.pop(username, ()))
+
+def release(username, addr):
+    """Libera o nome reservado por addr, no worker dono dele"""
+    owner = owner_of(username)
+    if owner != worker:
+        bus.send(owner, {'op': 'release', 'name': username, 'addr': addr})
+    elif claims.get(username) == addr:
+        del claims[username]
+
+def register(username, addr, owner):
+    """Marca o usuário como online em addr, com a sessão no worker owner"""
+    previous = username_to_addr.get(username)
+    if previous is not None and previous != addr:
+        # O login novo chegou antes do logout anterior, vindo de outro worker
+        clients.discard(previous)
+        client_names.pop(previous, None)
+    clients.add(addr)
+    client_names[addr] = username
+    username_to_addr[username] = addr
+    user_workers[username] = owner
+
+def unregister(username, addr):
+    """Marca o usuário como offline, se ele ainda estiver em addr"""
+    clients.discard(addr)
+    if client_names.get(addr) == username:
+        del client_names[addr]
+    if username_to_addr.get(username) == addr:
+        del username_to_addr[username]
+        user_workers.pop(username, None)
+
+def remove_user(session):
+    """Tira o usuário da sessão dos online; pode ser chamada mais de uma vez
+
+    Quem ele segue e os grupos dele continuam, então mensagens de amigos e grupos
+    enviadas enquanto ele estiver offline vão para a caixa de mensagens.
+    """
+    client_addr = session.addr
+    current_user = session.user
+    if current_user is not None:
+        unregister(current_user, client_addr)
+        release(current_user, client_addr)
+        if bus is not None:
+            bus.broadcast({'op': 'offline', 'name': current_user, 'addr': client_addr})
+        if session.unsent:
+            # A sessão caiu com mensagens na fila: ficam para o próximo login
+            deposit(current_user, [data.decode('utf-8') for data in session.unsent])
+    session.user = None
+
+def disconnect(session):
+    """Remove o usuário, avisa o cliente e encerra a sessão"""
+    remove_user(session)
+    rdt_send("disconnected".encode('utf-8'), session.addr)
+    dispatcher.close(session)
+    logger.info("[Servidor] Cliente %s desconectado.", session.addr)
+
+def handle_message(session, data):
+    """Trata uma mensagem já confirmada de um cliente"""
     try:
-        data, _ = rdt_recv(sock,  client_addr)
-        message = data.decode('utf-8').strip()
-        if not message.startswith("login "):
-            raise ValueError("Comando login não recebido.")
-        username = message.split()[1]
-        
-        with client_lock:
-            if username in username_to_addr:
-                response = "Erro: Nome de usuário já está em uso."
-                with client_locks[client_addr]:
-                    rdt_send(sock, response.encode('utf-8'), client_addr)
-                return
-            clients.add(client_addr)
-            client_names[client_addr] = username
-            username_to_addr[username] = client_addr
-            current_user = username
-        
-        # Confirmar login
-        response = "Você está online!"
-        with client_locks[client_addr]:
-            rdt_send(sock, response.encode('utf-8'), client_addr)
-
-        print(f"[Servidor] Cliente {client_addr} registrado como '{username}'")
-
-        while True:
-            data, _ = rdt_recv(sock, client_addr)
-            message = data.decode('utf-8').strip()
-            if not message:
-                continue
-
-            if message.lower() == 'logout':
-                with client_lock:
-                    if client_addr in clients:
-                        clients.remove(client_addr)
-                    if client_addr in client_names:
-                        del username_to_addr[client_names[client_addr]]
-                        del client_names[client_addr]
-                    if current_user in friends:
-                        del friends[current_user]
-                    # Remover de grupos
-                    for group_id in list(groups.keys()):
-                        if current_user in groups[group_id]['members']:
-                            groups[group_id]['members'].remove(current_user)
-                            if not groups[group_id]['members']:
-                                del groups[group_id]
-                print(f"[Servidor] Cliente {client_addr} desconectado.")
-                break
-
-            parts = message.split()
-            command = parts[0].lower()
-
-            response = ""
-            if command == 'list:cinners':
-                with client_lock:
-                    cinners = [f"{client_names[addr]} {addr[0]}:{addr[1]}" for addr in clients]
-                    response = "\n".join(cinners) if cinners else "Nenhum usuário conectado."
-
-            elif command == 'follow':
-                if len(parts) < 2:
-                    response = "Erro: Comando follow requer <nome_do_usuario>."
-                else:
-                    target = parts[1]
-                    if target == current_user:
-                        response = "Erro: Não pode seguir a si mesmo."
-                    elif target not in username_to_addr:
-                        response = f"Erro: Usuário {target} não encontrado."
-                    elif target in friends[current_user]:
-                        response = f"Você já está seguindo {target}."
-                    else:
-                        friends[current_user].add(target)
-                        response = f"{target} foi adicionado à sua lista de amigos."
-                        target_addr = username_to_addr.get(target)
-                        if target_addr:
-                            notification = f"Você foi seguido por {current_user} {client_addr[0]}:{client_addr[1]}"
-                            with client_locks[target_addr]:
-                                rdt_send(sock, notification.encode(), target_addr)
-
-            elif command == 'create_group':
-                if len(parts) < 2:
-                    response = "Erro: Nome do grupo necessário."
-                else:
-                    group_name = parts[1]
-                    group_id = (current_user, group_name)
-                    if group_id in groups:
-                        response = f"Erro: Você já possui um grupo '{group_name}'."
-                    else:
-                        key = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
-                        groups[group_id] = {
-                            'key': key,
-                            'members': {current_user},
-                            'admin': current_user,
-                            'created_at': time.time()
-                        }
-                        response = f"Grupo '{group_name}' criado com sucesso. Chave: {key}"
-
-            elif command == 'list:groups':
-                user_groups = []
-                for (admin, name), info in groups.items():
-                    if current_user in info['members']:
-                        user_groups.append(f"Nome: {name}, Admin: {admin}, Criado em: {time.ctime(info['created_at'])}")
-                response = "\n".join(user_groups) if user_groups else "Você não está em nenhum grupo."
-
-            elif command == 'list:friends':
-                # Amigos mútuos (quando ambos se seguem)
-                mutual_friends = []
-                for followed in friends[current_user]:
-                    # Verifica se o followed também está seguindo o current_user
-                    if current_user in friends.get(followed, set()):
-                        mutual_friends.append(followed)
-                response = "\n".join(mutual_friends) if mutual_friends else "Você não tem amigos mútuos."
-
-            elif command == 'list:mygroups':
-                # Grupos criados pelo usuário
-                my_groups = []
-                for (admin, group_name), info in groups.items():
-                    if admin == current_user:
-                        my_groups.append(f"Nome: {group_name}, Chave: {info['key']}")
-                response = "\n".join(my_groups) if my_groups else "Você não criou nenhum grupo."
-
-            
-            elif command == 'unfollow':
-                if len(parts) < 2:
-                    response = "Erro: Comando unfollow requer <nome_do_usuario>."
-                else:
-                    target = parts[1]
-                    if target not in friends[current_user]:
-                        response = f"Erro: Você não está seguindo {target}."
-                    else:
-                        friends[current_user].remove(target)
-                        response = f"Você deixou de seguir {target}."
-                        # Notificar o usuário que foi deixado de seguir
-                        target_addr = username_to_addr.get(target)
-                        if target_addr:
-                            notification = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {current_user} deixou de seguir você"
-                            with client_locks[target_addr]:
-                                rdt_send(sock, notification.encode(), target_addr)
-
-            elif command == 'delete_group':
-                if len(parts) < 2:
-                    response = "Erro: Comando delete_group requer <nome_do_grupo>."
+        if session.user is None:
+            handle_login(session, data)
+        else:
+            handle_command(session, data)
+    except Exception as e:
+        logger.error("[Servidor] Erro com cliente %s: %s", session.addr, e)
+        disconnect(session)
+
+def handle_login(session, data):
+    client_addr = session.addr
+    message = data.decode('utf-8').strip()
+    if not message.startswith("login "):
+        raise ValueError("Comando login não recebido.")
+    username = message.split()[1]
+
+    owner = owner_of(username)
+    if owner == worker:
+        finish_login(username, client_addr, *reserve(username, client_addr))
+    else:
+        # Só o dono do nome sabe se ele está livre; a resposta volta pelo barramento
+        bus.send(owner, {'op': 'claim', 'name': username, 'addr': client_addr})
+
+def finish_login(username, client_addr, ok, mail=()):
+    """Conclui o login depois que o worker dono do nome respondeu, com as mensagens guardadas"""
+    session = dispatcher.sessions.get(client_addr)
+    if session is None or session.closing or session.user is not None:
+        if ok and (session is None or session.user != username):
+            release(username, client_addr)  # O cliente saiu enquanto esperava
+            if mail:
+                deposit(username, list(mail))
+        return
+    if not ok:
+        response = "Erro: Nome de usuário já está em uso."
+        rdt_send(response.encode('utf-8'), client_addr)
+        disconnect(session)
+        return
+    register(username, client_addr, worker)
+    session.user = username
+    if bus is not None:
+        bus.broadcast({'op': 'online', 'name': username, 'addr': client_addr})
+
+    # Confirmar login
+    response = "Você está online!"
+    rdt_send(response.encode('utf-8'), client_addr)
+    if mail:
+        deliver_mail(client_addr, mail)
+
+    logger.info("[Servidor] Cliente %s registrado como '%s'", client_addr, username)
+
+def handle_bus(message):
+    """Trata uma mensagem de outro worker; endereços chegam como listas pelo JSON"""
+    try:
+        op = message['op']
+        addr = tuple(message['addr']) if 'addr' in message else None
+        if op == 'state':
+            apply(message['call'], message['args'])
+        elif op == 'group':
+            # O 'state' repassado por update() chega a quem pediu antes desta resposta
+            result = group_result(update(message['call'], *message['args']))
+            bus.send(message['from'], {'op': 'grouped', 'id': message['id'], 'result': result})
+        elif op == 'grouped':
+            then = group_changes.pop(message['id'], None)
+            if then is not None:
+                then(message['result'])
+        elif op == 'claim':
+            ok, mail = reserve(message['name'], addr)
+            bus.send(message['from'], {'op': 'claimed', 'name': message['name'], 'addr': addr,
+                                       'ok': ok, 'mail': mail})
+        elif op == 'claimed':
+            finish_login(message['name'], addr, message['ok'], message['mail'])
+        elif op == 'release':
+            release(message['name'], addr)
+        elif op == 'online':
+            register(message['name'], addr, message['from'])
+        elif op == 'offline':
+            unregister(message['name'], addr)
+        elif op == 'deliver':
+            deliver(message)
+        elif op == 'mail':
+            deposit(message['name'], message['texts'])
+        elif op == 'delivered':
+            fanout = fanouts.pop(message['id'], None)
+            if fanout is not None:
+                fanout.done(True, message['delivered'])
+                fanout.done(False, message['failed'])
+    except Exception as e:
+        logger.error("[Servidor] Erro tratando mensagem do worker %s: %s", message.get('from'), e)
+
+def deliver(message):
+    """Entrega às sessões deste worker uma mensagem vinda de outro"""
+    addrs = []
+    for name in message['to']:
+        if user_workers.get(name) == worker and name in username_to_addr:
+            addrs.append(username_to_addr[name])
+        else:
+            deposit(name, [message['text']])  # Saiu enquanto a mensagem vinha
+    on_complete = None
+    if 'id' in message:
+        total = len(message['to'])
+        def on_complete(fanout):
+            bus.send(message['from'], {'op': 'delivered', 'id': message['id'],
+                                       'delivered': fanout.delivered, 'failed': total - fanout.delivered})
+    fan_out(dispatcher, addrs, message['text'].encode('utf-8'), on_complete)
+
+def handle_command(session, data):
+    client_addr = session.addr
+    current_user = session.user
+    message = data.decode('utf-8').strip()
+    if not message:
+        return
+
+    if message.lower() == 'logout':
+        disconnect(session)
+        return
+
+    parts = message.split()
+    command = parts[0].lower()
+
+    response = ""
+    if command == 'list:cinners':
+        cinners = [f"{client_names[addr]} {addr[0]}:{addr[1]}" for addr in clients]
+        response = "\n".join(cinners) if cinners else "Nenhum usuário conectado."
+
+    elif command == 'follow':
+        if len(parts) < 2:
+            response = "Erro: Comando follow requer <nome_do_usuario>."
+        else:
+            target = parts[1]
+            if target == current_user:
+                response = "Erro: Não pode seguir a si mesmo."
+            elif target not in username_to_addr:
+                response = f"Erro: Usuário {target} não encontrado."
+            elif not update('follow', current_user, target):
+                response = f"Você já está seguindo {target}."
+            else:
+                response = f"{target} foi adicionado à sua lista de amigos."
+                notification = f"Você foi seguido por {current_user} {client_addr[0]}:{client_addr[1]}"
+                notify_user(target, notification)
+
+    elif command == 'create_group':
+        if len(parts) < 2:
+            response = "Erro: Nome do grupo necessário."
+        else:
+            group_name = parts[1]
+            key = ''.join(random.choices(string.ascii_letters + string.digits, k=8))
+            def created(result):
+                if result is None:
+                    response = f"Erro: Você já possui um grupo '{group_name}'."
                 else:
-                    group_name = parts[1]
-                    group_id = (current_user, group_name)
-                    if group_id not in groups:
-                        response = f"Erro: Grupo '{group_name}' não encontrado ou você não é o administrador."
-                    else:
-                        # Remove o grupo e notifica os membros
-                        members = groups[group_id]['members'].copy()
-                        del groups[group_id]
-                        response = f"Grupo '{group_name}' deletado com sucesso."
-                        # Notifica todos os membros
-                        notification = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] O grupo {group_name} foi deletado pelo administrador"
-                        for member in members:
-                            if member != current_user:  # Não envia para o próprio admin
-                                member_addr = username_to_addr.get(member)
-                                if member_addr:
-                                    with client_locks[member_addr]:
-                                        rdt_send(sock, notification.encode(), member_addr)
-
-            elif command == 'join':
-                if len(parts) < 3:
-                    response = "Erro: Comando join requer <nome_do_grupo> <chave_grupo>."
+                    response = f"Grupo '{group_name}' criado com sucesso. Chave: {key}"
+                rdt_send(response.encode('utf-8'), client_addr)
+            change_group(current_user, 'create_group', (current_user, group_name, key, time.time()), created)
+            return
+
+    elif command == 'list:groups':
+        user_groups = []
+        for (admin, name), info in state.groups_of(current_user):
+            user_groups.append(f"Nome: {name}, Admin: {admin}, Criado em: {time.ctime(info['created_at'])}")
+        response = "\n".join(user_groups) if user_groups else "Você não está em nenhum grupo."
+
+    elif command == 'list:friends':
+        # Amigos mútuos (quando ambos se seguem)
+        mutual_friends = state.mutual_friends(current_user)
+        response = "\n".join(mutual_friends) if mutual_friends else "Você não tem amigos mútuos."
+
+    elif command == 'list:mygroups':
+        # Grupos criados pelo usuário
+        my_groups = []
+        for (admin, group_name), info in state.groups_owned(current_user):
+            my_groups.append(f"Nome: {group_name}, Chave: {info['key']}")
+        response = "\n".join(my_groups) if my_groups else "Você não criou nenhum grupo."
+
+
+    elif command == 'unfollow':
+        if len(parts) < 2:
+            response = "Erro: Comando unfollow requer <nome_do_usuario>."
+        else:
+            target = parts[1]
+            if not update('unfollow', current_user, target):
+                response = f"Erro: Você não está seguindo {target}."
+            else:
+                response = f"Você deixou de seguir {target}."
+                # Notificar o usuário que foi deixado de seguir
+                notification = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {current_user} deixou de seguir você"
+                notify_user(target, notification)
+
+    elif command == 'delete_group':
+        if len(parts) < 2:
+            response = "Erro: Comando delete_group requer <nome_do_grupo>."
+        else:
+            group_name = parts[1]
+            group_id = (current_user, group_name)
+            # Remove o grupo e notifica os membros
+            def deleted(members):
+                if members is None:
+                    response = f"Erro: Grupo '{group_name}' não encontrado ou você não é o administrador."
                 else:
-                    group_name = parts[1]
-                    key = parts[2]
-                    # Procura o grupo em todos os administradores
-                    found = False
-                    for (admin, name), info in groups.items():
-                        if name == group_name and info['key'] == key:
-                            found = True
-                            if current_user in info['members']:
-                                response = "Você já está neste grupo."
-                            else:
-                                info['members'].add(current_user)
-                                response = f"Você entrou no grupo '{group_name}'."
-                                # Notifica todos os membros
-                                notification = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {current_user} acabou de entrar no grupo"
-                                for member in info['members']:
-                                    if member != current_user:  # Não envia para o novo membro
-                                        member_addr = username_to_addr.get(member)
-                                        if member_addr:
-                                            with client_locks[member_addr]:
-                                                rdt_send(sock, notification.encode(), member_addr)
-                            break
-                    if not found:
-                        response = "Erro: Grupo não encontrado ou chave inválida."
-            elif command == 'leave':
-                if len(parts) < 2:
-                    response = "Erro: Comando leave requer <nome_do_grupo>."
+                    response = f"Grupo '{group_name}' deletado com sucesso."
+                    # Notifica todos os membros
+                    notification = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] O grupo {group_name} foi deletado pelo administrador"
+                    notify_members(members, notification, exclude=current_user)  # Não envia para o próprio admin
+                rdt_send(response.encode('utf-8'), client_addr)
+            change_group(current_user, 'delete_group', (group_id,), deleted)
+            return
+
+    elif command == 'join':
+        if len(parts) < 3:
+            response = "Erro: Comando join requer <nome_do_grupo> <chave_grupo>."
+        else:
+            group_name = parts[1]
+            key = parts[2]
+            # Procura o grupo em todos os administradores
+            found = state.find_group(group_name, key=key)
+            if found is None:
+                response = "Erro: Grupo não encontrado ou chave inválida."
+            else:
+                group_id, info = found
+                if current_user in info['members']:
+                    response = "Você já está neste grupo."
                 else:
-                    group_name = parts[1]
-                    left = False
-                    # Procura o grupo em todos os administradores
-                    for (admin, name), info in groups.items():
-                        if name == group_name and current_user in info['members']:
-                            info['members'].remove(current_user)
-                            left = True
-                            response = f"Você saiu do grupo '{group_name}'."
+                    def joined(_):
+                        info = state.groups.get(group_id)
+                        if info is None:
+                            response = "Erro: Grupo não encontrado ou chave inválida."  # Removido nesse meio-tempo
+                        else:
+                            response = f"Você entrou no grupo '{group_name}'."
                             # Notifica todos os membros
-                            notification = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {current_user} saiu do grupo"
-                            for member in info['members']:
-                                member_addr = username_to_addr.get(member)
-                                if member_addr:
-                                    with client_locks[member_addr]:
-                                        rdt_send(sock, notification.encode(), member_addr)
-                            break
-                    if not left:
-                        response = f"Erro: Você não está no grupo '{group_name}'."
-
-            elif command == 'ban':
-                if len(parts) < 2:
-                    response = "Erro: Comando ban requer <nome_do_usuario>."
-                else:
-                    target = parts[1]
-                    banned = False
-                    # Procura grupos onde o usuário é admin
-                    for (admin, group_name), info in groups.items():
-                        if admin == current_user and target in info['members']:
-                            # Remove o usuário do grupo
-                            info['members'].remove(target)
-                            banned = True
-                            # Notifica membros (exceto o banido)
-                            notification_members = f"{target} foi banido do grupo"
-                            for member in info['members']:
-                                member_addr = username_to_addr.get(member)
-                                if member_addr:
-                                    with client_locks[member_addr]:
-                                        rdt_send(sock, notification_members.encode(), member_addr)
-                            # Notifica o banido
-                            notification_banned = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] O administrador do grupo {group_name} baniu você."
-                            target_addr = username_to_addr.get(target)
-                            if target_addr:
-                                with client_locks[target_addr]:
-                                    rdt_send(sock, notification_banned.encode(), target_addr)
-                            response = f"{target} foi banido do grupo."
-                            break
-                    if not banned:
-                        response = "Erro: Você não é admin de um grupo onde este usuário está."
-
-            elif command == 'chat_group':
-                if len(parts) < 4:
-                    response = "Erro: Formato: chat_group <nome_grupo> <chave> <mensagem>"
-                else:
-                    group_name = parts[1]
-                    key = parts[2]
-                    message = ' '.join(parts[3:])
-                    valid = False
-                    # Valida grupo e chave
-                    for (admin, name), info in groups.items():
-                        if name == group_name and info['key'] == key and current_user in info['members']:
-                            valid = True
-                            # Envia mensagem para todos os membros (exceto remetente)
-                            formatted_msg = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {message}"
-                            for member in info['members']:
-                                if member != current_user:
-                                    member_addr = username_to_addr.get(member)
-                                    if member_addr:
-                                        with client_locks[member_addr]:
-                                            rdt_send(sock, formatted_msg.encode(), member_addr)
-                            response = "Mensagem enviada ao grupo."
-                            break
-                    if not valid:
-                        response = "Erro: Grupo não encontrado, chave inválida ou você não é membro."
-            
-            elif command == 'chat_friend':
-                if len(parts) < 3:
-                    response = "Erro: Formato: chat_friend <nome_amigo> <mensagem>"
-                else:
-                    friend_name = parts[1]
-                    message = ' '.join(parts[2:])
-                    
-                    # Verifica se é amigo mútuo
-                    is_mutual = (friend_name in friends[current_user] and 
-                                current_user in friends.get(friend_name, set()))
-                    
-                    if not is_mutual:
-                        response = "Erro: Você só pode enviar mensagens para amigos mútuos."
-                    elif friend_name not in username_to_addr:
-                        response = f"Erro: {friend_name} não está online."
-                    else:
-                        friend_addr = username_to_addr[friend_name]
-                        formatted_msg = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {message}"
-                        
-                        with client_locks[friend_addr]:
-                            rdt_send(sock, formatted_msg.encode(), friend_addr)
-                        
-                        response = f"Mensagem enviada para {friend_name}."
+                            notification = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {current_user} acabou de entrar no grupo"
+                            notify_members(info['members'], notification, exclude=current_user)  # Não envia para o novo membro
+                        rdt_send(response.encode('utf-8'), client_addr)
+                    change_group(group_id[0], 'add_member', (group_id, current_user), joined)
+                    return
+    elif command == 'leave':
+        if len(parts) < 2:
+            response = "Erro: Comando leave requer <nome_do_grupo>."
+        else:
+            group_name = parts[1]
+            # Procura o grupo em todos os administradores
+            found = state.find_group(group_name, member=current_user)
+            if found is None:
+                response = f"Erro: Você não está no grupo '{group_name}'."
+            else:
+                group_id, info = found
+                def left(_):
+                    # Notifica todos os membros
+                    notification = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {current_user} saiu do grupo"
+                    notify_members(info['members'], notification)
+                    rdt_send(f"Você saiu do grupo '{group_name}'.".encode('utf-8'), client_addr)
+                change_group(group_id[0], 'remove_member', (group_id, current_user), left)
+                return
 
+    elif command == 'ban':
+        if len(parts) < 2:
+            response = "Erro: Comando ban requer <nome_do_usuario>."
+        else:
+            target = parts[1]
+            # Procura grupos onde o usuário é admin
+            found = state.find_admin_group_with(current_user, target)
+            if found is None:
+                response = "Erro: Você não é admin de um grupo onde este usuário está."
             else:
-                response = "Erro: Comando não reconhecido."
+                (admin, group_name), info = found
+                def banned(_):
+                    # Notifica membros (exceto o banido)
+                    notification_members = f"{target} foi banido do grupo"
+                    notify_members(info['members'], notification_members)
+                    # Notifica o banido
+                    notification_banned = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] O administrador do grupo {group_name} baniu você."
+                    notify_user(target, notification_banned)
+                    rdt_send(f"{target} foi banido do grupo.".encode('utf-8'), client_addr)
+                # Remove o usuário do grupo
+                change_group(admin, 'remove_member', ((admin, group_name), target), banned)
+                return
 
-            with client_locks[client_addr]:
-                rdt_send(sock, response.encode('utf-8'), client_addr)
+    elif command == 'chat_group':
+        if len(parts) < 4:
+            response = "Erro: Formato: chat_group <nome_grupo> <chave> <mensagem>"
+        else:
+            group_name = parts[1]
+            key = parts[2]
+            message = ' '.join(parts[3:])
+            # Valida grupo e chave
+            found = state.find_group(group_name, key=key, member=current_user)
+            if found is None:
+                response = "Erro: Grupo não encontrado, chave inválida ou você não é membro."
+            else:
+                _, info = found
+                # Envia mensagem para todos os membros (exceto remetente)
+                # A contagem de entregas chega ao remetente depois da resposta
+                formatted_msg = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {message}"
+                notify_members(info['members'], formatted_msg, exclude=current_user,
+                               on_complete=report_delivery(client_addr, group_name))
+                response = "Mensagem enviada ao grupo."
+
+    elif command == 'chat_friend':
+        if len(parts) < 3:
+            response = "Erro: Formato: chat_friend <nome_amigo> <mensagem>"
+        else:
+            friend_name = parts[1]
+            message = ' '.join(parts[2:])
+
+            # Verifica se é amigo mútuo
+            is_mutual = state.is_mutual(current_user, friend_name)
+
+            if not is_mutual:
+                response = "Erro: Você só pode enviar mensagens para amigos mútuos."
+            else:
+                formatted_msg = f"[{current_user}/{client_addr[0]}:{client_addr[1]}] {message}"
 
-    except Exception as e:
-        print(f"[Servidor] Erro com cliente {client_addr}: {e}")
+                # O amigo pode estar em outro worker, ou offline: aí a mensagem fica guardada
+                notify_user(friend_name, formatted_msg)
+
+                if friend_name in username_to_addr:
+                    response = f"Mensagem enviada para {friend_name}."
+                else:
+                    response = f"{friend_name} está offline; a mensagem será entregue no próximo login."
+
+    else:
+        response = "Erro: Comando não reconhecido."
+
+    rdt_send(response.encode('utf-8'), client_addr)
+
+def serve(shard=None):
+    """Atende os clientes neste processo; com shard (shards.Bus), como um dos workers"""
+    global dispatcher, bus, worker, journal
+    bus = shard
+    if shard is None:
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((HOST, PORT))
+        logger.info("[Servidor] Chat servidor escutando em %s:%d", HOST, PORT)
+    else:
+        worker = shard.index
+        sock = shards.bind_reuseport((HOST, PORT))
+        logger.info("[Servidor] Worker %d de %d escutando em %s:%d", worker, shard.count, HOST, PORT)
+    if STATS_PORT is not None:
+        metrics.serve((HOST, STATS_PORT + worker))
+        logger.info("[Servidor] Métricas em udp://%s:%d", HOST, STATS_PORT + worker)
+    if STATS_FILE is not None:
+        metrics.dump_every(STATS_FILE if shard is None else f"{STATS_FILE}.{worker}")
+
+    if journal is not None and worker != 0:
+        journal = None  # Só o worker 0 grava: ele recebe todas as mudanças, na ordem em que as aplica
+    elif journal is not None:
+        journal.start()
+
+    dispatcher = Dispatcher(sock, on_message=handle_message, on_close=remove_user,
+                            max_outbox=OUTBOX_SIZE, overflow=OUTBOX_OVERFLOW)
+    if bus is not None:
+        bus.attach(dispatcher, handle_bus)
+    try:
+        dispatcher.run_forever()
     finally:
-        with client_lock:
-            if client_addr in clients:
-                clients.remove(client_addr)
-            if client_addr in client_names:
-                del username_to_addr[client_names[client_addr]]
-                del client_names[client_addr]
-            if current_user in friends:
-                del friends[current_user]
-            # Remover de grupos
-            for group_id in list(groups.keys()):
-                if current_user in groups[group_id]['members']:
-                    groups[group_id]['members'].remove(current_user)
-                    if not groups[group_id]['members']:
-                        del groups[group_id]
-        try:
-            response = "disconnected"
-            rdt_send(sock, response.encode('utf-8'), client_addr)
-        except Exception as e:
-            print(f"[Servidor] Cliente já esta desconectado no client.")
-        
-
-def main():
-    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-    sock.bind((HOST, PORT))
-    sock.settimeout(TIMEOUT)
-    print(f"[Servidor] Chat servidor escutando em {HOST}:{PORT}")
-
-    while True:
-        try:
-            data, client_addr = sock.recvfrom(BUFFER_SIZE)
-            with client_lock:
-                if client_addr not in clients:
-                    thread = threading.Thread(target=handle_client, args=(sock, client_addr))
-                    thread.daemon = True
-                    thread.start()
-        except socket.timeout:
-            continue
+        if journal is not None:
+            journal.close()
+
+def main(workers=WORKERS):
+    global journal
+    if STATE_DIR is not None:
+        # Restaura antes de criar os workers: todos começam com a mesma réplica
+        journal = Journal(STATE_DIR, state)
+        journal.load()
+    if workers <= 1:
+        serve()
+    else:
+        # Um processo por núcleo: o kernel reparte os clientes entre eles por hash do endereço
+        logger.info("[Servidor] Iniciando %d workers em %s:%d", workers, HOST, PORT)
+        shards.run(workers, serve)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
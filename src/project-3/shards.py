@@ -0,0 +1,190 @@
+"""Servidor de chat em vários processos (workers) na mesma porta, com SO_REUSEPORT.
+
+Cada worker tem o seu socket UDP e o seu Dispatcher; o kernel escolhe o worker de cada
+datagrama por hash do endereço do cliente, então as sessões ficam particionadas e um
+cliente fala sempre com o mesmo worker. Os workers conversam por um barramento local:
+um socket Unix de datagramas por worker, com mensagens JSON (Bus).
+
+Cada nome de usuário tem um worker dono, zlib.crc32(nome) % workers (owner_of), que
+decide se o login é aceito; assim dois clientes em workers diferentes nunca ficam com
+o mesmo nome. O roteamento das mensagens entre workers fica em server.py.
+"""
+import json
+import multiprocessing
+import os
+import selectors
+import shutil
+import signal
+import socket
+import sys
+import tempfile
+import zlib
+from collections import deque
+
+from common import log
+
+MAX_MESSAGE = 208 * 1024  # Maior mensagem do barramento, em bytes: o SO_SNDBUF padrão do Linux (wmem_default)
+READ_BATCH = 64  # Mensagens lidas por evento antes de voltar ao laço
+
+logger = log.get_logger('shards')
+
+def owner_of(name, count):
+    """Worker dono do nome de usuário"""
+    return zlib.crc32(name.encode('utf-8')) % count
+
+def bind_reuseport(addr):
+    """Socket UDP ligado a addr junto com os dos outros workers"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind(addr)
+    return sock
+
+class Bus:
+    """Barramento entre os workers: envia a um worker ou a todos, sem bloquear o laço
+
+    Mensagens para um worker com a fila cheia esperam numa fila local, na ordem, e saem
+    quando o socket dele voltar a aceitar; as de um mesmo worker chegam na ordem de envio.
+    """
+
+    def __init__(self, directory, index, count, sock, parent=None):
+        self.directory = directory
+        self.index = index
+        self.count = count
+        self.sock = sock  # Socket deste worker, já ligado ao seu caminho
+        self.parent = parent  # Leitura de um pipe do processo principal: EOF quando ele termina
+        self.sock.setblocking(False)
+        self.dispatcher = None
+        self.handler = None
+        self._peers = {}  # worker -> socket conectado ao dele
+        self._backlog = {}  # worker -> deque de mensagens à espera de espaço
+
+    @staticmethod
+    def path(directory, index):
+        return os.path.join(directory, f"worker-{index}.sock")
+
+    def attach(self, dispatcher, handler):
+        """Passa a ler o barramento no laço do dispatcher, chamando handler(mensagem)"""
+        self.dispatcher = dispatcher
+        self.handler = handler
+        dispatcher.watch(self.sock, self._read)
+        if self.parent is not None:
+            dispatcher.watch(self.parent, self._orphaned)
+
+    def send(self, worker, message):
+        """Envia message (um dict) ao worker; o campo 'from' é preenchido aqui"""
+        message['from'] = self.index
+        self._send(worker, json.dumps(message, ensure_ascii=False).encode('utf-8'))
+
+    def broadcast(self, message):
+        """Envia message a todos os outros workers"""
+        message['from'] = self.index
+        data = json.dumps(message, ensure_ascii=False).encode('utf-8')
+        for worker in range(self.count):
+            if worker != self.index:
+                self._send(worker, data)
+
+    def _send(self, worker, data):
+        if len(data) > MAX_MESSAGE:
+            # O kernel recusaria o datagrama (EMSGSIZE), o que pareceria um worker inacessível
+            logger.warning("[Servidor] Mensagem de %d bytes para o worker %d descartada (limite de %d).",
+                           len(data), worker, MAX_MESSAGE)
+            return
+        backlog = self._backlog.get(worker)
+        if backlog is not None:
+            backlog.append(data)
+            return
+        try:
+            self._peer(worker).send(data)
+        except BlockingIOError:
+            self._backlog[worker] = deque([data])
+            self.dispatcher.watch(self._peer(worker), lambda: self._flush(worker), selectors.EVENT_WRITE)
+        except OSError as e:
+            logger.warning("[Servidor] Worker %d inacessível, mensagem descartada: %s", worker, e)
+
+    def _flush(self, worker):
+        backlog = self._backlog[worker]
+        peer = self._peer(worker)
+        while backlog:
+            try:
+                peer.send(backlog[0])
+            except BlockingIOError:
+                return
+            except OSError as e:
+                logger.warning("[Servidor] Worker %d inacessível, %d mensagens descartadas: %s",
+                               worker, len(backlog), e)
+                break
+            backlog.popleft()
+        del self._backlog[worker]
+        self.dispatcher.unwatch(peer)
+
+    def _peer(self, worker):
+        peer = self._peers.get(worker)
+        if peer is None:
+            peer = self._peers[worker] = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+            peer.connect(self.path(self.directory, worker))
+            peer.setblocking(False)
+        return peer
+
+    def _orphaned(self):
+        logger.warning("[Servidor] Processo principal terminou; encerrando o worker %d.", self.index)
+        log.flush()
+        sys.exit(0)
+
+    def _read(self):
+        for _ in range(READ_BATCH):
+            try:
+                data = self.sock.recv(MAX_MESSAGE)
+            except BlockingIOError:
+                return
+            try:
+                message = json.loads(data)
+                if not isinstance(message, dict):
+                    raise ValueError(f"esperava um objeto, veio {type(message).__name__}")
+            except ValueError as e:
+                # Um datagrama inválido não pode derrubar a leitura do barramento
+                logger.error("[Servidor] Mensagem inválida no barramento descartada: %s", e)
+                continue
+            self.handler(message)
+
+def _worker(target, bus, socks, alive):
+    os.close(alive)  # Só o processo principal mantém a escrita do pipe
+    for sock in socks:
+        if sock is not bus.sock:
+            sock.close()  # Sockets dos outros workers, herdados do processo principal
+    target(bus)
+
+def run(count, target):
+    """Inicia count workers, cada um executando target(bus), e espera todos terminarem
+
+    Os sockets do barramento são criados antes dos processos, para que nenhum worker
+    envie a um caminho que ainda não existe.
+    """
+    directory = tempfile.mkdtemp(prefix='chat-bus-')
+    socks = []
+    for index in range(count):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+        sock.bind(Bus.path(directory, index))
+        socks.append(sock)
+    parent, alive = os.pipe()
+    # SIGTERM no processo principal também encerra os workers (pelo finally abaixo)
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    context = multiprocessing.get_context('fork')
+    processes = [context.Process(target=_worker, name=f"worker-{index}", daemon=True,
+                                 args=(target, Bus(directory, index, count, sock, parent), socks, alive))
+                 for index, sock in enumerate(socks)]
+    try:
+        for process in processes:
+            process.start()
+        for sock in socks:
+            sock.close()  # Cada worker ficou com a sua cópia
+        for process in processes:
+            process.join()
+            if process.exitcode:
+                logger.error("[Servidor] %s terminou com código %s.", process.name, process.exitcode)
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        os.close(alive)
+        os.close(parent)
+        shutil.rmtree(directory, ignore_errors=True)
@@ -0,0 +1,198 @@
+"""Estado social do chat (seguidores e grupos) com índices para consultas diretas.
+
+Além do dicionário de grupos, mantém índices por nome do grupo, por membro e por
+administrador, e o conjunto reverso de seguidores. Assim cada comando custa O(1) ou
+O(grau) em vez de percorrer todos os grupos. Os índices usam dicionários como
+conjuntos ordenados, preservando a ordem de criação das buscas originais.
+
+As mudanças (CHANGES) podem ser reaplicadas por nome com apply(), como fazem as
+réplicas dos outros workers e o journal, e snapshot()/restore() convertem o estado
+de e para tipos de JSON.
+"""
+import threading
+from collections import defaultdict
+
+CHANGES = ('follow', 'unfollow', 'create_group', 'delete_group', 'add_member', 'remove_member', 'remove_user')
+
+class ChatState:
+    """Seguidores e grupos do chat, com os índices sempre consistentes"""
+
+    def __init__(self):
+        self.friends = defaultdict(set)  # Usuário -> usuários que ele segue
+        self.followers = defaultdict(set)  # Usuário -> usuários que o seguem
+        self.groups = {}  # Chave: (admin, group_name), Valor: {key, members, admin, created_at}
+        self.groups_by_name = defaultdict(dict)  # group_name -> {group_id: None}
+        self.groups_by_member = defaultdict(dict)  # usuário -> {group_id: None}
+        self.groups_by_admin = defaultdict(dict)  # admin -> {group_id: None}
+        self.lock = threading.RLock()
+
+    # Seguidores
+
+    def is_following(self, user, target):
+        return target in self.friends.get(user, ())
+
+    def is_mutual(self, user, other):
+        return self.is_following(user, other) and self.is_following(other, user)
+
+    def follow(self, user, target):
+        """Retorna False se user já seguia target"""
+        with self.lock:
+            if self.is_following(user, target):
+                return False
+            self.friends[user].add(target)
+            self.followers[target].add(user)
+            return True
+
+    def unfollow(self, user, target):
+        """Retorna False se user não seguia target"""
+        with self.lock:
+            if not self.is_following(user, target):
+                return False
+            self._discard(self.friends, user, target)
+            self._discard(self.followers, target, user)
+            return True
+
+    def mutual_friends(self, user):
+        """Usuários que user segue e que também o seguem"""
+        with self.lock:
+            return sorted(self.friends.get(user, set()) & self.followers.get(user, set()))
+
+    # Grupos
+
+    def create_group(self, admin, group_name, key, created_at):
+        """Cria o grupo; retorna None se o admin já tem um grupo com esse nome"""
+        group_id = (admin, group_name)
+        with self.lock:
+            if group_id in self.groups:
+                return None
+            info = self.groups[group_id] = {
+                'key': key,
+                'members': {admin},
+                'admin': admin,
+                'created_at': created_at
+            }
+            self.groups_by_name[group_name][group_id] = None
+            self.groups_by_admin[admin][group_id] = None
+            self.groups_by_member[admin][group_id] = None
+            return info
+
+    def delete_group(self, group_id):
+        """Remove o grupo e retorna seus membros (None se não existe)"""
+        with self.lock:
+            info = self.groups.pop(group_id, None)
+            if info is None:
+                return None
+            admin, group_name = group_id
+            self._discard(self.groups_by_name, group_name, group_id)
+            self._discard(self.groups_by_admin, admin, group_id)
+            for member in info['members']:
+                self._discard(self.groups_by_member, member, group_id)
+            return info['members']
+
+    def add_member(self, group_id, user):
+        """Inclui user no grupo; sem efeito se o grupo já foi removido"""
+        with self.lock:
+            info = self.groups.get(group_id)
+            if info is None:
+                return
+            info['members'].add(user)
+            self.groups_by_member[user][group_id] = None
+
+    def remove_member(self, group_id, user):
+        with self.lock:
+            info = self.groups.get(group_id)
+            if info is None:
+                return
+            info['members'].discard(user)
+            self._discard(self.groups_by_member, user, group_id)
+
+    def find_group(self, group_name, key=None, member=None):
+        """Primeiro grupo (em ordem de criação) com o nome, a chave e o membro pedidos"""
+        with self.lock:
+            for group_id in self.groups_by_name.get(group_name, ()):
+                info = self.groups[group_id]
+                if key is not None and info['key'] != key:
+                    continue
+                if member is not None and member not in info['members']:
+                    continue
+                return group_id, info
+            return None
+
+    def find_admin_group_with(self, admin, member):
+        """Primeiro grupo administrado por admin em que member está"""
+        with self.lock:
+            for group_id in self.groups_by_admin.get(admin, ()):
+                if member in self.groups[group_id]['members']:
+                    return group_id, self.groups[group_id]
+            return None
+
+    def groups_of(self, user):
+        """Grupos de que user participa, em ordem de criação"""
+        with self.lock:
+            found = [(group_id, self.groups[group_id]) for group_id in self.groups_by_member.get(user, ())]
+        return sorted(found, key=lambda item: item[1]['created_at'])
+
+    def groups_owned(self, admin):
+        """Grupos criados por admin, em ordem de criação"""
+        with self.lock:
+            return [(group_id, self.groups[group_id]) for group_id in self.groups_by_admin.get(admin, ())]
+
+    def remove_user(self, user):
+        """Apaga quem o usuário segue e o tira dos grupos; grupos vazios são removidos
+
+        O logout não a usa mais; ela segue em CHANGES para reaplicar journals antigos.
+        """
+        with self.lock:
+            for target in self.friends.pop(user, set()):
+                self._discard(self.followers, target, user)
+            for group_id in list(self.groups_by_member.get(user, ())):
+                self.remove_member(group_id, user)
+                if not self.groups[group_id]['members']:
+                    self.delete_group(group_id)
+
+    # Réplicas e persistência
+
+    def apply(self, call, args):
+        """Aplica a mudança call(*args) vinda do JSON, em que as tuplas viraram listas"""
+        if call not in CHANGES:
+            raise ValueError(f"Mudança desconhecida: {call}")
+        return getattr(self, call)(*(tuple(arg) if isinstance(arg, list) else arg for arg in args))
+
+    def snapshot(self):
+        """Seguidores e grupos (em ordem de criação) em tipos de JSON"""
+        with self.lock:
+            return {
+                'friends': {user: sorted(targets) for user, targets in self.friends.items()},
+                'groups': [[admin, group_name, info['key'], info['created_at'], sorted(info['members'])]
+                           for (admin, group_name), info in self.groups.items()],
+            }
+
+    def restore(self, snapshot):
+        """Substitui o estado pelo de um snapshot(), refazendo os índices"""
+        with self.lock:
+            for index in (self.friends, self.followers, self.groups, self.groups_by_name,
+                          self.groups_by_member, self.groups_by_admin):
+                index.clear()
+            for user, targets in snapshot['friends'].items():
+                for target in targets:
+                    self.follow(user, target)
+            for admin, group_name, key, created_at, members in snapshot['groups']:
+                group_id = (admin, group_name)
+                self.create_group(admin, group_name, key, created_at)
+                for member in members:
+                    self.add_member(group_id, member)
+                if admin not in members:
+                    self.remove_member(group_id, admin)  # O admin saiu do grupo
+
+    @staticmethod
+    def _discard(index, key, value):
+        """Remove value do conjunto index[key], apagando a entrada se ficar vazia"""
+        values = index.get(key)
+        if values is None:
+            return
+        if isinstance(values, dict):
+            values.pop(value, None)
+        else:
+            values.discard(value)
+        if not values:
+            del index[key]
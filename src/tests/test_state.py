@@ -0,0 +1,116 @@
+"""Consistência dos índices do ChatState sob mudanças concorrentes de várias threads."""
+import os
+import random
+import sys
+import threading
+import unittest
+from collections import defaultdict
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'project-3'))
+from state import ChatState
+
+USERS = [f"u{i}" for i in range(12)]
+GROUP_NAMES = ['g0', 'g1', 'g2', 'g3']
+THREADS = 8
+OPERATIONS = 3000  # Mudanças por thread
+
+def check_indexes(test, state):
+    """Confere cada índice secundário contra groups, friends e followers"""
+    followers = defaultdict(set)
+    for user, targets in state.friends.items():
+        test.assertTrue(targets, f"conjunto vazio em friends[{user}]")
+        for target in targets:
+            followers[target].add(user)
+    test.assertEqual(dict(state.followers), dict(followers))
+
+    by_name = defaultdict(set)
+    by_admin = defaultdict(set)
+    by_member = defaultdict(set)
+    for group_id, info in state.groups.items():
+        admin, group_name = group_id
+        test.assertEqual(info['admin'], admin)
+        by_name[group_name].add(group_id)
+        by_admin[admin].add(group_id)
+        for member in info['members']:
+            by_member[member].add(group_id)
+    for index, expected in ((state.groups_by_name, by_name), (state.groups_by_admin, by_admin),
+                            (state.groups_by_member, by_member)):
+        test.assertEqual({key: set(values) for key, values in index.items()}, dict(expected))
+
+def mutate(state, seed, errors):
+    rng = random.Random(seed)
+    try:
+        for _ in range(OPERATIONS):
+            user, other = rng.sample(USERS, 2)
+            group_id = (rng.choice(USERS), rng.choice(GROUP_NAMES))
+            operation = rng.randrange(8)
+            if operation == 0:
+                state.follow(user, other)
+            elif operation == 1:
+                state.unfollow(user, other)
+            elif operation == 2:
+                state.create_group(group_id[0], group_id[1], 'chave', 0.0)
+            elif operation == 3:
+                state.delete_group(group_id)
+            elif operation == 4:
+                state.add_member(group_id, user)
+            elif operation == 5:
+                state.remove_member(group_id, user)
+            elif operation == 6:
+                state.remove_user(user)
+            else:
+                # Leituras que percorrem os índices enquanto outras threads mudam o estado
+                state.groups_of(user)
+                state.find_group(group_id[1], member=user)
+                state.mutual_friends(user)
+    except Exception as e:
+        errors.append(e)
+
+class ConcurrentIndexesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.interval = sys.getswitchinterval()
+        sys.setswitchinterval(1e-6)  # Trocas de thread frequentes, para intercalar as mudanças
+
+    def tearDown(self):
+        sys.setswitchinterval(self.interval)
+
+    def test_indexes_match_after_concurrent_mutations(self):
+        state = ChatState()
+        errors = []
+        threads = [threading.Thread(target=mutate, args=(state, seed, errors)) for seed in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        check_indexes(self, state)
+
+    def test_indexes_consistent_while_mutating(self):
+        """Com state.lock, um leitor nunca vê os índices no meio de uma mudança"""
+        state = ChatState()
+        errors = []
+        threads = [threading.Thread(target=mutate, args=(state, seed, errors)) for seed in range(THREADS)]
+        for thread in threads:
+            thread.start()
+        checks = 0
+        while any(thread.is_alive() for thread in threads):
+            with state.lock:
+                check_indexes(self, state)
+            checks += 1
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+        self.assertGreater(checks, 0)
+        check_indexes(self, state)
+
+    def test_snapshot_restore_rebuilds_indexes(self):
+        state = ChatState()
+        mutate(state, 0, [])
+        restored = ChatState()
+        restored.restore(state.snapshot())
+        check_indexes(self, restored)
+        self.assertEqual(restored.snapshot(), state.snapshot())
+
+if __name__ == '__main__':
+    unittest.main()
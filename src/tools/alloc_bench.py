@@ -0,0 +1,93 @@
+"""Microbenchmark de alocação do caminho de envio/recepção.
+
+Compara, num par de sockets UDP locais, o caminho antigo (f.read + concatenação do
+cabeçalho + recvfrom + fatiamento) com o caminho atual (readinto em buffer reaproveitado
++ sendmsg + recvfrom_into + memoryview). Para cada pacote mede, com tracemalloc, quantos
+bytes foram alocados temporariamente e quantos pacotes alocaram um buffer do tamanho
+dos dados, e mostra os totais por megabyte transferido.
+
+Uso: python alloc_bench.py [megabytes] [tamanho_do_fragmento]
+"""
+import io
+import os
+import socket
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from common import packet
+
+MEGABYTES = 4
+CHUNK_SIZE = 1024
+MB = 1024 * 1024
+
+def copy_path(src, sender, receiver, addr, chunk_size):
+    """Um pacote pelo caminho antigo; retorna False no fim do arquivo"""
+    data = src.read(chunk_size)
+    if not data:
+        return False
+    sender.sendto(packet.encode(0, 0, data), addr)
+    datagram, _ = receiver.recvfrom(chunk_size + packet.HEADER.size)
+    packet.decode(datagram)
+    return True
+
+def make_zero_copy_path(chunk_size):
+    """Cria os buffers do caminho atual e retorna a função que envia um pacote"""
+    header = bytearray(packet.HEADER.size)
+    out = bytearray(chunk_size)
+    out_view = memoryview(out)
+    incoming = bytearray(chunk_size + packet.HEADER.size)
+
+    def zero_copy_path(src, sender, receiver, addr, chunk_size):
+        nbytes = src.readinto(out)
+        if not nbytes:
+            return False
+        packet.send(sender, header, 0, 0, out_view[:nbytes], addr)
+        packet.recv_into(receiver, incoming)
+        return True
+    return zero_copy_path
+
+def measure(step, data, chunk_size):
+    """Retorna (bytes alocados, pacotes que alocaram um buffer, segundos) por MB"""
+    sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    receiver.bind(('127.0.0.1', 0))
+    addr = receiver.getsockname()
+
+    # Tempo sem tracemalloc, que deixaria tudo mais lento
+    src = io.BytesIO(data)
+    start = time.perf_counter()
+    while step(src, sender, receiver, addr, chunk_size):
+        pass
+    elapsed = time.perf_counter() - start
+
+    src = io.BytesIO(data)
+    allocated = buffers = 0
+    tracemalloc.start()
+    while True:
+        before = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+        if not step(src, sender, receiver, addr, chunk_size):
+            break
+        delta = tracemalloc.get_traced_memory()[1] - before
+        allocated += delta
+        if delta >= chunk_size:
+            buffers += 1
+    tracemalloc.stop()
+    sender.close()
+    receiver.close()
+
+    megabytes = len(data) / MB
+    return allocated / megabytes, buffers / megabytes, elapsed / megabytes
+
+def main(megabytes=MEGABYTES, chunk_size=CHUNK_SIZE):
+    data = os.urandom(megabytes * MB)
+    print(f"{megabytes} MB em fragmentos de {chunk_size} bytes (valores por MB)")
+    print(f"{'caminho':<12}{'KB alocados':>14}{'buffers':>10}{'ms':>10}")
+    for name, step in (('cópia', copy_path), ('zero-cópia', make_zero_copy_path(chunk_size))):
+        allocated, buffers, elapsed = measure(step, data, chunk_size)
+        print(f"{name:<12}{allocated / 1024:>14.1f}{buffers:>10.0f}{elapsed * 1000:>10.1f}")
+
+if __name__ == "__main__":
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,192 @@
+"""Benchmark de ida e volta de arquivos pelos projetos 1 e 2, com saída em JSON.
+
+Para cada combinação de variante (project-1 sem confiabilidade, project-2 com GBN ou
+SR), arquivo, taxa de perda e tamanho de fragmento, roda servidor e cliente num
+processo novo (a perda vem do proxy de tools/netem_proxy.py, com semente fixa) e
+mede goodput, retransmissões, latência por pacote (p50/p99, do primeiro envio ao
+ACK) e pico de memória (RSS). O resultado vai para a saída padrão ou para --output.
+
+No project-2 o tamanho é o limite da sondagem de common.pmtu (até 65491 bytes, o maior
+datagrama UDP); o tamanho médio dos pacotes de dados enviados sai em mean_payload.
+Com --fec (por exemplo `--fec none 8:1 8:2`), cada configuração de paridade (bloco:grupos,
+common.fec) vira mais uma dimensão, com os pacotes reconstruídos em recovered: compare
+latency_p99_ms com e sem FEC sob perda.
+
+Uso: python bench_transfer.py --loss 0 0.05 --sizes 512 1024 --output resultado.json
+"""
+import argparse
+import contextlib
+import filecmp
+import json
+import os
+import platform
+import resource
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, SRC_DIR)
+
+FILES = ['teste.txt', 'teste.png', 'teste.mp3', 'teste.mp4']
+VARIANTS = ['p1', 'p2-gbn', 'p2-sr']
+LOSS_RATES = [0.0, 0.01, 0.05]
+PAYLOAD_SIZES = [512, 1024, 4096, 16384, 65491]
+FEC_SETTINGS = ['none']  # 'none' ou bloco:grupos, por exemplo 8:1
+WINDOW_SIZE = 8
+RUN_TIMEOUT = 120  # Segundos por execução antes de desistir
+SEED = 1
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def percentile(values, fraction):
+    """Percentil por posição na lista ordenada; None se não houver valores"""
+    if not values:
+        return None
+    values = sorted(values)
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+def parse_fec(value):
+    """'none' -> None; 'bloco:grupos' -> [bloco, grupos]"""
+    if value == 'none':
+        return None
+    block, groups = value.split(':')
+    return [int(block), int(groups)]
+
+def run_worker(config):
+    """Executa uma transferência neste processo e retorna as medidas"""
+    variant, filename = config['variant'], config['file']
+    project = 'project-1' if variant == 'p1' else 'project-2'
+    project_dir = os.path.join(SRC_DIR, project)
+    sys.path.insert(0, project_dir)
+    from common import metrics, rdt
+    from tools.netem_proxy import Impairments, ImpairmentProxy
+    import client
+    import server
+
+    work = tempfile.mkdtemp(prefix='bench-')
+    shutil.copy(os.path.join(project_dir, filename), work)
+    os.chdir(work)
+
+    server_port = free_port()
+    client_port = server_port
+    if variant == 'p1':
+        import raw
+        raw.BUFFER_SIZE = config['payload']
+        serve = lambda: server.main(port=server_port)
+    else:
+        mode = rdt.GBN if variant == 'p2-gbn' else rdt.SR
+        serve = lambda: server.main(config['window'], mode, port=server_port)
+    if config['loss']:
+        proxy = ImpairmentProxy(('127.0.0.1', 0), ('127.0.0.1', server_port),
+                                Impairments(loss=config['loss'], seed=config['seed']))
+        client_port = proxy.address[1]
+        threading.Thread(target=proxy.run_forever, daemon=True).start()
+    rdt.stats = rdt.SendStats()
+
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+        threading.Thread(target=serve, daemon=True).start()
+        time.sleep(0.2)
+        start = time.perf_counter()
+        if variant == 'p1':
+            saved = client.main(port=client_port, filename=filename)
+        else:
+            saved = client.main(config['window'], mode, filename=filename, port=client_port,
+                                max_payload=config['payload'], fec=config.get('fec'))
+        elapsed = time.perf_counter() - start
+
+    size = os.path.getsize(filename)
+    ok = filecmp.cmp(saved, filename, shallow=False)
+    os.chdir(SRC_DIR)
+    shutil.rmtree(work, ignore_errors=True)
+    stats = rdt.stats
+    latencies = [1000 * latency for latency in stats.latencies]
+    totals = metrics.snapshot()['totals']
+    return {
+        **config,
+        'bytes': size,
+        'seconds': round(elapsed, 4),
+        'goodput_mbps': round(2 * size * 8 / elapsed / 1e6, 3),  # Ida e volta
+        'ok': ok,
+        'packets': stats.packets if variant != 'p1' else None,  # O project-1 não confirma pacotes
+        'retransmissions': stats.retransmissions if variant != 'p1' else None,
+        'mean_payload': round(totals['bytes_out'] / totals['packets_out']) if totals['packets_out'] else None,
+        'recovered': totals['recovered'] if variant != 'p1' else None,
+        'latency_p50_ms': percentile(latencies, 0.50),
+        'latency_p99_ms': percentile(latencies, 0.99),
+        'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    }
+
+def run(config, timeout):
+    """Roda uma combinação num processo novo, para que o pico de RSS seja só dela"""
+    command = [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(config)]
+    try:
+        result = subprocess.run(command, capture_output=True, text=True, timeout=timeout)
+    except subprocess.TimeoutExpired:
+        return {**config, 'error': 'timeout'}
+    if result.returncode != 0:
+        return {**config, 'error': result.stderr.strip().splitlines()[-1:]}
+    return json.loads(result.stdout.splitlines()[-1])
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=SRC_DIR,
+                              capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de transferência de arquivos (JSON).")
+    parser.add_argument('--variants', nargs='+', default=VARIANTS, choices=VARIANTS)
+    parser.add_argument('--files', nargs='+', default=FILES)
+    parser.add_argument('--loss', nargs='+', type=float, default=LOSS_RATES)
+    parser.add_argument('--sizes', nargs='+', type=int, default=PAYLOAD_SIZES, help="bytes de dados por pacote")
+    parser.add_argument('--fec', nargs='+', type=parse_fec, default=[parse_fec(v) for v in FEC_SETTINGS],
+                        help="paridade do project-2: none ou bloco:grupos")
+    parser.add_argument('--window', type=int, default=WINDOW_SIZE)
+    parser.add_argument('--seed', type=int, default=SEED)
+    parser.add_argument('--timeout', type=float, default=RUN_TIMEOUT, help="segundos por execução")
+    parser.add_argument('--output', help="arquivo JSON (padrão: saída padrão)")
+    parser.add_argument('--worker', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return
+
+    results = []
+    for variant in args.variants:
+        for filename in args.files:
+            for loss in args.loss:
+                for payload in args.sizes:
+                    # O project-1 não tem paridade: roda uma vez só
+                    for fec in args.fec if variant != 'p1' else [None]:
+                        config = {'variant': variant, 'file': filename, 'loss': loss, 'payload': payload,
+                                  'fec': fec, 'window': args.window, 'seed': args.seed}
+                        result = run(config, args.timeout)
+                        results.append(result)
+                        status = result.get('error') or f"{result['goodput_mbps']} Mbit/s ok={result['ok']}"
+                        print(f"{variant} {filename} perda={loss} dados={payload} fec={fec}: {status}", file=sys.stderr)
+
+    report = {
+        'revision': git_revision(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
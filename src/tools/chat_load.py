@@ -0,0 +1,384 @@
+"""Gerador de carga para o servidor de chat (project-3), com saída em JSON.
+
+Simula milhares de clientes num único laço de eventos, cada um com o seu socket e o
+mesmo RDT de bit alternante do cliente real. Cada cliente faz login, segue o seu par
+(clientes 2k e 2k+1 viram amigos mútuos) e entra no grupo do seu bloco (o primeiro do
+bloco cria o grupo); depois executa ações sorteadas conforme o --mix. As mensagens de
+chat levam o instante do envio, e quem as recebe mede a latência ponta a ponta.
+
+Para cada nível de concorrência em --clients um servidor novo é iniciado, e o
+resultado traz tempo de login, latência de entrega (p50/p99), entregas perdidas,
+retransmissões, clientes que desistiram por timeout e CPU do servidor, formando a
+curva de capacidade.
+
+Com --workers N o servidor iniciado roda em N processos (SO_REUSEPORT), e a CPU do
+servidor soma a de todos eles.
+
+Uso: python chat_load.py --clients 100 500 1000 --duration 10 --rate 0.5
+"""
+import argparse
+import heapq
+import itertools
+import json
+import os
+import random
+import re
+import resource
+import selectors
+import socket
+import subprocess
+import sys
+import time
+from collections import deque
+
+SRC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, SRC_DIR)
+from common import packet, rtt
+from common.packet import FLAG_ACK
+
+BUFFER_SIZE = 65535
+CLIENT_LEVELS = [10, 50, 100, 200]
+DURATION = 10.0  # Segundos de fase de chat por nível
+RATE = 0.5  # Ações por segundo por cliente
+LOGIN_RATE = 500  # Logins por segundo
+GROUP_SIZE = 10  # Clientes por grupo
+SETUP_TIME = 3.0  # Segundos entre o último login e o início do chat
+DRAIN_TIME = 3.0  # Segundos esperando entregas atrasadas ao final
+MAX_RETRIES = 10
+MIX = {'chat_group': 5, 'chat_friend': 3, 'list:groups': 1, 'list:friends': 1}
+MARK = 'lg'  # Prefixo das mensagens de carga: "lg <enviado em>"
+
+REPORT = re.compile(r"entregue a (\d+) de (\d+) membros")
+CREATED = re.compile(r"Grupo '(\S+)' criado com sucesso. Chave: (\S+)")
+
+def percentile(values, fraction):
+    if not values:
+        return None
+    values = sorted(values)
+    return round(values[min(len(values) - 1, int(fraction * len(values)))], 3)
+
+class SimClient:
+    """Um cliente simulado: RDT de bit alternante e o roteiro do cenário"""
+
+    def __init__(self, load, index):
+        self.load = load
+        self.index = index
+        self.name = f"u{index}"
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        load.selector.register(self.sock, selectors.EVENT_READ, self)
+        self.send_seq = 0
+        self.expected_seq = 0
+        self.outbox = deque()
+        self.inflight = None
+        self.sent_at = 0.0
+        self.attempts = 0
+        self.timer = None
+        self.estimator = rtt.RttEstimator()
+        self.login_sent = None
+        self.online = False
+        self.failed = False
+        self.group = f"g{index - index % GROUP_SIZE}"
+        self.in_group = False
+        self.following = False
+
+    # RDT
+
+    def send(self, text):
+        self.outbox.append(text.encode('utf-8'))
+        if self.inflight is None:
+            self._transmit_next()
+
+    def _transmit_next(self):
+        if self.outbox and not self.failed:
+            self.inflight = packet.encode(0, self.send_seq, self.outbox.popleft())
+            self.attempts = 0
+            self._transmit()
+
+    def _transmit(self):
+        self.sock.sendto(self.inflight, self.load.server_addr)
+        self.sent_at = time.monotonic()
+        self.attempts += 1
+        self.timer = self.load.call_later(self.estimator.rto, self._on_timeout)
+
+    def _on_timeout(self, timer):
+        if timer != self.timer or self.inflight is None:
+            return
+        self.load.stats['retransmissions'] += 1
+        self.estimator.backoff()
+        if self.attempts >= MAX_RETRIES:
+            self.failed = True
+            self.load.stats['timeouts'] += 1
+            return
+        self._transmit()
+
+    def on_readable(self):
+        while True:
+            try:
+                datagram = self.sock.recv(BUFFER_SIZE)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            decoded = packet.decode(datagram)
+            if decoded is None:
+                continue
+            flags, seq_num, data = decoded
+            if flags & FLAG_ACK:
+                self._on_ack(seq_num)
+            elif seq_num == self.expected_seq:
+                self.sock.sendto(packet.ack(seq_num), self.load.server_addr)
+                self.expected_seq = 1 - seq_num
+                self.on_message(data.decode('utf-8', 'replace'))
+            else:
+                self.sock.sendto(packet.ack(1 - self.expected_seq), self.load.server_addr)
+
+    def _on_ack(self, ack_num):
+        if self.inflight is None or ack_num != self.send_seq:
+            return
+        if self.attempts == 1:
+            self.estimator.sample(time.monotonic() - self.sent_at)
+        else:
+            self.estimator.acked()
+        self.send_seq = 1 - self.send_seq
+        self.inflight = self.timer = None
+        self._transmit_next()
+
+    # Cenário
+
+    def login(self):
+        self.login_sent = time.monotonic()
+        self.send(f"login {self.name}")
+
+    def on_message(self, text):
+        load = self.load
+        now = time.monotonic()
+        if text == "Você está online!":
+            self.online = True
+            load.login_times.append(1000 * (now - self.login_sent))
+            self.setup()
+        elif text == "disconnected":
+            self.failed = True
+            load.stats['disconnected'] += 1
+        elif text.startswith('[') and f"] {MARK} " in text:
+            sent = float(text.rsplit(' ', 1)[1])
+            load.delivery_times.append(1000 * (now - sent))
+            load.stats['received'] += 1
+        elif text.startswith("Mensagem enviada para"):
+            load.stats['expected'] += 1
+        elif text.startswith("Mensagem ao grupo"):
+            match = REPORT.search(text)
+            load.stats['expected'] += int(match.group(2))
+        elif text.startswith("Grupo '"):
+            match = CREATED.match(text)
+            if match:
+                load.group_keys[match.group(1)] = match.group(2)
+                self.in_group = True
+        elif text.startswith("Você entrou no grupo") or text == "Você já está neste grupo.":
+            self.in_group = True
+        elif "adicionado à sua lista de amigos" in text or text.startswith("Você já está seguindo"):
+            self.following = True
+        elif text.startswith("Erro"):
+            load.stats['errors'] += 1
+
+    def setup(self):
+        """Cria ou entra no grupo e segue o par; repete até conseguir"""
+        if self.failed:
+            return
+        if not self.in_group:
+            if self.index % GROUP_SIZE == 0:
+                if self.group not in self.load.group_keys:
+                    self.send(f"create_group {self.group}")
+                    self.load.group_keys[self.group] = None  # Criação pedida
+            elif self.load.group_keys.get(self.group):
+                self.send(f"join {self.group} {self.load.group_keys[self.group]}")
+        partner = self.index ^ 1
+        if not self.following and partner < len(self.load.clients) and self.load.clients[partner].online:
+            self.send(f"follow u{partner}")
+        if not (self.in_group and self.following) and time.monotonic() < self.load.chat_start:
+            self.load.call_later(0.5, lambda _: self.setup())
+
+    def act(self, _timer=None):
+        load = self.load
+        if self.failed or time.monotonic() >= load.chat_end:
+            return
+        if self.online and self.inflight is None:  # Não acumula fila se o servidor atrasar
+            action = load.random.choices(load.actions, load.weights)[0]
+            stamp = f"{MARK} {time.monotonic():.6f}"
+            if action == 'chat_group' and self.in_group:
+                self.send(f"chat_group {self.group} {load.group_keys[self.group]} {stamp}")
+                load.stats['sent'] += 1
+            elif action == 'chat_friend' and self.following:
+                self.send(f"chat_friend u{self.index ^ 1} {stamp}")
+                load.stats['sent'] += 1
+            elif action.startswith('list:'):
+                self.send(action)
+        load.call_later(load.random.expovariate(load.rate), self.act)
+
+    def close(self):
+        self.load.selector.unregister(self.sock)
+        self.sock.close()
+
+class LoadRun:
+    """Laço de eventos de todos os clientes simulados de um nível"""
+
+    def __init__(self, server_addr, clients, rate, mix, seed):
+        self.server_addr = server_addr
+        self.rate = rate
+        self.actions = list(mix)
+        self.weights = list(mix.values())
+        self.random = random.Random(seed)
+        self.selector = selectors.DefaultSelector()
+        self.timers = []  # heap de (prazo, identificador, callback)
+        self._timer_ids = itertools.count()
+        self.group_keys = {}  # grupo -> chave (None enquanto a criação não é confirmada)
+        self.login_times = []
+        self.delivery_times = []
+        self.stats = dict.fromkeys(('sent', 'expected', 'received', 'retransmissions',
+                                    'timeouts', 'disconnected', 'errors'), 0)
+        self.clients = [SimClient(self, index) for index in range(clients)]
+        login_end = time.monotonic() + clients / LOGIN_RATE
+        self.chat_start = login_end + SETUP_TIME
+        self.chat_end = float('inf')
+
+    def call_later(self, delay, callback):
+        timer = next(self._timer_ids)
+        heapq.heappush(self.timers, (time.monotonic() + delay, timer, callback))
+        return timer
+
+    def run_until(self, deadline):
+        while True:
+            now = time.monotonic()
+            if now >= deadline:
+                return
+            timeout = deadline - now
+            if self.timers:
+                timeout = min(timeout, max(0.0, self.timers[0][0] - now))
+            for key, _ in self.selector.select(timeout):
+                key.data.on_readable()
+            now = time.monotonic()
+            while self.timers and self.timers[0][0] <= now:
+                _, timer, callback = heapq.heappop(self.timers)
+                callback(timer)
+
+    def run(self, duration):
+        for position, client in enumerate(self.clients):
+            self.call_later(position / LOGIN_RATE, lambda _, client=client: client.login())
+        self.run_until(self.chat_start)
+        self.chat_end = self.chat_start + duration
+        for client in self.clients:
+            self.call_later(self.random.expovariate(self.rate), client.act)
+        self.run_until(self.chat_end + DRAIN_TIME)
+        for client in self.clients:
+            client.close()
+        self.selector.close()
+
+def cpu_seconds(pid):
+    """CPU (usuário + sistema) do processo e dos seus filhos vivos, lida de /proc; None fora do Linux"""
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            children = [int(child) for child in f.read().split()]
+    except OSError:
+        return None
+    total = (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+    return total + sum(cpu_seconds(child) or 0.0 for child in children)
+
+def start_server(port, workers=1):
+    project_dir = os.path.join(SRC_DIR, 'project-3')
+    code = (f"import sys; sys.path.insert(0, {project_dir!r}); import server; "
+            f"server.PORT = {port}; server.main({workers})")
+    server = subprocess.Popen([sys.executable, '-c', code], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    time.sleep(0.5)
+    return server
+
+def run_level(clients, args):
+    server = None
+    server_pid = args.server_pid
+    host, port = args.host, args.port
+    if port is None:
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as probe:
+            probe.bind(('127.0.0.1', 0))
+            port = probe.getsockname()[1]
+        server = start_server(port, args.workers)
+        server_pid = server.pid
+
+    load = LoadRun((host, port), clients, args.rate, args.mix, args.seed)
+    cpu_before = cpu_seconds(server_pid) if server_pid else None
+    own_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.monotonic()
+    load.run(args.duration)
+    elapsed = time.monotonic() - started
+    cpu_after = cpu_seconds(server_pid) if server_pid else None
+    own_after = resource.getrusage(resource.RUSAGE_SELF)
+    if server is not None:
+        server.terminate()  # Com SIGTERM, o servidor encerra também os seus workers
+        server.wait()
+
+    stats = load.stats
+    server_cpu = None
+    if cpu_before is not None and cpu_after is not None:
+        server_cpu = round(100 * (cpu_after - cpu_before) / elapsed, 1)
+    own_cpu = (own_after.ru_utime + own_after.ru_stime) - (own_before.ru_utime + own_before.ru_stime)
+    return {
+        'clients': clients,
+        'logged_in': len(load.login_times),
+        'login_ms_p50': percentile(load.login_times, 0.50),
+        'login_ms_p99': percentile(load.login_times, 0.99),
+        'messages_sent': stats['sent'],
+        'deliveries_expected': stats['expected'],
+        'deliveries_received': stats['received'],
+        'deliveries_lost': max(0, stats['expected'] - stats['received']),
+        'delivery_ms_p50': percentile(load.delivery_times, 0.50),
+        'delivery_ms_p99': percentile(load.delivery_times, 0.99),
+        'retransmissions': stats['retransmissions'],
+        'timeouts': stats['timeouts'],
+        'disconnected': stats['disconnected'],
+        'errors': stats['errors'],
+        'server_cpu_percent': server_cpu,
+        'generator_cpu_percent': round(100 * own_cpu / elapsed, 1),
+    }
+
+def parse_mix(text):
+    """'chat_group=5,chat_friend=3' -> {'chat_group': 5.0, 'chat_friend': 3.0}"""
+    mix = {}
+    for item in text.split(','):
+        action, weight = item.split('=')
+        mix[action.strip()] = float(weight)
+    return mix
+
+def main():
+    parser = argparse.ArgumentParser(description="Gerador de carga para o chat (project-3).")
+    parser.add_argument('--clients', nargs='+', type=int, default=CLIENT_LEVELS, help="níveis de concorrência")
+    parser.add_argument('--duration', type=float, default=DURATION, help="segundos de chat por nível")
+    parser.add_argument('--rate', type=float, default=RATE, help="ações por segundo por cliente")
+    parser.add_argument('--mix', type=parse_mix, default=MIX,
+                        help="pesos das ações, ex.: chat_group=5,chat_friend=3,list:groups=1")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--workers', type=int, default=1, help="processos do servidor iniciado (SO_REUSEPORT)")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=None, help="servidor já em execução (senão um é iniciado por nível)")
+    parser.add_argument('--server-pid', type=int, default=None, help="pid do servidor externo, para medir CPU")
+    parser.add_argument('--output', help="arquivo JSON (padrão: saída padrão)")
+    args = parser.parse_args()
+
+    # Cada cliente simulado usa um descritor de arquivo
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+
+    levels = []
+    for clients in args.clients:
+        result = run_level(clients, args)
+        levels.append(result)
+        print(f"{clients} clientes: login p50={result['login_ms_p50']}ms, entrega p50={result['delivery_ms_p50']}ms "
+              f"p99={result['delivery_ms_p99']}ms, perdidas={result['deliveries_lost']}, "
+              f"timeouts={result['timeouts']}, CPU do servidor={result['server_cpu_percent']}%", file=sys.stderr)
+
+    report = {'duration': args.duration, 'rate': args.rate, 'mix': args.mix, 'workers': args.workers, 'levels': levels}
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+"""Proxy UDP local que simula um canal ruim entre cliente e servidor.
+
+Fica entre as duas pontas (o cliente aponta para a porta do proxy) e aplica, nos dois
+sentidos, perda, atraso com variação (jitter), reordenação, duplicação, corrupção de
+bytes e limite de banda com fila finita. Todas as decisões vêm de um gerador com
+semente, então a mesma configuração reproduz as mesmas condições. Cada cliente ganha
+um socket próprio do lado do servidor, que continua vendo endereços distintos.
+
+Uso: python netem_proxy.py --listen 1045 --upstream 1044 --loss 0.1 --latency 0.02
+"""
+import argparse
+import heapq
+import itertools
+import random
+import selectors
+import socket
+import time
+
+BUFFER_SIZE = 65535
+QUEUE_LIMIT = 256 * 1024  # Bytes aguardando na fila do enlace antes do descarte
+
+class Impairments:
+    """Parâmetros do canal; probabilidades entre 0 e 1, tempos em segundos"""
+
+    def __init__(self, loss=0.0, latency=0.0, jitter=0.0, reorder=0.0, reorder_delay=0.05,
+                 duplicate=0.0, corrupt=0.0, bandwidth=None, queue_limit=QUEUE_LIMIT, seed=None):
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.reorder = reorder  # Probabilidade de segurar o pacote por reorder_delay a mais
+        self.reorder_delay = reorder_delay
+        self.duplicate = duplicate
+        self.corrupt = corrupt  # Probabilidade de trocar um byte do pacote
+        self.bandwidth = bandwidth  # Bytes/s por sentido; None para ilimitado
+        self.queue_limit = queue_limit
+        self.seed = seed
+
+class Link:
+    """Um sentido do canal: fila serializada pela banda e contadores"""
+
+    def __init__(self, name):
+        self.name = name
+        self.free_at = 0.0  # Instante em que o enlace termina de transmitir a fila
+        self.stats = dict.fromkeys(('recebidos', 'entregues', 'perdidos', 'fila cheia',
+                                    'duplicados', 'corrompidos', 'reordenados'), 0)
+
+class ImpairmentProxy:
+    """Laço de eventos do proxy: recebe, decide o destino de cada pacote e o agenda"""
+
+    def __init__(self, listen_addr, upstream_addr, impairments=None):
+        self.impairments = impairments or Impairments()
+        self.random = random.Random(self.impairments.seed)
+        self.upstream_addr = upstream_addr
+        self.listen = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.listen.bind(listen_addr)
+        self.listen.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.listen, selectors.EVENT_READ, None)
+        self.upstreams = {}  # endereço do cliente -> socket do lado do servidor
+        self.pending = []  # heap de (instante de entrega, ordem, socket, dados, destino)
+        self._order = itertools.count()
+        self.to_server = Link('cliente -> servidor')
+        self.to_client = Link('servidor -> cliente')
+
+    @property
+    def address(self):
+        return self.listen.getsockname()
+
+    def run_forever(self):
+        while True:
+            self.run_once()
+
+    def run_once(self):
+        timeout = None
+        if self.pending:
+            timeout = max(0.0, self.pending[0][0] - time.monotonic())
+        for key, _ in self.selector.select(timeout):
+            self._read(key.fileobj, key.data)
+        self._deliver_due()
+
+    def close(self):
+        for sock in [self.listen, *self.upstreams.values()]:
+            self.selector.unregister(sock)
+            sock.close()
+        self.selector.close()
+
+    def report(self):
+        for link in (self.to_server, self.to_client):
+            counts = ', '.join(f"{name}={count}" for name, count in link.stats.items())
+            print(f"[Proxy] {link.name}: {counts}")
+
+    def _read(self, sock, client_addr):
+        while True:
+            try:
+                data, addr = sock.recvfrom(BUFFER_SIZE)
+            except (BlockingIOError, ConnectionRefusedError):
+                return
+            if client_addr is None:
+                # Do cliente para o servidor, pelo socket exclusivo desse cliente
+                self._schedule(self.to_server, self._upstream_for(addr), data, self.upstream_addr)
+            else:
+                self._schedule(self.to_client, self.listen, data, client_addr)
+
+    def _upstream_for(self, client_addr):
+        upstream = self.upstreams.get(client_addr)
+        if upstream is None:
+            upstream = self.upstreams[client_addr] = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+            upstream.setblocking(False)
+            self.selector.register(upstream, selectors.EVENT_READ, client_addr)
+        return upstream
+
+    def _schedule(self, link, sock, data, dest):
+        imp = self.impairments
+        rng = self.random
+        link.stats['recebidos'] += 1
+        if rng.random() < imp.loss:
+            link.stats['perdidos'] += 1
+            return
+
+        now = time.monotonic()
+        departure = now
+        if imp.bandwidth:
+            start = max(now, link.free_at)
+            if (start - now) * imp.bandwidth > imp.queue_limit:
+                link.stats['fila cheia'] += 1
+                return
+            departure = link.free_at = start + len(data) / imp.bandwidth
+
+        if rng.random() < imp.corrupt:
+            data = bytearray(data)
+            data[rng.randrange(len(data))] ^= rng.randrange(1, 256)
+            link.stats['corrompidos'] += 1
+
+        copies = 2 if rng.random() < imp.duplicate else 1
+        link.stats['duplicados'] += copies - 1
+        for _ in range(copies):
+            delay = imp.latency + rng.uniform(-imp.jitter, imp.jitter)
+            if rng.random() < imp.reorder:
+                delay += imp.reorder_delay
+                link.stats['reordenados'] += 1
+            heapq.heappush(self.pending, (departure + max(0.0, delay), next(self._order), sock, data, dest))
+
+    def _deliver_due(self):
+        now = time.monotonic()
+        while self.pending and self.pending[0][0] <= now:
+            _, _, sock, data, dest = heapq.heappop(self.pending)
+            link = self.to_server if sock is not self.listen else self.to_client
+            try:
+                sock.sendto(data, dest)
+            except OSError:
+                continue
+            link.stats['entregues'] += 1
+
+def main():
+    parser = argparse.ArgumentParser(description="Proxy UDP com perda, atraso, reordenação, duplicação, corrupção e limite de banda.")
+    parser.add_argument('--listen', type=int, default=1045, help="porta onde os clientes se conectam")
+    parser.add_argument('--upstream', type=int, default=1044, help="porta do servidor")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--loss', type=float, default=0.0, help="probabilidade de perda")
+    parser.add_argument('--latency', type=float, default=0.0, help="atraso em segundos")
+    parser.add_argument('--jitter', type=float, default=0.0, help="variação máxima do atraso (s)")
+    parser.add_argument('--reorder', type=float, default=0.0, help="probabilidade de atrasar um pacote além dos seguintes")
+    parser.add_argument('--reorder-delay', type=float, default=0.05, help="atraso extra dos pacotes reordenados (s)")
+    parser.add_argument('--duplicate', type=float, default=0.0, help="probabilidade de duplicar")
+    parser.add_argument('--corrupt', type=float, default=0.0, help="probabilidade de corromper um byte")
+    parser.add_argument('--bandwidth', type=float, default=None, help="banda por sentido em bytes/s")
+    parser.add_argument('--queue', type=int, default=QUEUE_LIMIT, help="tamanho da fila do enlace em bytes")
+    parser.add_argument('--seed', type=int, default=None, help="semente para reproduzir as condições")
+    args = parser.parse_args()
+
+    impairments = Impairments(args.loss, args.latency, args.jitter, args.reorder, args.reorder_delay,
+                              args.duplicate, args.corrupt, args.bandwidth, args.queue, args.seed)
+    proxy = ImpairmentProxy((args.host, args.listen), (args.host, args.upstream), impairments)
+    print(f"[Proxy] {args.host}:{args.listen} -> {args.host}:{args.upstream}")
+    try:
+        proxy.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        proxy.report()
+        proxy.close()
+
+if __name__ == "__main__":
+    main()